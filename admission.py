@@ -0,0 +1,105 @@
+"""
+Admission control for LTI requests, so that a single consumer key can't take
+all the verification work, whether it's a misbehaving tool consumer or a
+flood of forged launches using a real key.
+
+    limiter = TokenBucketLimiter(rate=20, burst=100)
+    parser = Parser(..., limiter=limiter)
+
+Requests over their key's limit are rejected with Outcome.THROTTLED as soon as
+the key is known to exist, before the base string is built and the signature
+calculated.
+"""
+from collections import OrderedDict
+import threading
+import time
+
+class TokenBucketLimiter:
+    '''
+    Keeps a token bucket per consumer key. Each request takes a token from its
+    key's bucket and is throttled if the bucket is empty. Buckets refill at
+    rate tokens per second, up to burst tokens.
+
+    Buckets are split between stripes, each with its own lock, so that
+    threads verifying requests for different keys rarely wait on each other.
+    A stripe holds at most capacity / stripes buckets, when it's full the
+    least recently used bucket is dropped. A dropped key starts again with a
+    full bucket, so capacity should be well above the number of active keys.
+
+    rate, burst - the limit for keys without one set by set_limit
+    capacity - max number of keys tracked
+    stripes - number of locks
+    '''
+    def __init__(self, rate, burst, capacity=10000, stripes=64):
+        self.rate = rate
+        self.burst = burst
+        # key to (rate, burst), for keys with their own limit
+        self._limits = {}
+        self._stripe_size = max(1, capacity // stripes)
+        # key to [tokens, last refill time, throttled count] in each stripe
+        self._stripes = [OrderedDict() for i in range(stripes)]
+        self._locks = [threading.Lock() for i in range(stripes)]
+        # throttled counts of the buckets dropped from each stripe
+        self._dropped_throttled = [0] * stripes
+
+    def set_limit(self, key, rate, burst):
+        '''
+        Give key its own limit instead of the default one.
+        '''
+        self._limits[key] = (rate, burst)
+
+    def admit(self, key):
+        '''
+        Returns True if a request for key may be verified, False if it's
+        throttled.
+        '''
+        rate, burst = self._limits.get(key, (self.rate, self.burst))
+        index = hash(key) % len(self._stripes)
+        buckets = self._stripes[index]
+        now = time.monotonic()
+        with self._locks[index]:
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = [burst, now, 0]
+                buckets[key] = bucket
+                if len(buckets) > self._stripe_size:
+                    dropped_key, dropped = buckets.popitem(last=False)
+                    self._dropped_throttled[index] += dropped[2]
+            else:
+                buckets.move_to_end(key)
+                # another thread may have refilled it with a later time
+                elapsed = now - bucket[1]
+                if elapsed > 0:
+                    bucket[0] = min(burst, bucket[0] + elapsed * rate)
+                    bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return True
+            bucket[2] += 1
+            return False
+
+    def get_throttled_counts(self):
+        '''
+        Returns a dict of the keys still being tracked to the number of their
+        requests that were throttled, keys that were never throttled are left
+        out.
+        '''
+        counts = {}
+        for lock, buckets in zip(self._locks, self._stripes):
+            with lock:
+                for key, bucket in buckets.items():
+                    if bucket[2]:
+                        counts[key] = bucket[2]
+        return counts
+
+    def get_throttled_total(self):
+        '''
+        Returns the number of requests throttled, for all keys including
+        those no longer tracked.
+        '''
+        total = 0
+        for index, lock in enumerate(self._locks):
+            with lock:
+                total += self._dropped_throttled[index] + sum(
+                    bucket[2] for bucket in self._stripes[index].values())
+        return total
@@ -0,0 +1,139 @@
+"""
+Asyncio support for verifying LTI requests when the OAuth secrets come from an
+asynchronous data source, such as a database driver running on the event
+loop.
+
+Use through Parser.verify_signature_async with an AsyncOAuthStore:
+    valid = await parser.verify_signature_async()
+"""
+import asyncio
+
+from instrumentation import Stage
+from oauth_store import DERIVED_CACHE_TTL, DerivedCacheMixin
+from parser import SignatureVerificationError, _build_base_string, \
+    _check_oauth_params, _get_base_string_prefix, _get_header_params, \
+    _get_locate_outcome, _get_prepared_key_cache_key, _locate_oauth_params, \
+    _make_signing_key, _signature_methods, _start_timer
+
+# requests whose params add up to at least this many characters have their
+# signature checked in an executor, so that very large requests don't hold up
+# the event loop
+HMAC_EXECUTOR_THRESHOLD = 16384
+
+class AsyncOAuthStore(DerivedCacheMixin):
+    '''
+    Base class for OAuth data storage with awaitable lookups.
+
+    Same contract as oauth_store.OAuthStore, except that get_secret and
+    has_key are coroutines. A simple in memory dict implementation is
+    provided, more complex implementations should inherit from this class and
+    override appropriate methods.
+    '''
+    def __init__(self):
+        '''
+        Inherited classes don't have to call this constructor. This is only
+        for the in memory dict implementation.
+        '''
+        self.secrets = {}
+        self.derived_cache_ttl = DERIVED_CACHE_TTL
+
+    def set_secret(self, key, secret):
+        '''
+        Save a key and secret pair into the database.
+        '''
+        self.secrets[key] = secret
+        self.secret_changed(key)
+
+    async def get_secret(self, key):
+        '''
+        Given a key, return the associated secret. If the key is unfamiliar,
+        then just return an empty string.
+        '''
+        return self.secrets.get(key, "")
+
+    async def get_secrets(self, key):
+        '''
+        Given a key, return a list of the secrets a request signed with the key
+        may use, see OAuthStore.get_secrets. The in memory implementation only
+        has one secret per key.
+        '''
+        return [await self.get_secret(key)]
+
+    async def has_key(self, key):
+        '''
+        Returns true if we know key exists, false otherwise.
+        '''
+        return key in self.secrets
+
+async def _get_prepared_keys_async(oauth_store, method, client_key,
+        token_key):
+    '''
+    Async version of parser._get_prepared_keys, the client and token secrets
+    are fetched concurrently on a cache miss.
+    '''
+    cache = oauth_store.get_derived_cache()
+    cache_key = _get_prepared_key_cache_key(method, client_key, token_key)
+    prepared_keys = None
+    if cache is not None:
+        prepared_keys = cache.get(cache_key)
+    if prepared_keys is None:
+        unknown_keys = oauth_store.get_unknown_key_cache()
+        if unknown_keys is not None and client_key in unknown_keys:
+            return None
+        if not await oauth_store.has_key(client_key):
+            if unknown_keys is not None:
+                unknown_keys.set(client_key, True)
+            return None
+        client_secrets, token_secret = await asyncio.gather(
+            oauth_store.get_secrets(client_key),
+            oauth_store.get_secret(token_key))
+        prepared_keys = [method.prepare(_make_signing_key(client_secret,
+            token_secret)) for client_secret in client_secrets]
+        if cache is not None:
+            cache.set(cache_key, prepared_keys)
+    return prepared_keys
+
+def _get_params_size(parser):
+    '''
+    Returns the number of characters in the request's params, about the
+    length of its signature base string, without building it.
+    '''
+    # values that aren't strings are signed as str(value), see _percent_encode
+    return sum(len(str(name)) + len(str(value)) for params in
+        [parser.get_params, parser.post_params] for name, value in
+        params.items())
+
+async def verify_signature_async(parser, executor=None, hmac_threshold=None):
+    '''
+    Check that the OAuth signature of the request in parser is valid, see
+    Parser.verify_signature_async. Only the secret lookup is asynchronous,
+    the rest are the same checks as parser._verify_oauth_params.
+    '''
+    if hmac_threshold is None:
+        hmac_threshold = HMAC_EXECUTOR_THRESHOLD
+    parser._reset_result()
+    try:
+        oauth_params = _locate_oauth_params(parser.http_headers,
+            parser.get_params, parser.post_params)
+    except SignatureVerificationError:
+        parser.rejection_reason = _get_locate_outcome(parser.http_headers,
+            parser.get_params, parser.post_params)
+        raise
+    timer = _start_timer()
+    method = _signature_methods[oauth_params.oauth_signature_method]
+    prepared_keys = await _get_prepared_keys_async(parser.oauth_store, method,
+        oauth_params.get_client_key(), oauth_params.get_token_key())
+    if timer: timer.stage(Stage.SECRET_LOOKUP)
+    prefix = _get_base_string_prefix(parser.method, parser.url)
+    make_base_string = lambda: _build_base_string(prefix, parser.get_params,
+        parser.post_params, _get_header_params(oauth_params))
+    args = (oauth_params, prepared_keys, parser.replay_guard,
+        make_base_string, None, parser.limiter, timer)
+    if prepared_keys is not None and \
+            _get_params_size(parser) >= hmac_threshold:
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(executor, _check_oauth_params,
+            *args)
+    else:
+        result = _check_oauth_params(*args)
+    return parser._set_result(result)
@@ -0,0 +1,147 @@
+"""
+Verify the OAuth signatures of many LTI requests at once, e.g. for replaying
+queued grade passback callbacks or auditing archived launches.
+
+Requests are given as (request_id, request) pairs, where request is a dict
+with the same structure as the test data:
+{
+    "method": "POST",
+    "url": "http://example.com/some/path",
+    "http_headers": {},
+    "get_params": {},
+    "post_params": {}
+}
+"""
+from itertools import islice
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+
+from cache import LRUCache
+from instrumentation import Outcome
+from parser import LTIParserError, OAuthParams, SignatureVerificationError, \
+    _build_base_string, _get_base_string_prefix, _get_header_params, \
+    _get_locate_outcome, _get_signing_keys, _is_well_formed, \
+    _match_signature, _signature_methods
+
+# how many tasks to queue per worker at a time, bounds the number of requests
+# held in memory when verifying very large batches
+_TASKS_PER_WORKER = 64
+
+# keys prepared by each worker process, by method and signing key, so that a
+# key is prepared once rather than for every request signed with it. Thread
+# workers share the one in the main process.
+_prepared_keys = LRUCache(1024)
+
+def _get_prepared_key(method, signing_key):
+    '''
+    Returns signing_key prepared by method, see SignatureMethod.prepare.
+    '''
+    cache_key = (method, signing_key)
+    prepared_key = _prepared_keys.get(cache_key)
+    if prepared_key is None:
+        prepared_key = method.prepare(signing_key)
+        _prepared_keys.set(cache_key, prepared_key)
+    return prepared_key
+
+def _make_task(request_id, request, oauth_store, signing_keys):
+    '''
+    Does the parts of the verification that need the OAuth store, so that the
+    workers don't have to access it. Signing keys are looked up once per
+    consumer/token key pair for the whole batch.
+
+    Requests rejected by the checks done before the base string is built,
+    see parser._verify_oauth_params, get a task that's just
+    (request_id, error, rejection_reason).
+    '''
+    try:
+        oauth_params = OAuthParams(request['http_headers'],
+            request['get_params'], request['post_params'])
+        key_pair = (oauth_params.get_client_key(),
+            oauth_params.get_token_key())
+        if key_pair not in signing_keys:
+            if oauth_store.has_key(key_pair[0]):
+                signing_keys[key_pair] = _get_signing_keys(oauth_store,
+                    *key_pair)
+            else:
+                signing_keys[key_pair] = None
+        candidate_keys = signing_keys[key_pair]
+        if candidate_keys is None:
+            return (request_id, None, Outcome.UNKNOWN_CONSUMER_KEY)
+        method = _signature_methods[oauth_params.oauth_signature_method]
+        if not _is_well_formed(method, oauth_params):
+            return (request_id, None, Outcome.MALFORMED_SIGNATURE)
+        prefix = _get_base_string_prefix(request['method'], request['url'])
+    except SignatureVerificationError as e:
+        return (request_id, e, _get_locate_outcome(request['http_headers'],
+            request['get_params'], request['post_params']))
+    except LTIParserError as e:
+        return (request_id, e, None)
+    return (request_id, None, None, prefix, request['get_params'],
+        request['post_params'], _get_header_params(oauth_params),
+        method.name, candidate_keys, oauth_params.get_signature())
+
+def _run_task(task):
+    '''
+    Worker side of the verification, returns
+    (request_id, ok, error, rejection_reason).
+    '''
+    request_id, error, rejection_reason = task[:3]
+    if len(task) == 3:
+        return (request_id, False, error, rejection_reason)
+    prefix, get_params, post_params, header_params, method_name, \
+        candidate_keys, expected_sig = task[3:]
+    basestr = _build_base_string(prefix, get_params, post_params,
+        header_params)
+    # methods are passed by name, process workers look them up in the
+    # registry they inherited
+    method = _signature_methods[method_name]
+    prepared_keys = [_get_prepared_key(method, signing_key)
+        for signing_key in candidate_keys]
+    if _match_signature(method, prepared_keys, basestr,
+            expected_sig) is None:
+        return (request_id, False, None, Outcome.SIGNATURE_MISMATCH)
+    return (request_id, True, None, None)
+
+def verify_many(requests, oauth_store, workers=None, executor='thread',
+        ordered=True):
+    '''
+    Verify the signatures of an iterable of (request_id, request) pairs.
+
+    Generates (request_id, ok, error, rejection_reason) tuples as results
+    become available. ok is True if the signature is valid. error is the
+    LTIParserError raised for the request, or None if the request could be
+    checked. rejection_reason is an instrumentation.Outcome, None if the
+    signature is valid, like Parser.rejection_reason. There's no replay
+    guard or limiter, so the other outcomes are SIGNATURE_MISMATCH,
+    MISSING_OAUTH_FIELDS, UNSUPPORTED_METHOD, UNKNOWN_CONSUMER_KEY and
+    MALFORMED_SIGNATURE.
+
+    workers - number of threads/processes to use, defaults to the cpu count
+    executor - 'thread' or 'process'
+    ordered - if True, results are generated in the same order as requests,
+        otherwise in order of completion
+    '''
+    if executor == 'thread':
+        pool = ThreadPool(workers)
+    elif executor == 'process':
+        pool = multiprocessing.Pool(workers)
+    else:
+        raise ValueError("Unknown executor '%s'" % executor)
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    run = pool.imap if ordered else pool.imap_unordered
+    window = workers * _TASKS_PER_WORKER
+    signing_keys = {}
+    requests = iter(requests)
+    try:
+        while True:
+            tasks = [_make_task(request_id, request, oauth_store, signing_keys)
+                for request_id, request in islice(requests, window)]
+            if not tasks:
+                break
+            for result in run(_run_task, tasks, _TASKS_PER_WORKER // 4):
+                yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
@@ -0,0 +1,104 @@
+"""
+Benchmarks how tenants sharing a verifier fare when one of them floods it,
+with and without a TokenBucketLimiter. The flooding tenant sends forged
+launches at more than the verifier can check, the other tenants each send
+valid launches at a steady rate. Without a limiter the forged launches take
+most of the verification work and the other tenants' launches wait behind
+them, with one the flood is throttled before its signatures are calculated.
+
+Run from the repository root:
+    PYTHONPATH=. python benchmarks/bench_admission.py [flood_rate] [rate]
+"""
+import sys
+import threading
+import time
+
+from admission import TokenBucketLimiter
+from instrumentation import Outcome
+from launch_generator import generate_launch
+from oauth_store import OAuthStore
+from parser import Parser
+from signer import Signer
+
+# tenant 0 floods, the rest send TENANT_RATE launches per second each
+TENANTS = 10
+TENANT_RATE = 50
+DURATION = 2.0
+
+def _get_launches(oauth_store):
+    '''
+    Returns the launch and the post params sent by each tenant.
+    '''
+    launch = generate_launch(num_params=40)
+    params = {name: value for name, value in launch['post_params'].items()
+        if not name.startswith('oauth_')}
+    tenant_params = []
+    for tenant in range(TENANTS):
+        key = 'tenant%d' % tenant
+        oauth_store.set_secret(key, 'secret%d' % tenant)
+        post_params = dict(params)
+        post_params.update(Signer(key, 'secret%d' % tenant).sign(
+            launch['method'], launch['url'], params))
+        if tenant == 0: # forged
+            post_params['oauth_signature'] = 'A' * 27 + '='
+        tenant_params.append(post_params)
+    return launch, tenant_params
+
+def _run(launch, tenant_params, oauth_store, limiter, flood_rate):
+    '''
+    Returns a dict of tenant to (latencies, throttled count) after DURATION
+    seconds.
+    '''
+    results = {tenant: ([], [0]) for tenant in range(TENANTS)}
+    deadline = time.time() + DURATION
+    def verify(tenant):
+        started = time.perf_counter()
+        parser = Parser(launch['method'], launch['url'], {}, {},
+            tenant_params[tenant], oauth_store, limiter=limiter)
+        parser.verify_signature()
+        latencies, throttled = results[tenant]
+        latencies.append(time.perf_counter() - started)
+        if parser.rejection_reason == Outcome.THROTTLED:
+            throttled[0] += 1
+    def send(tenant, rate):
+        # launches are sent as fast as they can be checked when behind
+        due = time.perf_counter()
+        while time.time() < deadline:
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            verify(tenant)
+            due += 1.0 / rate
+    threads = [threading.Thread(target=send, args=(0, flood_rate))]
+    threads += [threading.Thread(target=send, args=(tenant, TENANT_RATE))
+        for tenant in range(1, TENANTS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def main():
+    flood_rate = float(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    rate = float(sys.argv[2]) if len(sys.argv) > 2 else 100
+    oauth_store = OAuthStore()
+    launch, tenant_params = _get_launches(oauth_store)
+    print("%-8s %-9s %9s %11s %11s %9s" % ("limiter", "tenants", "sent/s",
+        "checked/s", "throttled/s", "p99 ms"))
+    for name, limiter in [('none', None),
+            ('%g/s' % rate, TokenBucketLimiter(rate, rate))]:
+        results = _run(launch, tenant_params, oauth_store, limiter,
+            flood_rate)
+        for label, tenants in [('flooding', [0]),
+                ('others', range(1, TENANTS))]:
+            latencies = sorted(latency for tenant in tenants
+                for latency in results[tenant][0])
+            throttled = sum(results[tenant][1][0] for tenant in tenants)
+            p99 = latencies[int(len(latencies) * 0.99)] if latencies else 0
+            print("%-8s %-9s %9.0f %11.0f %11.0f %9.2f" % (name, label,
+                len(latencies) / DURATION,
+                (len(latencies) - throttled) / DURATION,
+                throttled / DURATION, p99 * 1000))
+
+if __name__ == '__main__':
+    main()
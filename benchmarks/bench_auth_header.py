@@ -0,0 +1,39 @@
+"""
+Compares parsing the OAuth Authorization header with the urllib2 (now
+urllib.request) based parse chain against the single pass tokenizer in parser._parse_auth_header, using
+the header based examples in tests/oauth_data.py.
+
+Run from the repository root:
+    PYTHONPATH=. python benchmarks/bench_auth_header.py [iterations]
+"""
+import sys
+import timeit
+from urllib.parse import unquote
+from urllib.request import parse_http_list, parse_keqv_list
+
+from parser import _parse_auth_header
+from tests import oauth_data
+
+def _parse_auth_header_urllib2(http_headers):
+    '''
+    The Authorization header parsing that _parse_auth_header replaced.
+    '''
+    auth_params = parse_http_list(http_headers["Authorization"])
+    auth_params = parse_keqv_list(auth_params)
+    return { unquote(key) : unquote(val)
+            for key, val in auth_params.items() }
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    print("%-18s %12s %12s" % ("example", "urllib2 us", "single us"))
+    for name in ['basic_example', 'non_ascii_example', 'rfc_example']:
+        http_headers = getattr(oauth_data, name)['http_headers']
+        times = []
+        for parse in [_parse_auth_header_urllib2, _parse_auth_header]:
+            elapsed = timeit.timeit(lambda: parse(http_headers),
+                number=iterations)
+            times.append(elapsed / iterations * 1000000)
+        print("%-18s %12.2f %12.2f" % (name, times[0], times[1]))
+
+if __name__ == '__main__':
+    main()
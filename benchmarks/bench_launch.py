@@ -0,0 +1,132 @@
+"""
+Benchmarks every stage of LTI launch verification on synthetic launches.
+
+Run from the repository root:
+    PYTHONPATH=. python benchmarks/bench_launch.py [--output results.json]
+        [--compare baseline.json] [--threshold 0.1] [--quick]
+
+Timings are the best of several repeats, in microseconds per call. With
+--output, results are also written as JSON. With --compare, results are
+checked against a previous --output file and the exit status is 1 if any
+stage got slower by more than the threshold.
+"""
+import argparse
+import json
+import platform
+import sys
+import timeit
+
+from launch_generator import generate_launch
+from oauth_store import OAuthStore
+from parser import OAuthParams, Parser, _build_base_string, \
+    _get_base_string_prefix, _get_header_params, _percent_encode, \
+    oauth_validator
+
+# name: generate_launch arguments
+SCENARIOS = [
+    ('small', dict(num_params=5)),
+    ('typical', dict(num_params=40)),
+    ('many_params', dict(num_params=400)),
+    ('large_values', dict(num_params=40, value_size=1024)),
+    ('non_ascii', dict(num_params=40, non_ascii=True)),
+    ('in_header', dict(num_params=40, in_header=True)),
+]
+
+def _get_stages(launch):
+    '''
+    Returns (name, function) pairs, one for each stage to time.
+    '''
+    oauth_store = OAuthStore()
+    for key, secret in launch['secrets'].items():
+        oauth_store.set_secret(key, secret)
+    http_headers = launch['http_headers']
+    get_params = launch['get_params']
+    post_params = launch['post_params']
+    oauth_params = OAuthParams(http_headers, get_params, post_params)
+    oauth_fields = oauth_params.get()
+    values = post_params.values()
+    prefix = _get_base_string_prefix(launch['method'], launch['url'])
+    header_params = _get_header_params(oauth_params)
+    parser = Parser(launch['method'], launch['url'], http_headers, get_params,
+        post_params, oauth_store)
+    assert parser.verify_signature(), "generated launch failed to verify"
+    def percent_encode():
+        for val in values:
+            _percent_encode(val)
+    return [
+        ('oauth_params', lambda: OAuthParams(http_headers, get_params,
+            post_params)),
+        ('validate', lambda: oauth_validator.validate(dict(oauth_fields))),
+        ('percent_encode', percent_encode),
+        ('base_string', lambda: _build_base_string(prefix, get_params,
+            post_params, header_params)),
+        ('verify_signature', parser.verify_signature),
+    ]
+
+def run(repeat, number):
+    '''
+    Returns a dict of 'scenario.stage' names to microseconds per call.
+    '''
+    results = {}
+    for scenario, kwargs in SCENARIOS:
+        launch = generate_launch(**kwargs)
+        for stage, func in _get_stages(launch):
+            best = min(timeit.repeat(func, repeat=repeat, number=number))
+            results[scenario + '.' + stage] = best / number * 1000000
+    return results
+
+def compare(results, baseline, threshold):
+    '''
+    Prints how results changed from baseline, returns the names that got
+    slower by more than threshold.
+    '''
+    regressions = []
+    print("%-32s %12s %12s %8s" % ("stage", "baseline us", "current us",
+        "change"))
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        change = results[name] / baseline[name] - 1
+        flag = ''
+        if change > threshold:
+            regressions.append(name)
+            flag = ' SLOWER'
+        print("%-32s %12.2f %12.2f %+7.1f%%%s" % (name, baseline[name],
+            results[name], change * 100, flag))
+    return regressions
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Benchmark LTI launch verification.")
+    arg_parser.add_argument('--output', help="write results to this file")
+    arg_parser.add_argument('--compare',
+        help="compare against results in this file")
+    arg_parser.add_argument('--threshold', type=float, default=0.1,
+        help="relative slowdown counted as a regression, default 0.1")
+    arg_parser.add_argument('--quick', action='store_true',
+        help="fewer iterations, for a quick check")
+    args = arg_parser.parse_args()
+
+    if args.quick:
+        results = run(repeat=3, number=50)
+    else:
+        results = run(repeat=5, number=500)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'results': results
+            }, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+    else:
+        print("%-32s %12s" % ("stage", "us per call"))
+        for name in sorted(results):
+            print("%-32s %12.2f" % (name, results[name]))
+
+if __name__ == '__main__':
+    main()
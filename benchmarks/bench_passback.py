@@ -0,0 +1,72 @@
+"""
+Throughput of signing bulk LTI Basic Outcomes grade passback requests, and of
+hashing large bodies for oauth_body_hash a chunk at a time.
+
+Run from the repository root:
+    PYTHONPATH=. python benchmarks/bench_passback.py [num_grades]
+"""
+from io import BytesIO
+import sys
+import time
+
+from signer import Signer, make_body_hash
+
+URL = 'http://lms.example.com/webapps/osc-BasicLTI-BBLEARN/service'
+CONSUMER_KEY = 'benchmark_key'
+SECRET = 'benchmark_secret'
+
+_REPLACE_RESULT = '''<?xml version="1.0" encoding="UTF-8"?>
+<imsx_POXEnvelopeRequest xmlns="http://www.imsglobal.org/services/ltiv1p1/xsd/imsoms_v1p0">
+  <imsx_POXHeader>
+    <imsx_POXRequestHeaderInfo>
+      <imsx_version>V1.0</imsx_version>
+      <imsx_messageIdentifier>%(message_id)s</imsx_messageIdentifier>
+    </imsx_POXRequestHeaderInfo>
+  </imsx_POXHeader>
+  <imsx_POXBody>
+    <replaceResultRequest>
+      <resultRecord>
+        <sourcedGUID><sourcedId>%(sourced_id)s</sourcedId></sourcedGUID>
+        <result><resultScore><language>en</language>
+          <textString>%(score)s</textString></resultScore></result>
+      </resultRecord>
+    </replaceResultRequest>
+  </imsx_POXBody>
+</imsx_POXEnvelopeRequest>'''
+
+def _make_bodies(num_grades):
+    return [(_REPLACE_RESULT % {
+        'message_id': i,
+        'sourced_id': 'course_%d:user_%d' % (i % 10, i),
+        'score': (i % 101) / 100.0
+    }).encode('utf-8') for i in range(num_grades)]
+
+def _run(func, bodies):
+    start = time.time()
+    for body in bodies:
+        func(body)
+    return len(bodies) / (time.time() - start)
+
+def main():
+    num_grades = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    bodies = _make_bodies(num_grades)
+    signer = Signer(CONSUMER_KEY, SECRET)
+    def reused_signer(body):
+        signer.get_authorization_header('POST', URL,
+            body_hash=make_body_hash(body))
+    def new_signer(body):
+        Signer(CONSUMER_KEY, SECRET).get_authorization_header('POST', URL,
+            body_hash=make_body_hash(body))
+    print("%-24s %12s" % ("passback", "grades/s"))
+    print("%-24s %12.0f" % ("signer per request", _run(new_signer, bodies)))
+    print("%-24s %12.0f" % ("reused signer", _run(reused_signer, bodies)))
+
+    size = 64 * 1024 * 1024
+    body = BytesIO(b'x' * size)
+    start = time.time()
+    make_body_hash(body)
+    print("%-24s %12.0f" % ("body hash MB/s", size / 1048576.0 /
+        (time.time() - start)))
+
+if __name__ == '__main__':
+    main()
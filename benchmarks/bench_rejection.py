@@ -0,0 +1,83 @@
+"""
+Benchmarks verification of valid launches against the different kinds of
+invalid launches seen in bot and credential stuffing traffic, and a mix of
+them. Invalid launches that fail the cheap checks should cost a small
+fraction of a valid one.
+
+Run from the repository root:
+    PYTHONPATH=. python benchmarks/bench_rejection.py [iterations]
+"""
+import random
+import sys
+import timeit
+
+from launch_generator import generate_launch
+from oauth_store import OAuthStore
+from parser import Parser
+from replay import ReplayGuard
+
+def _get_parsers():
+    '''
+    Returns a dict of traffic kind to a Parser for a launch of that kind.
+    '''
+    launch = generate_launch(num_params=40)
+    oauth_store = OAuthStore()
+    for key, secret in launch['secrets'].items():
+        oauth_store.set_secret(key, secret)
+    post_params = launch['post_params']
+    signature = post_params['oauth_signature']
+    wrong_signature = signature[:-2] + ('A' if signature[-2] != 'A' else 'B') \
+        + '='
+    kinds = {
+        'valid': (post_params, None),
+        'signature_mismatch': (dict(post_params,
+            oauth_signature=wrong_signature), None),
+        'malformed_signature': (dict(post_params, oauth_signature='x' * 10),
+            None),
+        'unknown_consumer_key': (dict(post_params,
+            oauth_consumer_key='made up key'), None),
+        # generated timestamps are years in the past
+        'stale_timestamp': (post_params, ReplayGuard()),
+    }
+    parsers = {}
+    for kind, (params, replay_guard) in kinds.items():
+        parsers[kind] = Parser(launch['method'], launch['url'],
+            launch['http_headers'], launch['get_params'], params, oauth_store,
+            replay_guard)
+    return parsers
+
+# share of each kind of traffic in the mixed workload
+MIX = [
+    ('valid', 0.5),
+    ('signature_mismatch', 0.2),
+    ('unknown_consumer_key', 0.15),
+    ('malformed_signature', 0.1),
+    ('stale_timestamp', 0.05),
+]
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    parsers = _get_parsers()
+    assert parsers['valid'].verify_signature()
+    print("%-22s %12s" % ("traffic", "us per launch"))
+    for kind in sorted(parsers):
+        elapsed = min(timeit.repeat(parsers[kind].verify_signature, repeat=3,
+            number=iterations))
+        print("%-22s %12.2f" % (kind, elapsed / iterations * 1000000))
+    rand = random.Random(0)
+    mixed = []
+    for i in range(iterations):
+        choice = rand.random()
+        for kind, share in MIX:
+            choice -= share
+            if choice < 0:
+                break
+        mixed.append(parsers[kind].verify_signature)
+    def run_mixed():
+        for verify in mixed:
+            verify()
+    elapsed = min(timeit.repeat(run_mixed, repeat=3, number=1))
+    print("%-22s %12.2f" % ("mixed", elapsed / iterations * 1000000))
+
+if __name__ == '__main__':
+    main()
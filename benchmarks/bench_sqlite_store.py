@@ -0,0 +1,67 @@
+"""
+Lookup benchmark for sqlite_store.SQLiteOAuthStore with a cold cache, a warm
+cache and a mixed workload of hot keys, cold keys and unknown keys.
+
+Run from the repository root:
+    PYTHONPATH=. python benchmarks/bench_sqlite_store.py [num_lookups]
+"""
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from sqlite_store import SQLiteOAuthStore
+
+NUM_KEYS = 10000
+
+def _run(store, keys):
+    start = time.time()
+    for key in keys:
+        store.get_secret(key)
+    return len(keys) / (time.time() - start)
+
+def main():
+    num_lookups = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'secrets.db')
+        store = SQLiteOAuthStore(path)
+        store.set_secrets(("key%d" % i, "secret%d" % i)
+            for i in range(NUM_KEYS))
+        store.close()
+        rand = random.Random(0)
+        all_keys = ["key%d" % rand.randrange(NUM_KEYS)
+            for i in range(num_lookups)]
+        hot_keys = ["key%d" % i for i in range(100)]
+        # 90% hot keys, 5% other known keys, 5% unknown keys
+        mixed_keys = []
+        for i in range(num_lookups):
+            choice = rand.random()
+            if choice < 0.9:
+                mixed_keys.append(rand.choice(hot_keys))
+            elif choice < 0.95:
+                mixed_keys.append("key%d" % rand.randrange(NUM_KEYS))
+            else:
+                mixed_keys.append("unknown%d" % rand.randrange(NUM_KEYS))
+
+        print("%-8s %12s" % ("workload", "lookups/s"))
+        # cold, nothing can stay in the cache
+        store = SQLiteOAuthStore(path, cache_size=0)
+        print("%-8s %12.0f" % ("cold", _run(store, all_keys)))
+        store.close()
+        # warm, every key is already cached
+        store = SQLiteOAuthStore(path, cache_size=NUM_KEYS)
+        _run(store, ["key%d" % i for i in range(NUM_KEYS)])
+        print("%-8s %12.0f" % ("warm", _run(store, all_keys)))
+        store.close()
+        # mixed, cache only big enough for the hot keys and some others
+        store = SQLiteOAuthStore(path, cache_size=1000)
+        print("%-8s %12.0f" % ("mixed", _run(store, mixed_keys)))
+        store.close()
+    finally:
+        shutil.rmtree(tmpdir)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Audit throughput of validator.Validator over many launch records, comparing a
+loop over validate with validate_iter.
+
+Run from the repository root:
+    PYTHONPATH=. python benchmarks/bench_validator.py [num_records]
+"""
+import logging
+import sys
+import time
+
+from launch import lti_launch_schema
+from launch_generator import generate_launch
+from parser import oauth_schema
+from validator import Validator
+
+def _make_records(num_records):
+    records = []
+    for i in range(num_records):
+        if i % 100 == 0:
+            params = generate_launch(num_params=10, seed=i)['post_params']
+        record = dict(params)
+        # 1% of the records are bad
+        if i % 100 == 1:
+            record['lti_version'] = 'LTI-3p0'
+        records.append(record)
+    return records
+
+def _run(func):
+    start = time.time()
+    func()
+    return time.time() - start
+
+def main():
+    num_records = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    # the recommended field warnings would dominate the validate loop
+    logging.disable(logging.WARNING)
+    schema = dict(lti_launch_schema)
+    schema.update(oauth_schema)
+    validator = Validator(schema)
+    records = _make_records(num_records)
+
+    def loop():
+        for record in records:
+            validator.validate(dict(record))
+    def validate_iter():
+        for result in validator.validate_iter(iter(records)):
+            pass
+    def validate_iter_coerce():
+        for result in validator.validate_iter(iter(records), coerce=True):
+            pass
+
+    print("%-24s %12s" % ("mode", "records/s"))
+    for name, func in [('validate loop', loop),
+            ('validate_iter', validate_iter),
+            ('validate_iter coerce', validate_iter_coerce)]:
+        print("%-24s %12.0f" % (name, num_records / _run(func)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+"""
+Throughput benchmark for batch.verify_many, verifying the same set of
+launches with increasing numbers of thread and process workers.
+
+Run from the repository root:
+    PYTHONPATH=. python benchmarks/bench_verify_many.py [num_requests]
+"""
+import multiprocessing
+import sys
+import time
+
+from batch import verify_many
+from oauth_store import OAuthStore
+from tests import lti_launch_data
+
+def main():
+    num_requests = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    data = lti_launch_data.webwork_blti_launch
+    oauth_store = OAuthStore()
+    for key, secret in data['secrets'].items():
+        oauth_store.set_secret(key, secret)
+    requests = [(i, data) for i in range(num_requests)]
+
+    print("%-8s %7s %12s" % ("executor", "workers", "requests/s"))
+    workers = 1
+    while workers <= multiprocessing.cpu_count():
+        for executor in ['thread', 'process']:
+            start = time.time()
+            for request_id, ok, error, rejection_reason in verify_many(
+                    requests, oauth_store, workers=workers,
+                    executor=executor):
+                assert ok, error
+            elapsed = time.time() - start
+            print("%-8s %7d %12.0f" % (executor, workers,
+                num_requests / elapsed))
+        workers *= 2
+
+if __name__ == '__main__':
+    main()
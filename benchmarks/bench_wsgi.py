@@ -0,0 +1,86 @@
+"""
+Local load test of wsgi.LTIMiddleware, served by a threaded wsgiref server
+and loaded with signed launches from several client threads.
+
+Run from the repository root:
+    PYTHONPATH=. python benchmarks/bench_wsgi.py [num_requests] [clients]
+"""
+import http.client
+from socketserver import ThreadingMixIn
+import sys
+import threading
+import time
+from urllib.parse import urlencode
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from launch_generator import CONSUMER_KEY, SECRET, generate_launch
+from oauth_store import OAuthStore
+from wsgi import LTIMiddleware
+
+LAUNCH_PATH = '/lti/launch'
+# distinct launches sent round robin, a tenth of them with a bad signature
+NUM_LAUNCHES = 100
+
+class _ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+def _app(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [environ['lti.launch'].resource_link_id.encode('utf-8')]
+
+def _make_requests():
+    requests = []
+    for i in range(NUM_LAUNCHES):
+        launch = generate_launch(num_params=20, seed=i)
+        post_params = launch['post_params']
+        if i % 10 == 0:
+            post_params['oauth_signature'] = 'cbxlc8O7Gzqo2rYBu+LvUyPp19d='
+        requests.append((urlencode(post_params), launch['http_headers']))
+    return requests
+
+def _client(port, requests, count, statuses):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    for i in range(count):
+        body, headers = requests[i % len(requests)]
+        conn.request('POST', LAUNCH_PATH, body, headers)
+        response = conn.getresponse()
+        response.read()
+        statuses.append(response.status)
+    conn.close()
+
+def main():
+    num_requests = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    oauth_store = OAuthStore()
+    oauth_store.set_secret(CONSUMER_KEY, SECRET)
+    # launches are generated for tool.example.com:8080, which the clients
+    # send as the Host header
+    app = LTIMiddleware(_app, oauth_store, [LAUNCH_PATH])
+    server = make_server('127.0.0.1', 0, app, _ThreadingWSGIServer,
+        _QuietHandler)
+    server_thread = threading.Thread(target=server.serve_forever)
+    server_thread.daemon = True
+    server_thread.start()
+    requests = _make_requests()
+    statuses = []
+    threads = [threading.Thread(target=_client, args=(server.server_port,
+        requests, num_requests // clients, statuses)) for i in range(clients)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+    server.shutdown()
+    print("%-10s %12s" % ("status", "responses"))
+    for status in sorted(set(statuses)):
+        print("%-10s %12d" % (status, statuses.count(status)))
+    print("%.0f requests/s with %d clients" % (len(statuses) / elapsed,
+        clients))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+# coding=utf-8
+"""
+Generates synthetic, correctly signed LTI launches for benchmarking.
+
+Launches have the same structure as the test data in tests/lti_launch_data.py.
+"""
+import base64
+from hashlib import sha1
+import hmac
+import random
+
+from parser import _build_base_string, _get_base_string_prefix, \
+    _make_signing_key, _percent_encode
+
+CONSUMER_KEY = 'benchmark_key'
+SECRET = 'benchmark_secret'
+
+# standard LTI launch params that every generated launch has
+_STANDARD_PARAMS = {
+    'lti_message_type': 'basic-lti-launch-request',
+    'lti_version': 'LTI-1p0',
+    'resource_link_id': 'CL.UBC.MATH.101.201.2012W2.13204',
+    'resource_link_title': 'webworkdev',
+    'context_id': 'CL.UBC.MATH.101.201.2012W2.13204',
+    'context_title': '2012W2-MATH101-201- Integral Calculus with '
+        'Applications to Physical Sciences and Engineering-Instructors',
+    'context_type': 'CourseSection',
+    'roles': 'Instructor',
+    'user_id': '8f5d9e2b1c',
+    'lis_person_name_full': 'John Hsu',
+    'lis_person_name_family': 'Hsu',
+    'lis_person_name_given': 'John',
+    'lis_outcome_service_url':
+        'http://137.82.12.84/webapps/osc-BasicLTI-BBLEARN/service',
+    'launch_presentation_return_url': 'http://137.82.12.84/webapps/'
+        'osc-BasicLTI-BBLEARN/return.jsp?id=webworkdev&course_id=_101_1',
+    'launch_presentation_locale': 'en_GB',
+    'tool_consumer_instance_guid': 'lti_secret',
+    'tool_consumer_info_product_family_code': 'learn',
+}
+
+_ASCII_CHARS = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789' \
+    ' -_.~!*/&='
+_NON_ASCII_CHARS = 'øéüßñ×ת漢字'
+
+def _random_value(rand, size, non_ascii):
+    chars = _ASCII_CHARS
+    if non_ascii:
+        chars += _NON_ASCII_CHARS
+    return ''.join(rand.choice(chars) for i in range(size))
+
+def generate_launch(num_params=20, value_size=16, non_ascii=False,
+        in_header=False, seed=0):
+    '''
+    Returns a signed launch with the standard LTI params plus num_params
+    custom_* and ext_* params that have values of value_size characters.
+
+    non_ascii - whether custom values include non-ASCII characters
+    in_header - whether the OAuth params are sent in the Authorization header
+        instead of the POST body
+    '''
+    rand = random.Random(seed)
+    method = 'POST'
+    url = 'http://tool.example.com:8080/lti/launch'
+    post_params = dict(_STANDARD_PARAMS)
+    for i in range(num_params):
+        prefix = 'custom_' if i % 2 == 0 else 'ext_'
+        post_params['%sparam_%d' % (prefix, i)] = \
+            _random_value(rand, value_size, non_ascii)
+    oauth_params = {
+        'oauth_consumer_key': CONSUMER_KEY,
+        'oauth_signature_method': 'HMAC-SHA1',
+        'oauth_timestamp': str(1423873410 + seed),
+        'oauth_nonce': '%016x' % rand.getrandbits(64),
+        'oauth_version': '1.0',
+        'oauth_callback': 'about:blank'
+    }
+    http_headers = {
+        'Host': 'tool.example.com:8080',
+        'Content-Type': 'application/x-www-form-urlencoded'
+    }
+    if in_header:
+        basestr = _build_base_string(_get_base_string_prefix(method, url), {},
+            post_params, oauth_params)
+    else:
+        post_params.update(oauth_params)
+        basestr = _build_base_string(_get_base_string_prefix(method, url), {},
+            post_params)
+    signature = base64.b64encode(hmac.new(_make_signing_key(SECRET, ''),
+        basestr, sha1).digest()).decode('ascii')
+    oauth_params['oauth_signature'] = signature
+    if in_header:
+        http_headers['Authorization'] = 'OAuth realm="Example",' + \
+            ','.join('%s="%s"' % (key, _percent_encode(val).decode('ascii'))
+                for key, val in sorted(oauth_params.items()))
+    else:
+        post_params['oauth_signature'] = signature
+    return {
+        "secrets": {CONSUMER_KEY: SECRET},
+        "method": method,
+        "url": url,
+        "http_headers": http_headers,
+        "get_params": {},
+        "post_params": post_params
+    }
@@ -0,0 +1,121 @@
+"""
+Simple in-process caches used to avoid redoing work that repeats across LTI
+requests.
+"""
+from collections import OrderedDict
+import threading
+import time
+
+class LRUCache:
+    '''
+    A thread safe cache that holds at most maxsize entries. When full, the
+    least recently used entry is evicted to make room for a new one.
+
+    If ttl is given, entries also expire ttl seconds after they were set.
+    '''
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        '''
+        Returns the value cached for key, or default if there isn't one.
+        '''
+        with self._lock:
+            try:
+                entry = self._entries.pop(key)
+            except KeyError:
+                return default
+            if self.ttl is not None and entry[1] <= time.time():
+                return default # expired, leave it removed
+            # reinsert to mark as most recently used
+            self._entries[key] = entry
+            return entry[0]
+
+    def set(self, key, value):
+        '''
+        Cache value under key, evicting the least recently used entry if full.
+        '''
+        expires = None
+        if self.ttl is not None:
+            expires = time.time() + self.ttl
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, expires)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        '''
+        Remove key from the cache, returns its value or default if not cached.
+        '''
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry is None:
+            return default
+        return entry[0]
+
+    def clear(self):
+        '''
+        Remove all entries from the cache.
+        '''
+        with self._lock:
+            self._entries.clear()
+
+    def __contains__(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return False
+        return self.ttl is None or entry[1] > time.time()
+
+    def __len__(self):
+        return len(self._entries)
+
+class VerifiedResultCache:
+    '''
+    Remembers the signature checks of recent requests, so that a request sent
+    again unchanged, e.g. by a browser refresh or an LMS retry, doesn't have
+    its OAuth params located, base string built and signature calculated
+    again. Given to Parser or PreparedVerifier as result_cache.
+
+    Entries are keyed by the request's (consumer key, nonce, signature) but
+    are only used for a request that's equal to the one checked, which is a
+    cheap comparison of its params. Only the signature check is reused, the
+    consumer key lookup and the ReplayGuard checks still run for every
+    request. So with a replay guard, a resubmission is still rejected as
+    replayed, only more cheaply, and a check made with a secret that has
+    since changed is never reused. Checks are only reused with OAuth stores
+    that have a derived cache, see oauth_store.DerivedCacheMixin.
+
+    maxsize - max number of requests remembered
+    ttl - seconds that a request is remembered for
+    '''
+    def __init__(self, maxsize=10000, ttl=60):
+        self._cache = LRUCache(maxsize, ttl)
+
+    def get(self, key, request):
+        '''
+        Returns what was cached with set for key if it was for an equal
+        request, otherwise None.
+        '''
+        entry = self._cache.get(key)
+        if entry is None or entry[0] != request:
+            return None
+        return entry[1]
+
+    def set(self, key, request, value):
+        '''
+        Cache value for a request, which must not be changed afterwards.
+        '''
+        self._cache.set(key, (request, value))
+
+    def clear(self):
+        '''
+        Forget all the cached requests.
+        '''
+        self._cache.clear()
+
+    def __len__(self):
+        return len(self._cache)
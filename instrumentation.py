@@ -0,0 +1,163 @@
+"""
+Instrumentation for the signature verification pipeline.
+
+Listeners registered with Parser.add_listener are told how long each stage of
+a verification took and what the outcome of each verification was. When no
+listener is registered, verification isn't timed at all.
+"""
+import bisect
+import threading
+
+class Stage:
+    '''
+    The timed stages of a verification.
+    '''
+    LOCATE_OAUTH_PARAMS = 'locate_oauth_params'
+    BASE_STRING = 'base_string'
+    SECRET_LOOKUP = 'secret_lookup'
+    HMAC = 'hmac'
+
+class Outcome:
+    '''
+    The possible outcomes of a verification, every outcome other than VALID
+    is a reason for rejecting the request.
+    '''
+    VALID = 'valid'
+    SIGNATURE_MISMATCH = 'signature_mismatch'
+    MISSING_OAUTH_FIELDS = 'missing_oauth_fields'
+    UNKNOWN_CONSUMER_KEY = 'unknown_consumer_key'
+    UNSUPPORTED_METHOD = 'unsupported_method'
+    STALE_TIMESTAMP = 'stale_timestamp'
+    MALFORMED_SIGNATURE = 'malformed_signature'
+    REPLAYED = 'replayed'
+    THROTTLED = 'throttled'
+
+class Listener:
+    '''
+    Base class for verification listeners. All methods can be called from
+    multiple threads at once.
+    '''
+    def stage_finished(self, stage, duration):
+        '''
+        Called when a Stage of a verification finished, duration is in
+        seconds.
+        '''
+        pass
+
+    def outcome(self, outcome):
+        '''
+        Called with the Outcome of each verification.
+        '''
+        pass
+
+    def secret_matched(self, consumer_key, index):
+        '''
+        Called for each valid request with the index of the consumer key's
+        candidate secret that it was signed with. While a secret is being
+        rotated, index 0 is the new secret.
+        '''
+        pass
+
+# upper bounds of the histogram buckets in seconds, 1us to ~1s doubling each
+# time, durations over the last bound go into an extra overflow bucket
+HISTOGRAM_BOUNDS = [0.000001 * 2 ** i for i in range(21)]
+
+class HistogramCollector(Listener):
+    '''
+    Keeps a histogram of durations for each stage and a counter for each
+    outcome, in memory.
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        '''
+        Clear all the collected data.
+        '''
+        with self._lock:
+            self._histograms = {}
+            self._totals = {}
+            self._outcomes = {}
+            self._secret_matches = {}
+
+    def stage_finished(self, stage, duration):
+        index = bisect.bisect_left(HISTOGRAM_BOUNDS, duration)
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+                self._histograms[stage] = histogram
+            histogram[index] += 1
+            self._totals[stage] = self._totals.get(stage, 0) + duration
+
+    def outcome(self, outcome):
+        with self._lock:
+            self._outcomes[outcome] = self._outcomes.get(outcome, 0) + 1
+
+    def secret_matched(self, consumer_key, index):
+        key = (consumer_key, index)
+        with self._lock:
+            self._secret_matches[key] = self._secret_matches.get(key, 0) + 1
+
+    def get_secret_matches(self):
+        '''
+        Returns a dict of (consumer key, secret index) to the number of
+        requests signed with that secret. A rotation is finished once there are
+        no more matches for indexes above 0.
+        '''
+        with self._lock:
+            return dict(self._secret_matches)
+
+    def get_outcomes(self):
+        '''
+        Returns a dict of outcomes to the number of times they happened.
+        '''
+        with self._lock:
+            return dict(self._outcomes)
+
+    def get_histogram(self, stage):
+        '''
+        Returns a list of (upper bound in seconds, count) for each bucket of
+        the stage's histogram. The overflow bucket's bound is None.
+        '''
+        with self._lock:
+            histogram = list(self._histograms.get(stage,
+                [0] * (len(HISTOGRAM_BOUNDS) + 1)))
+        return list(zip(HISTOGRAM_BOUNDS + [None], histogram))
+
+    def get_count(self, stage):
+        '''
+        Returns the number of times the stage finished.
+        '''
+        with self._lock:
+            return sum(self._histograms.get(stage, []))
+
+    def get_mean(self, stage):
+        '''
+        Returns the mean duration of the stage in seconds, or None if it never
+        finished.
+        '''
+        count = self.get_count(stage)
+        if not count:
+            return None
+        with self._lock:
+            return self._totals[stage] / count
+
+    def get_percentile(self, stage, percentile):
+        '''
+        Returns the upper bound of the bucket that the given percentile (0 to
+        100) of the stage's durations falls in, or None if it never finished
+        or the percentile is in the overflow bucket.
+        '''
+        histogram = self.get_histogram(stage)
+        total = sum(count for bound, count in histogram)
+        if not total:
+            return None
+        threshold = total * percentile / 100.0
+        seen = 0
+        for bound, count in histogram:
+            seen += count
+            if seen >= threshold and count:
+                return bound
+        return None
@@ -0,0 +1,190 @@
+"""
+LTI 1.x launch validation.
+
+parse_launch checks a launch's params against lti_launch_schema and returns a
+LaunchRequest, a compact object that can be kept in session storage instead of
+the raw POST params.
+"""
+import sys
+
+from parser import LTIParserError
+from validator import Validator
+
+class InvalidLaunchError(LTIParserError):
+    pass
+
+# LTI v1 requires resource_link_id also
+lti_launch_schema = {
+    'lti_message_type': {'required': True,
+        'values': ['basic-lti-launch-request']},
+    'lti_version': {'required': True, 'values': ['LTI-1p0', 'LTI-2p0']},
+    'resource_link_id': {'required': True},
+    'user_id': {'recommended': True},
+    'roles': {'recommended': True},
+    'context_id': {'recommended': True}
+}
+# shared by all launches so the schema is only compiled once
+launch_validator = Validator(lti_launch_schema)
+
+# the standard LTI 1.x launch params, each kept in the LaunchRequest attribute
+# of the same name
+standard_fields = (
+    'lti_message_type',
+    'lti_version',
+    'resource_link_id',
+    'resource_link_title',
+    'resource_link_description',
+    'user_id',
+    'user_image',
+    'role_scope_mentor',
+    'lis_person_name_given',
+    'lis_person_name_family',
+    'lis_person_name_full',
+    'lis_person_contact_email_primary',
+    'lis_person_sourcedid',
+    'context_id',
+    'context_type',
+    'context_title',
+    'context_label',
+    'launch_presentation_locale',
+    'launch_presentation_document_target',
+    'launch_presentation_css_url',
+    'launch_presentation_width',
+    'launch_presentation_height',
+    'launch_presentation_return_url',
+    'tool_consumer_info_product_family_code',
+    'tool_consumer_info_version',
+    'tool_consumer_instance_guid',
+    'tool_consumer_instance_name',
+    'tool_consumer_instance_description',
+    'tool_consumer_instance_url',
+    'tool_consumer_instance_contact_email',
+    'lis_outcome_service_url',
+    'lis_result_sourcedid',
+    'lis_course_offering_sourcedid',
+    'lis_course_section_sourcedid',
+    'oauth_consumer_key'
+)
+_standard_fields = frozenset(standard_fields)
+
+# fields that only take a handful of distinct values across all launches, the
+# values are interned so that every session shares the same string
+_interned_fields = frozenset([
+    'lti_message_type',
+    'lti_version',
+    'context_type',
+    'launch_presentation_locale',
+    'launch_presentation_document_target',
+    'tool_consumer_info_product_family_code',
+    'tool_consumer_info_version',
+    'tool_consumer_instance_guid',
+    'oauth_consumer_key'
+])
+
+def _intern(value):
+    '''
+    Intern value if it's a string, other values are returned as is.
+    '''
+    if type(value) is str:
+        return sys.intern(value)
+    return value
+
+def _decode_roles(roles):
+    '''
+    Split the comma separated roles param into a tuple of roles.
+    '''
+    if not roles:
+        return ()
+    return tuple(role.strip() for role in roles.split(',') if role.strip())
+
+class LaunchRequest(object):
+    '''
+    The params of an LTI launch.
+
+    Each standard field is stored in the attribute of the same name, or None
+    if the launch didn't have it. custom_* and ext_* params are in the custom
+    and ext dicts, keyed by name without the prefix, e.g. custom_foo is in
+    custom['foo']. Any other non OAuth params are kept in extra. The roles
+    param is only split into a tuple the first time roles is accessed.
+    '''
+    __slots__ = standard_fields + ('_roles', '_role_list', 'custom', 'ext',
+        'extra')
+
+    def __init__(self, params):
+        for name in standard_fields:
+            value = params.get(name)
+            if name in _interned_fields:
+                value = _intern(value)
+            setattr(self, name, value)
+        self._roles = _intern(params.get('roles'))
+        self._role_list = None
+        self.custom = {}
+        self.ext = {}
+        self.extra = {}
+        for name, value in params.items():
+            if name.startswith('custom_'):
+                self.custom[_intern(name[7:])] = value
+            elif name.startswith('ext_'):
+                self.ext[_intern(name[4:])] = value
+            elif name not in _standard_fields and name != 'roles' and \
+                    not name.startswith('oauth_'):
+                self.extra[_intern(name)] = value
+
+    @property
+    def roles(self):
+        '''
+        Returns the launching user's roles as a tuple.
+        '''
+        if self._role_list is None:
+            self._role_list = _decode_roles(self._roles)
+        return self._role_list
+
+    def to_dict(self):
+        '''
+        Returns the launch params as a flat dict again.
+        '''
+        params = dict(self.extra)
+        for name in standard_fields:
+            value = getattr(self, name)
+            if value is not None:
+                params[name] = value
+        if self._roles is not None:
+            params['roles'] = self._roles
+        for name, value in self.custom.items():
+            params['custom_' + name] = value
+        for name, value in self.ext.items():
+            params['ext_' + name] = value
+        return params
+
+    def __getstate__(self):
+        # slots without a __dict__ need this to be pickled with the older
+        # pickle protocols, the decoded roles aren't worth storing
+        return self.to_dict()
+
+    def __setstate__(self, state):
+        self.__init__(state)
+
+    def __eq__(self, other):
+        if not isinstance(other, LaunchRequest):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+def parse_launch(params):
+    '''
+    Check params, the launch's GET and POST params, against lti_launch_schema.
+    Returns a LaunchRequest, raises InvalidLaunchError if the launch doesn't
+    match the schema. params itself is never modified.
+    '''
+    fields = {}
+    for name in lti_launch_schema:
+        if name in params:
+            fields[name] = params[name]
+    if not launch_validator.validate(fields):
+        raise InvalidLaunchError("Launch params don't match the LTI schema.")
+    return LaunchRequest(params)
@@ -0,0 +1,410 @@
+"""
+Capture LTI launches and replay them through Parser.verify_signature, to
+load test a new version of the library against the shape of real traffic.
+
+Launches are stored one per line as JSON, with the same structure as the test
+data in tests/lti_launch_data.py, gzipped if the file name ends in .gz.
+Launches can be captured from a running tool with RecordingMiddleware, or
+taken from a Python module of launch dicts:
+
+    python -m loadtest record launches.ndjson.gz tests.lti_launch_data
+    python -m loadtest redact launches.ndjson.gz redacted.ndjson.gz
+    python -m loadtest replay redacted.ndjson.gz --processes 4 --rate 2000
+
+Recorded launches include the secrets needed to verify them. Redacting a file
+masks the param values and replaces the consumer keys and secrets with made
+up ones, then signs each launch again so it still verifies.
+"""
+import argparse
+import gzip
+import importlib
+from io import BytesIO
+from itertools import islice
+import json
+import math
+import multiprocessing
+import re
+from secrets import token_hex
+import sys
+import threading
+import time
+from urllib.parse import parse_qsl
+
+from instrumentation import Outcome
+from oauth_store import OAuthStore
+from parser import LTIParserError, OAuthParams, Parser, _build_base_string, \
+    _get_base_string_prefix, _get_header_params, _make_signing_key, \
+    _parse_auth_header, get_signature_method
+from signer import format_authorization_header
+from wsgi import MAX_BODY_SIZE, _get_url, _is_form_encoded, _read_body
+
+# fields whose values are left alone by redaction, they're the same for
+# everyone and don't identify anybody
+UNREDACTED_FIELDS = frozenset(['lti_message_type', 'lti_version', 'roles',
+    'launch_presentation_document_target'])
+
+def open_launch_file(path, mode='r'):
+    '''
+    Open a launch file for reading or writing, mode is 'r', 'w' or 'a'.
+    '''
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+def read_launches(path):
+    '''
+    Generates the launches stored in a launch file.
+    '''
+    with open_launch_file(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+class LaunchRecorder:
+    '''
+    Writes launches to a text file object opened with open_launch_file. Can be
+    used from multiple threads at once.
+
+    redactor - optional Redactor, applied to each launch before it's written
+    '''
+    def __init__(self, fileobj, redactor=None):
+        self.fileobj = fileobj
+        self.redactor = redactor
+        self._lock = threading.Lock()
+
+    def record(self, launch):
+        '''
+        Write a launch, a dict with the same structure as the test data.
+        '''
+        if self.redactor is not None:
+            launch = self.redactor.redact(launch)
+        line = json.dumps(launch, ensure_ascii=False, separators=(',', ':'))
+        with self._lock:
+            self.fileobj.write(line + '\n')
+
+# replacements for characters that keep their percent encoded length, so a
+# redacted base string is as long as the original one
+_MASKED_CHARS = {1: 'x', 2: 'é', 3: '€', 4: '\U0001f600'}
+_MASKED = re.compile(r'[A-Za-z0-9]|[^\x00-\x7f]')
+
+def _mask_char(match):
+    return _MASKED_CHARS[len(match.group().encode('utf-8'))]
+
+def _mask(value):
+    '''
+    Mask a value, leaving only its punctuation and length.
+    '''
+    return _MASKED.sub(_mask_char, value)
+
+class Redactor:
+    '''
+    Removes personal data and real secrets from launches, while keeping what
+    the verification cost depends on: the number, names and lengths of the
+    params, where the OAuth params are and the signature method.
+
+    Every param value not in UNREDACTED_FIELDS is masked. Each consumer and
+    token key is replaced with a made up one, the same for every launch that
+    used it, with a random secret. Launches are then signed again with the
+    new secrets. Launches without a valid set of OAuth params are masked but
+    can't be signed, they'll fail verification when replayed like the
+    originals did.
+    '''
+    def __init__(self):
+        # original key to made up key
+        self._keys = {}
+        # made up key to its secret
+        self._secrets = {}
+
+    def _replace_key(self, key):
+        replacement = self._keys.get(key)
+        if replacement is None:
+            replacement = 'key%d' % len(self._keys)
+            self._keys[key] = replacement
+            self._secrets[replacement] = token_hex(16)
+        return replacement
+
+    def _redact_params(self, params):
+        redacted = {}
+        for name, value in params.items():
+            if name == 'oauth_consumer_key' or name == 'oauth_token':
+                value = self._replace_key(value)
+            elif not name.startswith('oauth_') and \
+                    name not in UNREDACTED_FIELDS:
+                value = _mask(value)
+            redacted[name] = value
+        return redacted
+
+    def redact(self, launch):
+        '''
+        Returns a redacted copy of launch.
+        '''
+        http_headers = {}
+        header_params = _parse_auth_header(launch['http_headers'])
+        if header_params:
+            header_params = self._redact_params(header_params)
+            http_headers['Authorization'] = header_params
+        get_params = self._redact_params(launch['get_params'])
+        post_params = self._redact_params(launch['post_params'])
+        redacted = {
+            'secrets': {},
+            'method': launch['method'],
+            'url': launch['url'],
+            'http_headers': http_headers,
+            'get_params': get_params,
+            'post_params': post_params
+        }
+        try:
+            oauth_params = OAuthParams(http_headers, get_params, post_params)
+        except LTIParserError:
+            if header_params:
+                http_headers['Authorization'] = \
+                    format_authorization_header(header_params)
+            return redacted
+        client_secret = self._secrets[oauth_params.get_client_key()]
+        redacted['secrets'][oauth_params.get_client_key()] = client_secret
+        token_secret = self._secrets.get(oauth_params.get_token_key(), '')
+        if token_secret:
+            redacted['secrets'][oauth_params.get_token_key()] = token_secret
+        method = get_signature_method(oauth_params.oauth_signature_method)
+        basestr = _build_base_string(
+            _get_base_string_prefix(launch['method'], launch['url']),
+            get_params, post_params, _get_header_params(oauth_params))
+        signature = method.sign(method.prepare(_make_signing_key(
+            client_secret, token_secret)), basestr).decode('ascii')
+        if oauth_params.isInHttpHeader():
+            header_params['oauth_signature'] = signature
+        elif 'oauth_signature' in post_params:
+            post_params['oauth_signature'] = signature
+        else:
+            get_params['oauth_signature'] = signature
+        if header_params:
+            http_headers['Authorization'] = \
+                format_authorization_header(header_params)
+        return redacted
+
+class RecordingMiddleware:
+    '''
+    WSGI middleware that records the requests sent to any of paths before
+    passing them on to app, e.g. wrapped around wsgi.LTIMiddleware.
+
+    The secrets of each launch's consumer and token keys are looked up in
+    oauth_store and recorded with it, so a recorder without a redactor writes
+    real secrets to its file. Only the Authorization header is recorded, the
+    parser doesn't use the others.
+
+    recorder - a LaunchRecorder
+    base_url - same as for wsgi.LTIMiddleware
+    '''
+    def __init__(self, app, recorder, oauth_store, paths,
+            max_body_size=MAX_BODY_SIZE, base_url=None):
+        self.app = app
+        self.recorder = recorder
+        self.oauth_store = oauth_store
+        self.paths = frozenset(paths)
+        self.max_body_size = max_body_size
+        self.base_url = base_url
+
+    def _get_secrets(self, http_headers, get_params, post_params):
+        try:
+            oauth_params = OAuthParams(http_headers, get_params, post_params)
+        except LTIParserError:
+            return {}
+        found = {}
+        for key in [oauth_params.get_client_key(), oauth_params.oauth_token]:
+            if key is not None and self.oauth_store.has_key(key):
+                found[key] = self.oauth_store.get_secret(key)
+        return found
+
+    def __call__(self, environ, start_response):
+        if environ.get('PATH_INFO', '') not in self.paths:
+            return self.app(environ, start_response)
+        body = _read_body(environ, self.max_body_size)
+        if body is None: # too large to be a launch, left for the app to reject
+            return self.app(environ, start_response)
+        http_headers = {}
+        if 'HTTP_AUTHORIZATION' in environ:
+            http_headers['Authorization'] = environ['HTTP_AUTHORIZATION']
+        get_params = dict(parse_qsl(environ.get('QUERY_STRING', '').encode(
+            'latin-1').decode('utf-8', 'replace'), True))
+        post_params = dict(parse_qsl(body.decode('utf-8', 'replace'), True))
+        self.recorder.record({
+            'secrets': self._get_secrets(http_headers, get_params,
+                post_params),
+            'method': environ['REQUEST_METHOD'],
+            'url': _get_url(environ, self.base_url),
+            'http_headers': http_headers,
+            'get_params': get_params,
+            'post_params': post_params
+        })
+        if _is_form_encoded(environ):
+            # the body was used up, so the application gets a copy
+            environ['wsgi.input'] = BytesIO(body)
+            environ['CONTENT_LENGTH'] = str(len(body))
+        return self.app(environ, start_response)
+
+class ReplayResult:
+    '''
+    The results of a replay.
+
+    latencies - sorted list of the time each verification took in seconds,
+        when replaying at a rate it's measured from when the verification
+        was due, so that falling behind shows up as latency
+    outcomes - dict of instrumentation.Outcome to the number of launches
+        with that outcome
+    elapsed - seconds taken by the slowest process
+    '''
+    def __init__(self, latencies, outcomes, elapsed):
+        self.latencies = latencies
+        self.outcomes = outcomes
+        self.elapsed = elapsed
+
+    def get_count(self):
+        return len(self.latencies)
+
+    def get_throughput(self):
+        '''
+        Returns the verifications per second.
+        '''
+        if not self.elapsed:
+            return 0.0
+        return len(self.latencies) / self.elapsed
+
+    def get_percentile(self, percentile):
+        '''
+        Returns the latency at the given percentile (0 to 100) in seconds, or
+        None if nothing was replayed.
+        '''
+        if not self.latencies:
+            return None
+        index = max(0, math.ceil(percentile / 100.0 * len(self.latencies)) - 1)
+        return self.latencies[index]
+
+def _replay_part(args):
+    '''
+    Replays every step-th launch of the file, starting at the start-th, at
+    rate launches per second. Returns (latencies, outcomes, elapsed).
+    '''
+    path, start, step, rate, repeat = args
+    launches = list(islice(read_launches(path), start, None, step))
+    oauth_store = OAuthStore()
+    for launch in launches:
+        for key, secret in launch['secrets'].items():
+            oauth_store.set_secret(key, secret)
+    interval = 1.0 / rate if rate else 0
+    latencies = []
+    outcomes = {}
+    began = time.perf_counter()
+    due = began
+    for i in range(repeat):
+        for launch in launches:
+            if interval:
+                now = time.perf_counter()
+                if due > now:
+                    time.sleep(due - now)
+                started = due
+                due += interval
+            else:
+                started = time.perf_counter()
+            parser = Parser(launch['method'], launch['url'],
+                launch['http_headers'], launch['get_params'],
+                launch['post_params'], oauth_store)
+            try:
+                parser.verify_signature()
+                outcome = parser.rejection_reason or Outcome.VALID
+            except LTIParserError:
+                outcome = Outcome.MISSING_OAUTH_FIELDS
+            latencies.append(time.perf_counter() - started)
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    return latencies, outcomes, time.perf_counter() - began
+
+def replay(path, rate=None, processes=1, repeat=1):
+    '''
+    Verify every launch in a launch file, returns a ReplayResult.
+
+    rate - target launches per second over all the processes, as fast as
+        possible if None
+    processes - number of processes, each replays an equal share of the file
+    repeat - number of times each process replays its share
+    '''
+    part_rate = rate / processes if rate else None
+    tasks = [(path, i, processes, part_rate, repeat) for i in range(processes)]
+    if processes == 1:
+        parts = [_replay_part(tasks[0])]
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            parts = pool.map(_replay_part, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    latencies = []
+    outcomes = {}
+    for part_latencies, part_outcomes, elapsed in parts:
+        latencies.extend(part_latencies)
+        for outcome, count in part_outcomes.items():
+            outcomes[outcome] = outcomes.get(outcome, 0) + count
+    latencies.sort()
+    return ReplayResult(latencies, outcomes,
+        max(elapsed for _, _, elapsed in parts))
+
+def _get_module_launches(module_name):
+    '''
+    Returns the launch dicts defined at the top level of a module, such as
+    tests.lti_launch_data.
+    '''
+    module = importlib.import_module(module_name)
+    return [value for name, value in sorted(vars(module).items())
+        if isinstance(value, dict) and 'post_params' in value]
+
+def _print_result(result, out):
+    out.write("%-24s %12d\n" % ("requests", result.get_count()))
+    out.write("%-24s %12.2f\n" % ("elapsed s", result.elapsed))
+    out.write("%-24s %12.0f\n" % ("requests/s", result.get_throughput()))
+    for percentile in [50, 95, 99]:
+        latency = result.get_percentile(percentile)
+        out.write("%-24s %12.3f\n" % ("p%d ms" % percentile,
+            (latency or 0) * 1000))
+    for outcome, count in sorted(result.outcomes.items()):
+        out.write("%-24s %12d\n" % (outcome, count))
+
+def main(argv=None, out=sys.stdout):
+    arg_parser = argparse.ArgumentParser(prog='python -m loadtest',
+        description="Record and replay LTI launches.")
+    commands = arg_parser.add_subparsers(dest='command')
+    commands.required = True
+    record = commands.add_parser('record',
+        help="record the launches defined in a Python module")
+    record.add_argument('output')
+    record.add_argument('module', help="e.g. tests.lti_launch_data")
+    record.add_argument('--redact', action='store_true')
+    record.add_argument('--copies', type=int, default=1,
+        help="times to record each launch")
+    redact = commands.add_parser('redact', help="redact a launch file")
+    redact.add_argument('input')
+    redact.add_argument('output')
+    replay_command = commands.add_parser('replay',
+        help="verify the launches in a launch file and report timings")
+    replay_command.add_argument('input')
+    replay_command.add_argument('--rate', type=float, default=None,
+        help="launches per second, as fast as possible if not given")
+    replay_command.add_argument('--processes', type=int, default=1)
+    replay_command.add_argument('--repeat', type=int, default=1)
+    args = arg_parser.parse_args(argv)
+
+    if args.command == 'replay':
+        _print_result(replay(args.input, args.rate, args.processes,
+            args.repeat), out)
+        return
+    if args.command == 'record':
+        launches = _get_module_launches(args.module) * args.copies
+        redactor = Redactor() if args.redact else None
+    else:
+        launches = read_launches(args.input)
+        redactor = Redactor()
+    with open_launch_file(args.output, 'w') as f:
+        recorder = LaunchRecorder(f, redactor)
+        for launch in launches:
+            recorder.record(launch)
+
+if __name__ == '__main__':
+    main()
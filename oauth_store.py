@@ -1,3 +1,5 @@
+from cache import LRUCache
+
 class OAuthStoreError(Exception):
     pass
 class OAuthStoreSaveError(OAuthStoreError):
@@ -6,7 +8,66 @@ class OAuthStoreSaveError(OAuthStoreError):
     '''
     pass
 
-class OAuthStore:
+# lifetime in seconds of the derived cache of the stores provided here
+DERIVED_CACHE_TTL = 300
+
+class DerivedCacheMixin:
+    '''
+    Keeps values derived from secrets, such as prepared HMAC state, in a
+    bounded cache per store.
+
+    The cache is off unless derived_cache_ttl is set, as is the cache of
+    unknown keys. Only implementations that call secret_changed whenever a
+    secret changes should set it, as otherwise a changed or removed secret
+    keeps being accepted until the values derived from it expire, and a key
+    that's added keeps being rejected until it's no longer cached as unknown.
+    '''
+    # max number of entries and lifetime in seconds of the derived cache,
+    # None for no cache
+    derived_cache_size = 1024
+    derived_cache_ttl = None
+    # max number of entries in the cache of unknown keys
+    unknown_key_cache_size = 4096
+
+    def secret_changed(self, key):
+        '''
+        Drops values derived from secrets, needs to be called whenever the
+        secret for key is changed.
+        '''
+        for cache in [getattr(self, '_derived_cache', None),
+                getattr(self, '_unknown_key_cache', None)]:
+            if cache is not None:
+                cache.clear()
+
+    def get_derived_cache(self):
+        '''
+        Returns the cache for values derived from the secrets in this store,
+        or None if it's off. Entries are keyed by tuples that include the keys
+        they were derived from.
+        '''
+        if self.derived_cache_ttl is None:
+            return None
+        cache = getattr(self, '_derived_cache', None)
+        if cache is None:
+            cache = LRUCache(self.derived_cache_size, self.derived_cache_ttl)
+            self._derived_cache = cache
+        return cache
+
+    def get_unknown_key_cache(self):
+        '''
+        Returns the cache of keys that are known not to be in this store, or
+        None if it's off, see get_derived_cache.
+        '''
+        if self.derived_cache_ttl is None:
+            return None
+        cache = getattr(self, '_unknown_key_cache', None)
+        if cache is None:
+            cache = LRUCache(self.unknown_key_cache_size,
+                self.derived_cache_ttl)
+            self._unknown_key_cache = cache
+        return cache
+
+class OAuthStore(DerivedCacheMixin):
     '''
     Base class for OAuth data storage.
 
@@ -15,6 +76,12 @@ class OAuthStore:
     implementation which stores the data in memory as a dict is provided. More
     complex implementations should inherit from this class and override 
     appropriate methods.
+
+    Values derived from the secrets, such as prepared HMAC state, are kept in a
+    bounded cache per store by the in memory implementation, see
+    DerivedCacheMixin. Implementations only get the cache by setting
+    derived_cache_ttl, and have to call secret_changed whenever a secret
+    changes if they do.
     '''
     def __init__(self):
         '''
@@ -22,12 +89,14 @@ class OAuthStore:
         for the in memory dict implementation.
         '''
         self.secrets = {}
+        self.derived_cache_ttl = DERIVED_CACHE_TTL
 
     def set_secret(self, key, secret):
         '''
         Save a key and secret pair into the database.
         '''
         self.secrets[key] = secret
+        self.secret_changed(key)
 
     def get_secret(self, key):
         '''
@@ -36,6 +105,40 @@ class OAuthStore:
         '''
         return self.secrets.get(key, "")
 
+    def get_secrets(self, key):
+        '''
+        Given a key, return a list of the secrets a request signed with the key
+        may use, in the order they should be tried. There's more than one while
+        the secret is being rotated, this returns the current secret followed
+        by the secrets replaced by rotate_secret.
+        '''
+        return [self.get_secret(key)] + \
+            getattr(self, 'old_secrets', {}).get(key, [])
+
+    def rotate_secret(self, key, secret):
+        '''
+        Replace the secret for key, but keep accepting the old secret until
+        retire_old_secrets is called.
+
+        Only uses get_secret, set_secret and has_key, so it works for any
+        implementation, but the old secrets are kept in this process's memory.
+        Implementations shared between processes should override get_secrets,
+        rotate_secret and retire_old_secrets to keep them in the data store.
+        '''
+        if not hasattr(self, 'old_secrets'):
+            self.old_secrets = {}
+        if self.has_key(key):
+            self.old_secrets[key] = [self.get_secret(key)] + \
+                self.old_secrets.get(key, [])
+        self.set_secret(key, secret)
+
+    def retire_old_secrets(self, key):
+        '''
+        Stop accepting the secrets for key that were replaced by rotate_secret.
+        '''
+        getattr(self, 'old_secrets', {}).pop(key, None)
+        self.secret_changed(key)
+
     def has_key(self, key):
         '''
         Returns true if we know key exists, false otherwise.
@@ -5,43 +5,38 @@ sources:
     - Parameters in the HTTP POST request body (with a content-type of application/x-www-form-urlencoded). 
     - HTTP GET parameters
 """
-from hashlib import sha1
+import base64
+from hashlib import sha1, sha256
 import hmac
 import logging
-import urllib
-import urllib2
-from urlparse import urlparse
+import re
+import time
+from urllib.parse import parse_qsl, unquote, unquote_to_bytes, urlparse
 
+from cache import LRUCache
+from instrumentation import Outcome, Stage
 from validator import Validator
 
 logger = logging.getLogger(__name__)
 
-# LTI common params
-# LTI v1 requires resource_link_id also
-#lti_common_launch_schema = Schema({
-#        Required('lti_message_type'): 'basic-lti-launch-request',
-#        Required('lti_version'): ['LTI-1p0', 'LTI-2p0'],
-#        Required('resource_link_id'): str
-#    },
-#    extra=True
-#)
-#lti_v2_common_schema = Schema({
-#        Required('lti_message_type'): ['basic-lti-launch-request', 'ToolProxyRegistrationRequest'],
-#        Required('lti_version'): 'LTI-2p0'
-#    },
-#    extra=True
-#)
-
 oauth_schema = {
     'oauth_consumer_key': {'required': True},
-    'oauth_signature_method': {'required': True, 'values': ['HMAC-SHA1']},
+    'oauth_signature_method': {'required': True,
+        'values': ['HMAC-SHA1', 'HMAC-SHA256']},
     'oauth_timestamp': {'required': True, 'type': int},
     'oauth_nonce': {'required': True},
     'oauth_signature': {'required': True},
     'oauth_version': {'values': ['1.0']}, # oauth 1.0 specs say this is optional
     'oauth_callback': {}, # ignored by lti, can be any value
-    'oauth_token': {} # ignored by lti, can be any value
+    'oauth_token': {}, # ignored by lti, can be any value
+    'oauth_body_hash': {} # only for bodies that aren't form encoded
 }
+# shared by all requests so the schema is only compiled once
+oauth_validator = Validator(oauth_schema)
+# names of all the OAuth fields
+oauth_fields = tuple(oauth_schema.keys())
+# names of the supported signature methods, see register_signature_method
+signature_methods = oauth_schema['oauth_signature_method']['values']
 
 class LTIParserError(Exception):
     pass
@@ -50,27 +45,598 @@ class SignatureVerificationError(LTIParserError):
 class UnsupportedError(LTIParserError):
     pass
 
+# RFC3986 unreserved characters, the only ones left alone by percent encoding
+_UNRESERVED = b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz' \
+    b'0123456789-._~'
+# the percent encoded form of every byte, indexed by the byte's value
+_PERCENT_ENCODED = [bytes([i]) if i in _UNRESERVED else
+    ('%%%02X' % i).encode('ascii') for i in range(256)]
+
 def _percent_encode(val):
     '''
-    Percent encode strings according to RFC3986.
+    Percent encode strings according to RFC3986, returns bytes.
+
+    Text is encoded to UTF-8 here, which is the only place the signature
+    base string is converted from text, bytes are taken to already be UTF-8
+    and anything else is converted to text first.
 
     Note: Due to url encoding stating that spaces should be encoded to '+' 
-    instead of '%20', we can't use urllib.urlencode.
+    instead of '%20', we can't use urllib.parse.urlencode.
+
+    urllib.parse.quote doesn't have this problem, but it leaves '/' alone and
+    doesn't consider '~' safe even though the OAuth spec lists it as being
+    safe. So every byte is encoded using a table of the RFC3986 encodings
+    instead. Strings with only unreserved characters, which most parameter
+    names and many values are, are returned as is.
+    '''
+    if not isinstance(val, bytes):
+        if not isinstance(val, str):
+            val = str(val)
+        val = val.encode('utf-8')
+    if not val.rstrip(_UNRESERVED):
+        return val
+    return b''.join(map(_PERCENT_ENCODED.__getitem__, val))
+
+# parameter names repeat across requests, so their encoded form is remembered
+_MAX_ENCODED_KEYS = 1024
+_encoded_keys = {}
+
+def _percent_encode_key(key):
+    '''
+    Same as _percent_encode, but remembers the results. Intended for parameter
+    names, which come from a small set.
+    '''
+    encoded = _encoded_keys.get(key)
+    if encoded is None:
+        encoded = _percent_encode(key)
+        if len(_encoded_keys) >= _MAX_ENCODED_KEYS:
+            _encoded_keys.clear()
+        _encoded_keys[key] = encoded
+    return encoded
+
+def _normalize_base_string_prefix(method, url):
+    '''
+    Returns the percent encoded "METHOD&base_uri&" part of the signature base
+    string, which only depends on the request method and url.
+    '''
+    method = _percent_encode(method.upper())
+    url_parts = urlparse(url)
+    # scheme and host part of the url must be lower case
+    base_uri = url_parts.scheme.lower() +'://'+ url_parts.netloc.lower() + \
+        url_parts.path
+    base_uri = _percent_encode(base_uri)
+    return method + b'&' + base_uri + b'&'
+
+# bounded so that deployments with many tenant specific paths can't grow it
+# without limit
+_base_string_prefixes = LRUCache(1024)
+
+def _get_base_string_prefix(method, url):
+    '''
+    Cached version of _normalize_base_string_prefix.
+    '''
+    key = (method, url)
+    prefix = _base_string_prefixes.get(key)
+    if prefix is None:
+        prefix = _normalize_base_string_prefix(method, url)
+        _base_string_prefixes.set(key, prefix)
+    return prefix
+
+def _build_base_string(prefix, get_params, post_params, header_params=None):
+    '''
+    Build the signature base string, given the "METHOD&base_uri&" prefix.
+    header_params are the OAuth params if they were sent in the Authorization
+    header, since they then have to be added to the GET and POST params.
+    '''
+    ## OAuth signature calculation requires that GET, POST, OAuth params
+    ## to be combined and then sorted into order. 
+    ## Problematic: OAuth params can be in HTTP header, so need to add it in.
+    ##  but if OAuth params in GET or POST, will end up with duplicates.
+    ## Edge case: POST and GET can have params with the same names. So have
+    ## to allow that during sorting
+    params = list(get_params.items()) + list(post_params.items())
+    if header_params:
+        params += header_params.items()
+    return _join_base_string(prefix, _encode_params(params))
+
+def _encode_params(params):
+    '''
+    Percent encode the name and value of each (name, value) pair in params,
+    leaving out the signature.
+    '''
+    encoded_params = []
+    for param in params:
+        if param[0] == 'oauth_signature': continue # can't use sig in base
+        param=(_percent_encode_key(param[0]), _percent_encode(param[1]))
+        encoded_params.append(param)
+    return encoded_params
+
+def _join_base_string(prefix, encoded_params):
+    '''
+    Build the signature base string from the "METHOD&base_uri&" prefix and a
+    list of percent encoded (name, value) pairs.
+    '''
+    # sort by byte order, key first, if identical key, then sort by val
+    encoded_params.sort()
+    # concat params into a single string
+    params_str = b'&'.join([name + b'=' + val for name, val in encoded_params])
+    # build base string
+    return prefix + _percent_encode(params_str)
+
+def _make_signing_key(client_secret, token_secret):
+    '''
+    Returns the signing key made from the client and token secrets.
+    '''
+    return _percent_encode(client_secret) + b"&" + \
+        _percent_encode(token_secret)
+
+def _get_signing_keys(oauth_store, client_key, token_key):
+    '''
+    Looks up the client and token secrets and returns the signing keys made
+    from them, one for each candidate client secret, in order.
+    '''
+    token_secret = oauth_store.get_secret(token_key)
+    return [_make_signing_key(client_secret, token_secret)
+        for client_secret in oauth_store.get_secrets(client_key)]
+
+class SignatureMethod:
+    '''
+    Base class for the ways a signature base string can be signed, registered
+    with register_signature_method under the name used in the
+    oauth_signature_method param.
+
+    prepare turns a signing key into whatever the method signs with, e.g. a
+    keyed HMAC object. The result is cached per consumer/token key pair in the
+    OAuth store's derived cache, if it has one, so it's only prepared once per
+    key and is shared by every request made with that key, sign must not
+    change it.
+    '''
+    # the oauth_signature_method param's value
+    name = None
+    # what a well formed signature looks like, a compiled regex
+    signature_format = None
+    # hash used for oauth_body_hash with this method
+    digestmod = sha1
+
+    def prepare(self, signing_key):
+        '''
+        Returns the prepared form of signing_key, which is bytes made from the
+        client and token secrets.
+        '''
+        raise NotImplementedError()
+
+    def sign(self, prepared_key, basestr):
+        '''
+        Returns the base64 encoded signature of basestr as bytes.
+        '''
+        raise NotImplementedError()
+
+    def verify(self, prepared_key, basestr, signature):
+        '''
+        Returns True if signature, as bytes, is the signature of basestr.
+        Methods where verifying isn't just signing again, such as public key
+        ones, should override this.
+        '''
+        return hmac.compare_digest(self.sign(prepared_key, basestr), signature)
+
+class HMACSignatureMethod(SignatureMethod):
+    '''
+    HMAC signatures using digestmod, a hashlib constructor.
+    '''
+    def __init__(self, name, digestmod):
+        self.name = name
+        self.digestmod = digestmod
+        # a base64 encoded digest, with any '=' padding
+        size = digestmod().digest_size
+        padding = -size % 3
+        self.signature_format = re.compile(r'[A-Za-z0-9+/]{%d}%s\Z' %
+            ((size + padding) * 4 // 3 - padding, '=' * padding))
+
+    def prepare(self, signing_key):
+        # keying an HMAC object has to pad and hash the key, so the keyed
+        # object is kept and copied for each signature
+        return hmac.new(signing_key, digestmod=self.digestmod)
+
+    def sign(self, prepared_key, basestr):
+        hashed = prepared_key.copy()
+        hashed.update(basestr)
+        return base64.b64encode(hashed.digest())
+
+# registered signature methods by name
+_signature_methods = {}
+
+def register_signature_method(method):
+    '''
+    Make a SignatureMethod available to every Parser, replacing any method
+    already registered with the same name. Meant to be done at startup,
+    before any requests are verified.
+    '''
+    _signature_methods[method.name] = method
+    if method.name not in signature_methods:
+        signature_methods.append(method.name)
+        oauth_validator.schema_changed()
+
+def get_signature_method(name):
+    '''
+    Returns the registered SignatureMethod called name, or None.
+    '''
+    return _signature_methods.get(name)
+
+register_signature_method(HMACSignatureMethod('HMAC-SHA1', sha1))
+register_signature_method(HMACSignatureMethod('HMAC-SHA256', sha256))
+
+def _get_prepared_key_cache_key(method, client_key, token_key):
+    '''
+    Key for a method's prepared keys in an OAuth store's derived cache. The
+    method itself is part of the key, so a method that's replaced never gets
+    keys prepared by the old one.
+    '''
+    return (method, client_key, token_key)
+
+def _get_prepared_keys(oauth_store, method, client_key, token_key):
+    '''
+    Returns a list of the keys prepared by method from each of the candidate
+    client secrets and the token secret. Returns None if the client key is
+    unknown.
+
+    Prepared keys are cached per method and key pair in the store's derived
+    cache, if it has one. Unknown client keys are cached too by stores with
+    a derived cache, so requests with made up keys don't all reach the store.
+    '''
+    cache = oauth_store.get_derived_cache()
+    cache_key = _get_prepared_key_cache_key(method, client_key, token_key)
+    prepared_keys = None
+    if cache is not None:
+        prepared_keys = cache.get(cache_key)
+    if prepared_keys is None:
+        unknown_keys = oauth_store.get_unknown_key_cache()
+        if unknown_keys is not None and client_key in unknown_keys:
+            return None
+        if not oauth_store.has_key(client_key):
+            if unknown_keys is not None:
+                unknown_keys.set(client_key, True)
+            return None
+        prepared_keys = [method.prepare(signing_key) for signing_key in
+            _get_signing_keys(oauth_store, client_key, token_key)]
+        if cache is not None:
+            cache.set(cache_key, prepared_keys)
+    return prepared_keys
+
+def _is_well_formed(method, oauth_params):
+    '''
+    Returns True if the signature could have been made with the request's
+    signature method.
+    '''
+    return method.signature_format is None or \
+        method.signature_format.match(oauth_params.get_signature()) is not None
+
+def _match_signature(method, prepared_keys, basestr, expected_sig):
+    '''
+    Returns the index of the key in prepared_keys that signs basestr with
+    expected_sig, or None if none of them do. The base string is only built
+    once no matter how many candidate secrets there are.
+    '''
+    if not isinstance(expected_sig, bytes):
+        expected_sig = expected_sig.encode('utf-8')
+    for index, prepared_key in enumerate(prepared_keys):
+        if method.verify(prepared_key, basestr, expected_sig):
+            return index
+    return None
+
+def _get_header_params(oauth_params):
+    '''
+    Returns the OAuth params that have to be added to the base string because
+    they were sent in the Authorization header, or None.
+    '''
+    if oauth_params.isInHttpHeader():
+        return oauth_params.get()
+    return None
+
+# listeners registered with Parser.add_listener. Replaced rather than changed
+# in place, so a verification can keep using the list it started with.
+_listeners = []
+
+class _StageTimer:
+    '''
+    Times consecutive stages of a verification and reports them to listeners.
+    '''
+    def __init__(self, listeners):
+        self.listeners = listeners
+        self.start = time.perf_counter()
+
+    def stage(self, stage):
+        '''
+        Report that stage finished, it's assumed to have started when the
+        previous stage finished.
+        '''
+        now = time.perf_counter()
+        _notify(self.listeners, 'stage_finished', stage, now - self.start)
+        self.start = now
+
+def _start_timer():
+    '''
+    Returns a _StageTimer for a verification that's starting, or None if there
+    are no listeners.
+    '''
+    listeners = _listeners
+    if not listeners:
+        return None
+    return _StageTimer(listeners)
+
+def _notify(listeners, method, *args):
+    '''
+    Call method on every listener, a failing listener mustn't affect the
+    verification.
+    '''
+    for listener in listeners:
+        try:
+            getattr(listener, method)(*args)
+        except Exception:
+            logger.exception("Verification listener failed.")
+
+def _locate_oauth_params(http_headers, get_params, post_params):
+    '''
+    Same as OAuthParams(http_headers, get_params, post_params), but reports
+    to the listeners if there are any.
+    '''
+    listeners = _listeners
+    if not listeners:
+        return OAuthParams(http_headers, get_params, post_params)
+    timer = _StageTimer(listeners)
+    try:
+        oauth_params = OAuthParams(http_headers, get_params, post_params)
+    except SignatureVerificationError:
+        _notify(listeners, 'outcome', _get_locate_outcome(http_headers,
+            get_params, post_params))
+        raise
+    timer.stage(Stage.LOCATE_OAUTH_PARAMS)
+    return oauth_params
+
+def _get_locate_outcome(http_headers, get_params, post_params):
+    '''
+    Returns the Outcome of a request whose OAuth params couldn't be located,
+    the signature method isn't supported or an OAuth field is missing.
+    '''
+    outcome = Outcome.MISSING_OAUTH_FIELDS
+    for params in [post_params, _parse_auth_header(http_headers),
+            get_params]:
+        method = params.get('oauth_signature_method')
+        if method is not None and method not in signature_methods:
+            outcome = Outcome.UNSUPPORTED_METHOD
+    return outcome
+
+# returned by _CacheLookup.get_index when there's no usable cached check
+_NOT_CACHED = object()
+
+def _get_result_cache_key(http_headers, get_params, post_params):
+    '''
+    Returns the (consumer key, nonce, signature) that a request is cached
+    under in a VerifiedResultCache, taken from wherever the signature is
+    without checking the OAuth params. None if there's no signature.
+    '''
+    for params in [post_params, get_params, None]:
+        if params is None: # only parse the header if it has to be
+            params = _parse_auth_header(http_headers)
+        signature = params.get('oauth_signature')
+        if signature is not None:
+            return (params.get('oauth_consumer_key'),
+                params.get('oauth_nonce'), signature)
+    return None
+
+class _CacheLookup:
+    '''
+    Looks up a request in a VerifiedResultCache, and caches its signature
+    check if it wasn't found.
+
+    request - everything the signature check depends on, a tuple that's
+        compared with the cached request, dicts in it are copied when cached
+    '''
+    def __init__(self, result_cache, key, request):
+        self.result_cache = result_cache
+        self.key = key
+        self.request = request
+        # (oauth_params, prepared_keys, index) of an equal request, or None
+        self.entry = None
+        if key is not None:
+            self.entry = result_cache.get(key, request)
+
+    def get_oauth_params(self):
+        '''
+        Returns the cached OAuthParams of the request, or None.
+        '''
+        if self.entry is None:
+            return None
+        return self.entry[0]
+
+    def get_index(self, prepared_keys):
+        '''
+        Returns the cached result of _match_signature, or _NOT_CACHED. The
+        result can only be reused if it was for the same prepared keys,
+        changing a secret replaces them.
+        '''
+        if self.entry is None or self.entry[1] is not prepared_keys:
+            return _NOT_CACHED
+        return self.entry[2]
+
+    def set_index(self, oauth_params, prepared_keys, index):
+        '''
+        Cache the result of _match_signature for the request.
+        '''
+        if self.key is None:
+            return
+        request = tuple(dict(part) if isinstance(part, dict) else part
+            for part in self.request)
+        self.result_cache.set(self.key, request,
+            (oauth_params, prepared_keys, index))
+
+def _verify_oauth_params(oauth_params, oauth_store, replay_guard,
+        make_base_string, cache_lookup=None, limiter=None):
+    '''
+    Check that the OAuth signature is valid. Returns a tuple of the Outcome
+    and the index of the client secret that matched, which is None unless the
+    outcome is Outcome.VALID.
+
+    Checks are done cheapest first and the first failing check rejects the
+    request, so the base string is only built, by calling make_base_string,
+    and the signature only calculated for requests that pass all the others:
+    - the OAuth params were found and valid, see OAuthParams
+    - the consumer key is known to the oauth_store
+    - the consumer key is within its limit, if there is a limiter
+    - the timestamp is within the replay_guard's window, if there is one
+    - the signature is well formed for the signature method
+    - the nonce wasn't already used, if there is a replay_guard
+
+    cache_lookup is an optional _CacheLookup, a cached signature check found
+    by it is used instead of building the base string and checking the
+    signature.
+    '''
+    timer = _start_timer()
+    method = _signature_methods[oauth_params.oauth_signature_method]
+    prepared_keys = _get_prepared_keys(oauth_store, method,
+        oauth_params.get_client_key(), oauth_params.get_token_key())
+    if timer: timer.stage(Stage.SECRET_LOOKUP)
+    return _check_oauth_params(oauth_params, prepared_keys, replay_guard,
+        make_base_string, cache_lookup, limiter, timer)
+
+def _check_oauth_params(oauth_params, prepared_keys, replay_guard,
+        make_base_string, cache_lookup=None, limiter=None, timer=None):
+    '''
+    The checks of _verify_oauth_params that come after the prepared keys were
+    looked up, for callers that look them up themselves. prepared_keys is
+    None if the consumer key is unknown. timer is the verification's
+    _StageTimer, see _start_timer, the result is reported to its listeners.
+    '''
+    index = None
+    client_key = oauth_params.get_client_key()
+    method = _signature_methods[oauth_params.oauth_signature_method]
+    if prepared_keys is None:
+        outcome = Outcome.UNKNOWN_CONSUMER_KEY
+    elif limiter is not None and not limiter.admit(client_key):
+        outcome = Outcome.THROTTLED
+    elif replay_guard is not None and not replay_guard.is_timely(oauth_params):
+        outcome = Outcome.STALE_TIMESTAMP
+    elif not _is_well_formed(method, oauth_params):
+        outcome = Outcome.MALFORMED_SIGNATURE
+    elif replay_guard is not None and not replay_guard.is_new(oauth_params):
+        outcome = Outcome.REPLAYED
+    else:
+        index = _NOT_CACHED
+        if cache_lookup is not None:
+            index = cache_lookup.get_index(prepared_keys)
+        if index is _NOT_CACHED:
+            basestr = make_base_string()
+            if timer: timer.stage(Stage.BASE_STRING)
+            index = _match_signature(method, prepared_keys, basestr,
+                oauth_params.get_signature())
+            if timer: timer.stage(Stage.HMAC)
+            if cache_lookup is not None:
+                cache_lookup.set_index(oauth_params, prepared_keys, index)
+        if index is None:
+            outcome = Outcome.SIGNATURE_MISMATCH
+        elif replay_guard is not None and not replay_guard.record(oauth_params):
+            outcome = Outcome.REPLAYED
+            index = None
+        else:
+            outcome = Outcome.VALID
+    if timer:
+        if index is not None:
+            _notify(timer.listeners, 'secret_matched', client_key, index)
+        _notify(timer.listeners, 'outcome', outcome)
+    return outcome, index
+
+def _verify_signature(prefix, oauth_store, http_headers, get_params,
+        post_params, replay_guard=None, result_cache=None, limiter=None):
+    '''
+    Check that the OAuth signature is valid, given the "METHOD&base_uri&" prefix
+    of the signature base string. Returns the same as _verify_oauth_params.
+    '''
+    cache_lookup = None
+    oauth_params = None
+    if result_cache is not None:
+        cache_lookup = _CacheLookup(result_cache,
+            _get_result_cache_key(http_headers, get_params, post_params),
+            (prefix, http_headers.get('Authorization'), get_params,
+                post_params))
+        oauth_params = cache_lookup.get_oauth_params()
+    if oauth_params is None:
+        oauth_params = _locate_oauth_params(http_headers, get_params,
+            post_params)
+    return _verify_oauth_params(oauth_params, oauth_store, replay_guard,
+        lambda: _build_base_string(prefix, get_params, post_params,
+            _get_header_params(oauth_params)), cache_lookup, limiter)
+
+# maps every part of a form encoded string that isn't in canonical RFC3986
+# form to its canonical form: '+' is a space, hex digits in escapes are upper
+# case, unreserved characters are never escaped and everything else is
+_NON_CANONICAL = re.compile(br'%[0-9A-Fa-f]{2}|[^A-Za-z0-9._~-]')
+_CANONICAL = dict((bytes([_i]), _PERCENT_ENCODED[_i]) for _i in range(256))
+_CANONICAL[b'+'] = b'%20'
+for _i in range(256):
+    for _high in set('%X%x' % (_i >> 4, _i >> 4)):
+        for _low in set('%X%x' % (_i & 15, _i & 15)):
+            _CANONICAL[('%' + _high + _low).encode('ascii')] = \
+                _PERCENT_ENCODED[_i]
+del _i, _high, _low
+
+def _replace_non_canonical(match):
+    return _CANONICAL[match.group()]
+
+def _normalize_encoded(token):
+    '''
+    Returns the canonical percent encoded form of a form encoded token, which
+    is what _percent_encode would give for the decoded token, without having
+    to decode it.
+    '''
+    return _NON_CANONICAL.sub(_replace_non_canonical, token)
+
+def _split_form(raw):
+    '''
+    Split application/x-www-form-urlencoded data into a list of still encoded
+    (name, value) pairs.
+    '''
+    pairs = []
+    for field in raw.split(b'&'):
+        if not field: continue
+        name, sep, val = field.partition(b'=')
+        pairs.append((name, val))
+    return pairs
+
+def _normalize_pairs(pairs):
+    '''
+    Bring a list of encoded (name, value) pairs into canonical form.
+    '''
+    return [(_normalize_encoded(name), _normalize_encoded(val))
+        for name, val in pairs]
+
+def _unquote_plus(token):
+    '''
+    Decode a form encoded token into text.
+    '''
+    return unquote_to_bytes(token.replace(b'+', b' ')).decode('utf-8',
+        'replace')
 
-    urllib.quote doesn't have this problem, but it does leave '/' alone, we
-    want '/' to be encoded too. So an additional parameter has to be passed 
-    in to take '/' off the safe list.
+def _decode_oauth_fields(pairs):
+    '''
+    Decode only the OAuth fields in a list of encoded (name, value) pairs.
+    '''
+    return {_unquote_plus(name): _unquote_plus(val)
+        for name, val in pairs if name.startswith(b'oauth_')}
 
-    Also need to add '~' to the safe list, since apparently that's not considered
-    safe by Python but the OAuth spec lists it as being safe.
+def _to_raw_bytes(raw):
+    '''
+    Returns the raw query string or body as bytes. Text is taken to be bytes
+    decoded as latin-1, like QUERY_STRING in a WSGI environ.
     '''
-    return urllib.quote(str(val), '~')
+    if isinstance(raw, str):
+        return raw.encode('latin-1')
+    return raw
 
-class Parser:
+class Parser(object):
     '''
     Parses LTI requests.
     '''
-    def __init__(self, method, url, http_headers, get_params, post_params, oauth_store):
+    def __init__(self, method, url, http_headers, get_params, post_params, oauth_store,
+            replay_guard=None, result_cache=None, limiter=None):
         '''
         url - the url of of the LTI request target, must include http/https, does
             not include GET params, e.g.: http://example.com/some/path
@@ -78,6 +644,11 @@ class Parser:
         http_headers - http headers stored in a dict
         get_params - GET parameters stored in a dict
         post_params - POST parameters stored in a dict
+        replay_guard - optional replay.ReplayGuard, checks timestamps and nonces
+        result_cache - optional cache.VerifiedResultCache, shared by requests
+            so that resubmitted ones aren't checked all over again
+        limiter - optional admission.TokenBucketLimiter, limits the requests
+            verified per consumer key
         '''
         self.method = method
         self.url = url
@@ -85,61 +656,299 @@ class Parser:
         self.get_params = get_params
         self.post_params = post_params
         self.oauth_store = oauth_store
+        self.replay_guard = replay_guard
+        self.result_cache = result_cache
+        self.limiter = limiter
+        # index of the candidate client secret that matched in the last
+        # verify_signature call, None if it failed
+        self.matched_secret_index = None
+        # why the last verify_signature call failed, an
+        # instrumentation.Outcome, None if it didn't
+        self.rejection_reason = None
+
+    @staticmethod
+    def add_listener(listener):
+        '''
+        Register an instrumentation.Listener to be told about the stages and
+        outcome of every verification, from any Parser or PreparedVerifier.
+        '''
+        global _listeners
+        _listeners = _listeners + [listener]
+
+    @staticmethod
+    def remove_listener(listener):
+        '''
+        Unregister a listener registered with add_listener.
+        '''
+        global _listeners
+        _listeners = [x for x in _listeners if x is not listener]
+
+    @staticmethod
+    def from_raw(method, url, http_headers, query_bytes, body_bytes,
+            oauth_store, replay_guard=None, result_cache=None, limiter=None):
+        '''
+        Returns a parser for a request where the GET and POST params haven't
+        been parsed yet, see RawParser.
+        '''
+        return RawParser(method, url, http_headers, query_bytes, body_bytes,
+            oauth_store, replay_guard, result_cache, limiter)
 
     def verify_signature(self):
         """
         Check that the OAuth signature is valid. LTI uses OAuth 1.0 signing.
         """
-        oauth_params = OAuthParams(
-                self.http_headers, self.get_params, self.post_params)
-        # build the signature base string
-        method = _percent_encode(self.method.upper())
-        url_parts = urlparse(self.url)
-        # scheme and host part of the url must be lower case
-        base_uri = url_parts.scheme.lower() +'://'+ url_parts.netloc.lower() + \
-            url_parts.path
-        base_uri = _percent_encode(base_uri)
-        ## OAuth signature calculation requires that GET, POST, OAuth params
-        ## to be combined and then sorted into order. 
-        ## Problematic: OAuth params can be in HTTP header, so need to add it in.
-        ##  but if OAuth params in GET or POST, will end up with duplicates.
-        ## Edge case: POST and GET can have params with the same names. So have
-        ## to allow that during sorting
-        params = self.get_params.items() + self.post_params.items()
-        if oauth_params.isInHttpHeader():
-            params += oauth_params.get().items()
-        # percent encode the name and value of each parameter
-        encoded_params = []
-        for param in params:
-            if param[0] == 'oauth_signature': continue # can't use sig in base
-            param=(_percent_encode(param[0]), _percent_encode(param[1]))
-            encoded_params.append(param)
-        # sort by byte order, key first, if identical key, then sort by val
-        encoded_params.sort()
-        # concat params into a single string
-        params_str = ""
-        for param in encoded_params:
-            if params_str:
-                params_str += '&'
-            params_str += param[0] + '=' + param[1]
-        # build base string
-        basestr = method +'&'+ base_uri +'&'+ _percent_encode(params_str)
-
-        client_secret=self.oauth_store.get_secret(oauth_params.get_client_key())
-        token_secret = self.oauth_store.get_secret(oauth_params.get_token_key())
-        client_secret = _percent_encode(client_secret)
-        token_secret = _percent_encode(token_secret)
-
-        secret = client_secret + "&" + token_secret
-        hashed = hmac.new(secret, basestr, sha1)
-        # The signature
-        actual_sig = hashed.digest().encode("base64").rstrip('\n')
-        expected_sig = oauth_params.get_signature()
-        if actual_sig == expected_sig:
+        self._reset_result()
+        prefix = _get_base_string_prefix(self.method, self.url)
+        try:
+            result = _verify_signature(prefix, self.oauth_store,
+                self.http_headers, self.get_params, self.post_params,
+                self.replay_guard, self.result_cache, self.limiter)
+        except SignatureVerificationError:
+            self.rejection_reason = _get_locate_outcome(self.http_headers,
+                self.get_params, self.post_params)
+            raise
+        return self._set_result(result)
+
+    def _reset_result(self):
+        '''
+        Forget the result of the last verification, so that it isn't left
+        behind if this one raises.
+        '''
+        self.matched_secret_index = None
+        self.rejection_reason = None
+
+    def _set_result(self, result):
+        '''
+        Keep the outcome and secret index returned by _verify_oauth_params,
+        returns True if the signature is valid.
+        '''
+        outcome, self.matched_secret_index = result
+        if outcome == Outcome.VALID:
+            self.rejection_reason = None
             return True
+        self.rejection_reason = outcome
         return False
 
-class OAuthParams:
+    def get_launch_request(self):
+        """
+        Check the launch params against the LTI launch schema, returns a
+        launch.LaunchRequest. Raises launch.InvalidLaunchError if they don't
+        match. Doesn't verify the signature.
+
+        The GET and POST params are merged, POST params taking precedence,
+        since some consumers such as webwork send the launch as a GET.
+        """
+        from launch import parse_launch
+        params = dict(self.get_params)
+        params.update(self.post_params)
+        return parse_launch(params)
+
+    def verify_body_hash(self, body):
+        """
+        Check that the request body matches the oauth_body_hash param, used
+        by LTI services such as Basic Outcomes whose bodies aren't form
+        encoded. body can be bytes, a file like object or an iterable of
+        chunks, see signer.make_body_hash. The signature still has to be
+        checked with verify_signature.
+        """
+        from signer import BODY_HASH_CHUNK_SIZE, verify_body_hash
+        oauth_params = OAuthParams(self.http_headers, self.get_params,
+            self.post_params)
+        method = _signature_methods[oauth_params.oauth_signature_method]
+        return verify_body_hash(oauth_params.oauth_body_hash, body,
+            BODY_HASH_CHUNK_SIZE, method.digestmod)
+
+    def verify_signature_async(self, executor=None, hmac_threshold=None):
+        """
+        Asyncio version of verify_signature, returns an awaitable. The
+        oauth_store has to be an async_parser.AsyncOAuthStore.
+
+        executor - where the signature of large requests is checked, defaults
+            to the event loop's default executor
+        hmac_threshold - requests whose params add up to at least this many
+            characters have their signature checked in the executor instead
+            of the event loop
+        """
+        from async_parser import verify_signature_async
+        return verify_signature_async(self, executor, hmac_threshold)
+
+class RawParser(Parser):
+    '''
+    Parses LTI requests straight from the raw query string and body.
+
+    The signature is verified from the encoded params, which only have to be
+    brought into canonical form instead of being decoded and encoded again.
+    get_params and post_params are only decoded if they're asked for.
+    '''
+    def __init__(self, method, url, http_headers, query_bytes, body_bytes,
+            oauth_store, replay_guard=None, result_cache=None, limiter=None):
+        '''
+        query_bytes - the query string of the request, without the '?'
+        body_bytes - the request body, must be
+            application/x-www-form-urlencoded, pass b'' if it isn't
+        The rest are the same as for Parser.
+        '''
+        self.method = method
+        self.url = url
+        self.http_headers = http_headers
+        self.query_bytes = _to_raw_bytes(query_bytes)
+        self.body_bytes = _to_raw_bytes(body_bytes)
+        self.oauth_store = oauth_store
+        self.replay_guard = replay_guard
+        self.result_cache = result_cache
+        self.limiter = limiter
+        self.matched_secret_index = None
+        self.rejection_reason = None
+        self._get_params = None
+        self._post_params = None
+
+    @property
+    def get_params(self):
+        '''
+        GET parameters decoded into a dict.
+        '''
+        if self._get_params is None:
+            self._get_params = dict(parse_qsl(
+                self.query_bytes.decode('utf-8', 'replace'), True))
+        return self._get_params
+
+    @property
+    def post_params(self):
+        '''
+        POST parameters decoded into a dict.
+        '''
+        if self._post_params is None:
+            self._post_params = dict(parse_qsl(
+                self.body_bytes.decode('utf-8', 'replace'), True))
+        return self._post_params
+
+    def verify_signature(self):
+        """
+        Check that the OAuth signature is valid. LTI uses OAuth 1.0 signing.
+        """
+        self._reset_result()
+        prefix = _get_base_string_prefix(self.method, self.url)
+        query_pairs = _split_form(self.query_bytes)
+        body_pairs = _split_form(self.body_bytes)
+        query_oauth = _decode_oauth_fields(query_pairs)
+        body_oauth = _decode_oauth_fields(body_pairs)
+        cache_lookup = None
+        oauth_params = None
+        if self.result_cache is not None:
+            # the raw query string and body are compared, not the params
+            cache_lookup = _CacheLookup(self.result_cache,
+                _get_result_cache_key(self.http_headers, query_oauth,
+                    body_oauth),
+                (prefix, self.http_headers.get('Authorization'),
+                    self.query_bytes, self.body_bytes))
+            oauth_params = cache_lookup.get_oauth_params()
+        if oauth_params is None:
+            try:
+                oauth_params = _locate_oauth_params(self.http_headers,
+                    query_oauth, body_oauth)
+            except SignatureVerificationError:
+                self.rejection_reason = _get_locate_outcome(
+                    self.http_headers, query_oauth, body_oauth)
+                raise
+        def make_base_string():
+            encoded_params = [param for param in
+                _normalize_pairs(query_pairs + body_pairs)
+                if param[0] != b'oauth_signature']
+            header_params = _get_header_params(oauth_params)
+            if header_params:
+                encoded_params += _encode_params(header_params.items())
+            return _join_base_string(prefix, encoded_params)
+        return self._set_result(_verify_oauth_params(oauth_params,
+            self.oauth_store, self.replay_guard, make_base_string,
+            cache_lookup, self.limiter))
+
+class PreparedVerifier:
+    '''
+    Verifies LTI requests that all go to the same launch endpoint.
+
+    The method and url dependent part of the signature base string is built
+    once when the verifier is created and then reused for every request.
+    '''
+    def __init__(self, method, url, oauth_store, replay_guard=None,
+            result_cache=None, limiter=None):
+        '''
+        method, url, replay_guard, result_cache and limiter are the same as
+        for Parser.
+        '''
+        self.method = method
+        self.url = url
+        self.oauth_store = oauth_store
+        self.replay_guard = replay_guard
+        self.result_cache = result_cache
+        self.limiter = limiter
+        self.prefix = _normalize_base_string_prefix(method, url)
+
+    def verify_signature(self, http_headers, get_params, post_params):
+        """
+        Check that the OAuth signature of a request to this endpoint is valid.
+        """
+        outcome, index = self.check_signature(http_headers, get_params,
+            post_params)
+        return outcome == Outcome.VALID
+
+    def check_signature(self, http_headers, get_params, post_params):
+        """
+        Same as verify_signature, but returns a tuple of the Outcome and the
+        index of the client secret that matched, which is None unless the
+        outcome is Outcome.VALID. These are what Parser keeps in
+        rejection_reason and matched_secret_index, a verifier can't keep them
+        since it's shared by concurrent requests.
+        """
+        return _verify_signature(self.prefix, self.oauth_store, http_headers,
+            get_params, post_params, self.replay_guard, self.result_cache,
+            self.limiter)
+
+# a key=value or key="value" param in the Authorization header
+_auth_param = re.compile(r'([^\s=,]+)\s*=\s*(?:"([^"]*)"|([^\s,]*))')
+
+def _parse_auth_header(http_headers):
+    '''
+    Returns the OAuth parameters in the Authorization header as a dict, or an
+    empty dict if there's no Authorization header.
+    '''
+    if not "Authorization" in http_headers:
+        return {}
+    auth_val = http_headers["Authorization"]
+    if not isinstance(auth_val, str): # already parsed
+        return dict(auth_val)
+    # have to parse the auth header values, in a single pass over the header
+    auth_params = {}
+    for match in _auth_param.finditer(auth_val):
+        key, quoted_val, val = match.groups()
+        if quoted_val is not None:
+            val = quoted_val
+        # since these are raw headers, need to percent decode them
+        if '%' in key:
+            key = unquote(key)
+        if not key.startswith('oauth_'):
+            continue # realm and non OAuth params aren't needed
+        if '%' in val:
+            val = unquote(val)
+        auth_params[key] = val
+    return auth_params
+
+def _extract_oauth_fields(params):
+    '''
+    Copy only the OAuth fields out of params and check them against the OAuth
+    schema. Returns the validated OAuth fields, or None if params doesn't
+    contain a valid set of them. params itself is never modified.
+    '''
+    if not params:
+        return None
+    fields = {}
+    for name in oauth_fields:
+        if name in params:
+            fields[name] = params[name]
+    if oauth_validator.validate(fields):
+        return fields
+    return None
+
+class OAuthParams(object):
     '''
     Retrives the OAuth parameters from wherever it's located.
     
@@ -156,59 +965,62 @@ class OAuthParams:
     - POST body
     - GET request - this is technically not in spec, not sure if we should
         support it except that webwork uses it
+
+    Each source is checked at most once, in that order, and only for the
+    OAuth fields. The first source with a valid set of OAuth fields wins.
+    Instances are immutable, each OAuth field is stored in the attribute of
+    the same name, or None if the field wasn't present.
     '''
+    __slots__ = oauth_fields + ('found_in_http_headers',)
+
     def __init__(self, http_headers, get_params, post_params):
-        self.oauth_params = {}
-        self.found_in_http_headers = False # True if OAuth params in http headers
-        validator = Validator(oauth_schema)
-        auth_params = []
-        if "Authorization" in http_headers:
-            auth_val = http_headers["Authorization"]
-            if isinstance(auth_val, list):
-                auth_params = auth_val
-            else: # have to parse the auth header values into a list
-                auth_params = urllib2.parse_http_list(auth_val)
-                auth_params = urllib2.parse_keqv_list(auth_params)
-                # since these are raw headers, need to percent decode them
-                auth_params = { urllib.unquote(key) : urllib.unquote(val) 
-                        for key, val in auth_params.items() }
-        # find out which set of params has OAuth fields in them
-        oauth_params = None
-        if validator.validate(post_params):
-            oauth_params = post_params
-        elif auth_params and validator.validate(auth_params):
-            oauth_params = auth_params
-            self.found_in_http_headers = True
-        elif validator.validate(get_params):
-            oauth_params = get_params
-        else:
-            raise SignatureVerificationError("Could not locate OAuth fields.")
-        # filter out non-oauth fields
-        self.oauth_params = {x: oauth_params[x] for x in validator.get_fields() 
-                if x in oauth_params}
+        found_in_http_headers = False # True if OAuth params in http headers
+        fields = _extract_oauth_fields(post_params)
+        if fields is None:
+            fields = _extract_oauth_fields(_parse_auth_header(http_headers))
+            if fields is not None:
+                found_in_http_headers = True
+            else:
+                fields = _extract_oauth_fields(get_params)
+                if fields is None:
+                    raise SignatureVerificationError(
+                        "Could not locate OAuth fields.")
+        init = super(OAuthParams, self).__setattr__
+        for name in oauth_fields:
+            init(name, fields.get(name))
+        init('found_in_http_headers', found_in_http_headers)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("OAuthParams is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("OAuthParams is immutable")
 
     def get(self):
         '''
         Returns all the OAuth parameters
         '''
-        return self.oauth_params
+        return {name: getattr(self, name) for name in oauth_fields
+                if getattr(self, name) is not None}
     def get_signature(self):
         '''
         Returns the signature string.
         '''
-        return self.oauth_params['oauth_signature']
+        return self.oauth_signature
     def get_client_key(self):
         '''
         Returns the oauth consumer key, this is the key to the client shared
         secret that is used to calculate the signature.
         '''
-        return self.oauth_params['oauth_consumer_key']
+        return self.oauth_consumer_key
     def get_token_key(self):
         '''
         Returns the oauth token key, which is used to retrieve the token secret
         that is used to calculate the signature.
         '''
-        return self.oauth_params.get('oauth_token', '')
+        if self.oauth_token is None:
+            return ''
+        return self.oauth_token
 
     def isInHttpHeader(self):
         return self.found_in_http_headers
@@ -0,0 +1,129 @@
+"""
+Replay protection for OAuth signed requests.
+
+OAuth 1.0 requires that a request's timestamp is recent and that a nonce is
+never reused with the same consumer key and timestamp. ReplayGuard does both
+checks, with the nonces kept in a NonceStore.
+"""
+import threading
+import time
+
+class NonceStore:
+    '''
+    Base class for nonce storage.
+
+    Keeps track of the (consumer key, timestamp, nonce) combinations that have
+    already been used. The in memory implementation, MemoryNonceStore, only
+    works within a single process, implementations that share nonces between
+    servers should inherit from this class and override both methods.
+    '''
+    def seen(self, consumer_key, timestamp, nonce):
+        '''
+        Returns True if the nonce has already been used, or if the store can
+        no longer tell whether it was used.
+        '''
+        raise NotImplementedError()
+
+    def add(self, consumer_key, timestamp, nonce):
+        '''
+        Record that the nonce was used. Returns False if it was already seen,
+        this check and the recording must be atomic.
+        '''
+        raise NotImplementedError()
+
+class MemoryNonceStore(NonceStore):
+    '''
+    Keeps nonces in memory, grouped into buckets by timestamp so that whole
+    buckets can be dropped at once when they fall out of the window.
+
+    window - seconds that a nonce needs to be kept for
+    max_size - max number of nonces kept, when full, the oldest bucket is
+        dropped and timestamps in it are treated as already seen from then on
+    bucket_size - range of timestamps, in seconds, grouped into one bucket
+    '''
+    def __init__(self, window=300, max_size=100000, bucket_size=10):
+        self.window = window
+        self.max_size = max_size
+        self.bucket_size = bucket_size
+        self._buckets = {}
+        self._size = 0
+        # can't tell if nonces older than this were used, their bucket was
+        # dropped to keep within max_size
+        self._min_timestamp = 0
+        # buckets older than this have already been dropped
+        self._expired_before = 0
+        self._lock = threading.Lock()
+
+    def seen(self, consumer_key, timestamp, nonce):
+        if timestamp < self._min_timestamp:
+            return True
+        bucket = self._buckets.get(timestamp // self.bucket_size)
+        return bucket is not None and \
+            (consumer_key, timestamp, nonce) in bucket
+
+    def add(self, consumer_key, timestamp, nonce):
+        with self._lock:
+            self._expire(time.time())
+            if self.seen(consumer_key, timestamp, nonce):
+                return False
+            bucket_id = timestamp // self.bucket_size
+            bucket = self._buckets.get(bucket_id)
+            if bucket is None:
+                bucket = self._buckets[bucket_id] = set()
+            bucket.add((consumer_key, timestamp, nonce))
+            self._size += 1
+            while self._size > self.max_size:
+                oldest = min(self._buckets)
+                self._size -= len(self._buckets.pop(oldest))
+                self._min_timestamp = (oldest + 1) * self.bucket_size
+            return True
+
+    def _expire(self, now):
+        '''
+        Drop the buckets that are entirely older than the window.
+        '''
+        cutoff = int(now - self.window) // self.bucket_size
+        if cutoff <= self._expired_before:
+            return
+        for bucket_id in [b for b in self._buckets if b < cutoff]:
+            self._size -= len(self._buckets.pop(bucket_id))
+        self._expired_before = cutoff
+
+    def __len__(self):
+        return self._size
+
+class ReplayGuard:
+    '''
+    Rejects requests with a timestamp outside of the window or a nonce that was
+    already used.
+
+    window - max number of seconds a request's timestamp can differ from the
+        current time, in either direction to allow for clock skew
+    nonce_store - where used nonces are kept, defaults to a MemoryNonceStore
+    '''
+    def __init__(self, window=300, nonce_store=None):
+        self.window = window
+        if nonce_store is None:
+            nonce_store = MemoryNonceStore(window)
+        self.nonce_store = nonce_store
+
+    def is_timely(self, oauth_params):
+        '''
+        Returns False if the request's timestamp is outside the window.
+        '''
+        return abs(time.time() - oauth_params.oauth_timestamp) <= self.window
+
+    def is_new(self, oauth_params):
+        '''
+        Returns False if the request's nonce was already used.
+        '''
+        return not self.nonce_store.seen(oauth_params.get_client_key(),
+            oauth_params.oauth_timestamp, oauth_params.oauth_nonce)
+
+    def record(self, oauth_params):
+        '''
+        Record the request's nonce once its signature has been verified.
+        Returns False if another request with the same nonce got there first.
+        '''
+        return self.nonce_store.add(oauth_params.get_client_key(),
+            oauth_params.oauth_timestamp, oauth_params.oauth_nonce)
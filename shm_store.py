@@ -0,0 +1,361 @@
+"""
+Secret and nonce caches in shared memory, for pre-fork servers such as
+gunicorn where every worker process would otherwise keep its own.
+
+Both are fixed size hash tables in an anonymous shared mmap. They have to be
+created before the workers are forked, e.g. with gunicorn's preload_app, so
+that every worker inherits the same memory and locks.
+"""
+from hashlib import blake2b
+import mmap
+import multiprocessing
+import struct
+import time
+
+from oauth_store import DERIVED_CACHE_TTL, OAuthStore
+from replay import NonceStore
+
+# cached in place of the secrets for keys that aren't in the backing store
+_UNKNOWN = object()
+
+class _SharedTable:
+    '''
+    A hash table of fixed size slots in shared memory.
+
+    The table is split into buckets of ways slots, a key can only be stored
+    in the bucket its hash points to, so a lookup only has to look at that
+    bucket and a full bucket only has to evict one of its own slots. Each
+    bucket starts with a header of header_size bytes. Buckets are guarded by
+    stripes locks, bucket i by lock i % stripes.
+    '''
+    def __init__(self, capacity, ways, header_size, slot_size, stripes):
+        self.ways = ways
+        self.num_buckets = max(1, capacity // ways)
+        self.header_size = header_size
+        self.slot_size = slot_size
+        self.bucket_size = header_size + ways * slot_size
+        self.mmap = mmap.mmap(-1, self.num_buckets * self.bucket_size)
+        self.locks = [multiprocessing.Lock() for i in range(stripes)]
+
+    def get_bucket(self, digest):
+        '''
+        Returns the bucket number for a key's digest.
+        '''
+        return int.from_bytes(digest[:8], 'little') % self.num_buckets
+
+    def get_lock(self, bucket):
+        return self.locks[bucket % len(self.locks)]
+
+    def get_offset(self, bucket, way=None):
+        '''
+        Returns the offset of the bucket's header, or of one of its slots.
+        '''
+        offset = bucket * self.bucket_size
+        if way is None:
+            return offset
+        return offset + self.header_size + way * self.slot_size
+
+def _digest(data):
+    return blake2b(data, digest_size=16).digest()
+
+def _pack_secrets(secrets):
+    '''
+    Pack a list of secrets into bytes, each prefixed with its length.
+    '''
+    packed = []
+    for secret in secrets:
+        secret = secret.encode('utf-8')
+        packed.append(struct.pack('<H', len(secret)) + secret)
+    return b''.join(packed)
+
+def _unpack_secrets(packed):
+    secrets = []
+    offset = 0
+    while offset < len(packed):
+        length, = struct.unpack_from('<H', packed, offset)
+        offset += 2
+        secrets.append(packed[offset:offset + length].decode('utf-8'))
+        offset += length
+    return secrets
+
+# secret slot: flags, packed secrets length, expiry time, then the key digest
+# and the packed secrets
+_SECRET_SLOT = struct.Struct('<BHd16s')
+_USED = 1
+_REFERENCED = 2
+_UNKNOWN_KEY = 4
+# secret bucket header: the clock hand
+_SECRET_HEADER = struct.Struct('<B')
+
+class SharedMemoryOAuthStore(OAuthStore):
+    '''
+    An OAuthStore that caches the secrets of another store, the backing
+    store, in shared memory so that all worker processes share one cache.
+
+    Keys that aren't in the backing store are cached too. When a bucket is
+    full, the slot to evict is chosen clock style: a slot that was used since
+    the clock hand last passed it gets a second chance.
+
+    Changes made through this store go to the backing store and update the
+    shared cache straight away. Each worker still keeps its own derived
+    cache, so other workers can keep accepting an old secret for up to
+    cache_ttl seconds. Changes made to the backing store by other means can
+    take cache_ttl seconds to show up too.
+
+    store - the backing store, e.g. a SQLiteOAuthStore
+    capacity - max number of keys cached
+    cache_ttl - seconds that a looked up key is cached for
+    max_secrets_size - keys whose secrets take more bytes than this, roughly
+        their total length, aren't cached
+    ways - slots per bucket
+    stripes - number of locks
+    '''
+    def __init__(self, store, capacity=4096, cache_ttl=60,
+            max_secrets_size=256, ways=8, stripes=64):
+        self.store = store
+        self.cache_ttl = cache_ttl
+        self.derived_cache_ttl = min(cache_ttl, DERIVED_CACHE_TTL)
+        self.max_secrets_size = max_secrets_size
+        self._table = _SharedTable(capacity, ways, _SECRET_HEADER.size,
+            _SECRET_SLOT.size + max_secrets_size, stripes)
+
+    def _find(self, digest, bucket, now):
+        '''
+        Returns the way of the slot holding digest in bucket, or None. Must
+        be called with the bucket's lock held.
+        '''
+        table = self._table
+        for way in range(table.ways):
+            flags, secrets_length, expires, slot_digest = \
+                _SECRET_SLOT.unpack_from(table.mmap,
+                    table.get_offset(bucket, way))
+            if flags & _USED and slot_digest == digest and expires > now:
+                return way
+        return None
+
+    def _get_cached(self, key):
+        '''
+        Returns the cached secrets for key, _UNKNOWN or None if not cached.
+        '''
+        table = self._table
+        digest = _digest(key.encode('utf-8'))
+        bucket = table.get_bucket(digest)
+        with table.get_lock(bucket):
+            way = self._find(digest, bucket, time.time())
+            if way is None:
+                return None
+            offset = table.get_offset(bucket, way)
+            flags, secrets_length, expires, slot_digest = \
+                _SECRET_SLOT.unpack_from(table.mmap, offset)
+            table.mmap[offset] = flags | _REFERENCED
+            if flags & _UNKNOWN_KEY:
+                return _UNKNOWN
+            start = offset + _SECRET_SLOT.size
+            packed = table.mmap[start:start + secrets_length]
+        return _unpack_secrets(packed)
+
+    def _set_cached(self, key, secrets):
+        '''
+        Cache the secrets for key, which can be _UNKNOWN.
+        '''
+        if secrets is _UNKNOWN:
+            flags = _USED | _UNKNOWN_KEY
+            packed = b''
+        else:
+            flags = _USED
+            packed = _pack_secrets(secrets)
+            if len(packed) > self.max_secrets_size:
+                return
+        table = self._table
+        digest = _digest(key.encode('utf-8'))
+        bucket = table.get_bucket(digest)
+        now = time.time()
+        with table.get_lock(bucket):
+            way = self._find(digest, bucket, now)
+            if way is None:
+                way = self._evict(bucket, now)
+            offset = table.get_offset(bucket, way)
+            _SECRET_SLOT.pack_into(table.mmap, offset, flags, len(packed),
+                now + self.cache_ttl, digest)
+            start = offset + _SECRET_SLOT.size
+            table.mmap[start:start + len(packed)] = packed
+
+    def _evict(self, bucket, now):
+        '''
+        Returns the way of a free slot in bucket, evicting one if they're all
+        in use. Must be called with the bucket's lock held.
+        '''
+        table = self._table
+        for way in range(table.ways):
+            flags, secrets_length, expires, digest = \
+                _SECRET_SLOT.unpack_from(table.mmap,
+                    table.get_offset(bucket, way))
+            if not flags & _USED or expires <= now:
+                return way
+        header = table.get_offset(bucket)
+        hand, = _SECRET_HEADER.unpack_from(table.mmap, header)
+        while True:
+            offset = table.get_offset(bucket, hand)
+            flags = table.mmap[offset]
+            if not flags & _REFERENCED:
+                break
+            table.mmap[offset] = flags & ~_REFERENCED
+            hand = (hand + 1) % table.ways
+        _SECRET_HEADER.pack_into(table.mmap, header, (hand + 1) % table.ways)
+        return hand
+
+    def _forget(self, key):
+        '''
+        Drop key from the shared cache.
+        '''
+        table = self._table
+        digest = _digest(key.encode('utf-8'))
+        bucket = table.get_bucket(digest)
+        with table.get_lock(bucket):
+            way = self._find(digest, bucket, time.time())
+            if way is not None:
+                table.mmap[table.get_offset(bucket, way)] = 0
+
+    def _lookup(self, key):
+        '''
+        Returns the secrets for key, or _UNKNOWN if key isn't in the backing
+        store.
+        '''
+        secrets = self._get_cached(key)
+        if secrets is None:
+            if self.store.has_key(key):
+                secrets = self.store.get_secrets(key)
+            else:
+                secrets = _UNKNOWN
+            self._set_cached(key, secrets)
+        return secrets
+
+    def set_secret(self, key, secret):
+        '''
+        Save a key and secret pair into the backing store.
+        '''
+        self.store.set_secret(key, secret)
+        self._forget(key)
+        self.secret_changed(key)
+
+    def rotate_secret(self, key, secret):
+        '''
+        Rotate the secret in the backing store, see OAuthStore.rotate_secret.
+        '''
+        self.store.rotate_secret(key, secret)
+        self._forget(key)
+        self.secret_changed(key)
+
+    def retire_old_secrets(self, key):
+        '''
+        Retire old secrets in the backing store, see
+        OAuthStore.retire_old_secrets.
+        '''
+        self.store.retire_old_secrets(key)
+        self._forget(key)
+        self.secret_changed(key)
+
+    def get_secret(self, key):
+        '''
+        Given a key, return the associated secret. If the key is unfamiliar,
+        then just return an empty string.
+        '''
+        secrets = self._lookup(key)
+        if secrets is _UNKNOWN:
+            return ""
+        return secrets[0]
+
+    def get_secrets(self, key):
+        '''
+        Given a key, return a list of the secrets a request signed with the key
+        may use, see OAuthStore.get_secrets.
+        '''
+        secrets = self._lookup(key)
+        if secrets is _UNKNOWN:
+            return [""]
+        return secrets
+
+    def has_key(self, key):
+        '''
+        Returns true if we know key exists, false otherwise.
+        '''
+        return self._lookup(key) is not _UNKNOWN
+
+# nonce slot: flags, timestamp, then the digest of the consumer key,
+# timestamp and nonce
+_NONCE_SLOT = struct.Struct('<Bq16s')
+# nonce bucket header: timestamps below this are treated as already seen
+_NONCE_HEADER = struct.Struct('<q')
+
+class SharedMemoryNonceStore(NonceStore):
+    '''
+    Keeps nonces in shared memory, so that a nonce used with one worker
+    process is seen by all of them.
+
+    Slots holding nonces older than the window are reused. When a bucket is
+    full of nonces that are still in the window, the one with the oldest
+    timestamp is evicted and, like MemoryNonceStore does when it's full,
+    timestamps up to the evicted one are treated as already seen from then
+    on, but only for that bucket.
+
+    window - seconds that a nonce needs to be kept for
+    capacity - max number of nonces kept
+    ways - slots per bucket
+    stripes - number of locks
+    '''
+    def __init__(self, window=300, capacity=100000, ways=8, stripes=64):
+        self.window = window
+        self._table = _SharedTable(capacity, ways, _NONCE_HEADER.size,
+            _NONCE_SLOT.size, stripes)
+
+    def _locate(self, consumer_key, timestamp, nonce):
+        digest = _digest(('%s\0%d\0%s' % (consumer_key, timestamp,
+            nonce)).encode('utf-8'))
+        return digest, self._table.get_bucket(digest)
+
+    def _seen(self, digest, bucket, timestamp):
+        '''
+        Must be called with the bucket's lock held.
+        '''
+        table = self._table
+        floor, = _NONCE_HEADER.unpack_from(table.mmap,
+            table.get_offset(bucket))
+        if timestamp < floor:
+            return True
+        for way in range(table.ways):
+            flags, slot_timestamp, slot_digest = _NONCE_SLOT.unpack_from(
+                table.mmap, table.get_offset(bucket, way))
+            if flags and slot_digest == digest:
+                return True
+        return False
+
+    def seen(self, consumer_key, timestamp, nonce):
+        digest, bucket = self._locate(consumer_key, timestamp, nonce)
+        with self._table.get_lock(bucket):
+            return self._seen(digest, bucket, timestamp)
+
+    def add(self, consumer_key, timestamp, nonce):
+        table = self._table
+        digest, bucket = self._locate(consumer_key, timestamp, nonce)
+        cutoff = time.time() - self.window
+        with table.get_lock(bucket):
+            if self._seen(digest, bucket, timestamp):
+                return False
+            # reuse a free or expired slot, otherwise the oldest one
+            victim = None
+            for way in range(table.ways):
+                flags, slot_timestamp, slot_digest = _NONCE_SLOT.unpack_from(
+                    table.mmap, table.get_offset(bucket, way))
+                if not flags or slot_timestamp < cutoff:
+                    victim = way
+                    break
+                if victim is None or slot_timestamp < oldest:
+                    victim, oldest = way, slot_timestamp
+            else:
+                header = table.get_offset(bucket)
+                floor, = _NONCE_HEADER.unpack_from(table.mmap, header)
+                _NONCE_HEADER.pack_into(table.mmap, header,
+                    max(floor, oldest + 1))
+            _NONCE_SLOT.pack_into(table.mmap, table.get_offset(bucket, victim),
+                1, timestamp, digest)
+            return True
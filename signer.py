@@ -0,0 +1,146 @@
+"""
+Signing of outgoing OAuth 1.0 requests, such as LTI Basic Outcomes grade
+passback, and the oauth_body_hash of request bodies that aren't form encoded.
+
+    signer = Signer(consumer_key, secret)
+    body_hash = make_body_hash(open('grade.xml', 'rb'))
+    headers['Authorization'] = signer.get_authorization_header('POST', url,
+        body_hash=body_hash)
+
+The signature base string is built the same way as for verification. Any
+signature method registered with parser.register_signature_method can be used,
+oauth_body_hash has to be made with the same method's hash:
+
+    signer = Signer(consumer_key, secret, signature_method='HMAC-SHA256')
+    body_hash = make_body_hash(body, digestmod=hashlib.sha256)
+"""
+import base64
+from hashlib import sha1
+import hmac
+import time
+from urllib.parse import parse_qsl
+import uuid
+
+from parser import UnsupportedError, _encode_params, _get_base_string_prefix, \
+    _join_base_string, _make_signing_key, _percent_encode, _signature_methods
+
+# bytes read at a time when hashing a file like body
+BODY_HASH_CHUNK_SIZE = 65536
+
+def make_body_hash(body, chunk_size=BODY_HASH_CHUNK_SIZE, digestmod=sha1):
+    '''
+    Returns the oauth_body_hash of body, which can be bytes, a file like
+    object opened in binary mode or an iterable of bytes chunks. File like
+    objects and iterables are hashed a chunk at a time, so the body never has
+    to be in memory all at once.
+
+    digestmod - hashlib constructor of the request's signature method's hash,
+        see SignatureMethod.digestmod
+    '''
+    hashed = digestmod()
+    if isinstance(body, (bytes, bytearray, memoryview)):
+        hashed.update(body)
+    elif hasattr(body, 'read'):
+        for chunk in iter(lambda: body.read(chunk_size), b''):
+            hashed.update(chunk)
+    else:
+        for chunk in body:
+            hashed.update(chunk)
+    return base64.b64encode(hashed.digest()).decode('ascii')
+
+def verify_body_hash(oauth_body_hash, body, chunk_size=BODY_HASH_CHUNK_SIZE,
+        digestmod=sha1):
+    '''
+    Returns True if the oauth_body_hash param of a request matches its body,
+    see make_body_hash. The request's signature still has to be verified
+    separately, since that's what protects the oauth_body_hash param.
+    '''
+    if oauth_body_hash is None:
+        return False
+    return hmac.compare_digest(
+        make_body_hash(body, chunk_size, digestmod).encode('ascii'),
+        oauth_body_hash.encode('utf-8'))
+
+def format_authorization_header(oauth_params, realm=None):
+    '''
+    Returns the value of an Authorization header carrying oauth_params, a dict
+    of signed OAuth params.
+    '''
+    fields = []
+    if realm is not None:
+        fields.append('realm="%s"' % realm)
+    for name, value in sorted(oauth_params.items()):
+        fields.append('%s="%s"' % (name,
+            _percent_encode(value).decode('ascii')))
+    return 'OAuth ' + ', '.join(fields)
+
+class Signer:
+    '''
+    Signs outgoing requests for one consumer key.
+
+    The key is prepared once when the signer is created, so a signer should
+    be reused for every request made with the same key, e.g. when sending a
+    batch of grades.
+
+    token_key, token_secret - the OAuth token, LTI services don't use one
+    signature_method - name of a registered signature method
+    '''
+    def __init__(self, consumer_key, consumer_secret, token_key=None,
+            token_secret='', signature_method='HMAC-SHA1'):
+        if signature_method not in _signature_methods:
+            raise UnsupportedError(
+                "Unknown signature method: " + signature_method)
+        self.consumer_key = consumer_key
+        self.token_key = token_key
+        self.signature_method = signature_method
+        self._method = _signature_methods[signature_method]
+        self._key = self._method.prepare(
+            _make_signing_key(consumer_secret, token_secret))
+
+    def sign(self, method, url, post_params=None, body_hash=None, nonce=None,
+            timestamp=None):
+        '''
+        Returns the OAuth params of a signed request, including
+        oauth_signature.
+
+        url - the full url, any query string params are signed too
+        post_params - form encoded POST params, None if the body isn't form
+            encoded
+        body_hash - the body's oauth_body_hash, see make_body_hash, for bodies
+            that aren't form encoded
+        nonce, timestamp - generated if not given
+        '''
+        if nonce is None:
+            nonce = uuid.uuid4().hex
+        if timestamp is None:
+            timestamp = int(time.time())
+        oauth_params = {
+            'oauth_consumer_key': self.consumer_key,
+            'oauth_signature_method': self.signature_method,
+            'oauth_timestamp': str(timestamp),
+            'oauth_nonce': nonce,
+            'oauth_version': '1.0'
+        }
+        if self.token_key is not None:
+            oauth_params['oauth_token'] = self.token_key
+        if body_hash is not None:
+            oauth_params['oauth_body_hash'] = body_hash
+        url, sep, query = url.partition('?')
+        # the query string can repeat a param, so it's kept as a list of pairs
+        params = parse_qsl(query, True) + list(oauth_params.items())
+        if post_params:
+            params += post_params.items()
+        basestr = _join_base_string(_get_base_string_prefix(method, url),
+            _encode_params(params))
+        oauth_params['oauth_signature'] = \
+            self._method.sign(self._key, basestr).decode('ascii')
+        return oauth_params
+
+    def get_authorization_header(self, method, url, post_params=None,
+            body_hash=None, realm=None, nonce=None, timestamp=None):
+        '''
+        Returns the value of the Authorization header for a signed request,
+        see sign.
+        '''
+        return format_authorization_header(self.sign(method, url, post_params,
+            body_hash, nonce, timestamp), realm)
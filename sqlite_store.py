@@ -0,0 +1,176 @@
+"""
+OAuthStore implementation that keeps the keys and secrets in a SQLite
+database.
+"""
+from contextlib import contextmanager
+import queue
+import sqlite3
+
+from cache import LRUCache
+from oauth_store import DERIVED_CACHE_TTL, OAuthStore, OAuthStoreSaveError
+
+# cached in place of the secrets for keys that aren't in the database
+_UNKNOWN = object()
+
+class SQLiteOAuthStore(OAuthStore):
+    '''
+    Stores keys and secrets in a SQLite database file.
+
+    Lookups go through an in process LRU cache first, which also remembers
+    keys that aren't in the database, so the database is only hit on a cache
+    miss. Connections are kept in a pool and can be used by multiple threads.
+    The secrets replaced by rotate_secret are kept in a second table, named
+    after table with an _old suffix, so every process using the database
+    accepts them until retire_old_secrets is called.
+
+    path - the database file, created if it doesn't exist. Can't be
+        ':memory:' since every pooled connection would get its own database.
+    pool_size - number of connections kept open
+    cache_size - max number of keys in the lookup cache
+    cache_ttl - seconds that a looked up key is cached for, changes made to
+        the database by other processes can take this long to show up. The
+        values derived from the secrets, see DerivedCacheMixin, are kept for
+        no longer than this either.
+    table - name of the table the keys and secrets are kept in
+    '''
+    def __init__(self, path, pool_size=4, cache_size=1024, cache_ttl=60,
+            table='oauth_secrets'):
+        self.path = path
+        self.table = table
+        self.cache = LRUCache(cache_size, cache_ttl)
+        # otherwise a prepared secret outlives its cached lookup
+        self.derived_cache_ttl = min(cache_ttl, DERIVED_CACHE_TTL)
+        # the statements are built once, sqlite3 keeps them compiled per
+        # connection
+        self._select_secret = "SELECT secret FROM %s WHERE key = ?" % table
+        self._insert_secret = \
+            "INSERT OR REPLACE INTO %s (key, secret) VALUES (?, ?)" % table
+        # old secrets are returned newest first
+        self._select_old_secrets = "SELECT secret FROM %s_old WHERE key = ? " \
+            "ORDER BY rowid DESC" % table
+        self._keep_old_secret = "INSERT INTO %s_old (key, secret) " \
+            "SELECT key, secret FROM %s WHERE key = ?" % (table, table)
+        self._delete_old_secrets = "DELETE FROM %s_old WHERE key = ?" % table
+        self._pool = queue.Queue()
+        for i in range(pool_size):
+            conn = sqlite3.connect(path, check_same_thread=False)
+            self._pool.put(conn)
+        with self._connection() as conn:
+            with conn:
+                conn.execute("CREATE TABLE IF NOT EXISTS %s "
+                    "(key TEXT PRIMARY KEY, secret TEXT NOT NULL)" % table)
+                conn.execute("CREATE TABLE IF NOT EXISTS %s_old "
+                    "(key TEXT NOT NULL, secret TEXT NOT NULL)" % table)
+                conn.execute("CREATE INDEX IF NOT EXISTS %s_old_key "
+                    "ON %s_old (key)" % (table, table))
+
+    @contextmanager
+    def _connection(self):
+        '''
+        Borrow a connection from the pool.
+        '''
+        conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    def _lookup(self, key):
+        '''
+        Returns the current and old secrets for key, or _UNKNOWN if key isn't
+        in the database.
+        '''
+        secrets = self.cache.get(key)
+        if secrets is None:
+            with self._connection() as conn:
+                row = conn.execute(self._select_secret, (key,)).fetchone()
+                if row is None:
+                    secrets = _UNKNOWN
+                else:
+                    secrets = [row[0]] + [old for old, in conn.execute(
+                        self._select_old_secrets, (key,))]
+            self.cache.set(key, secrets)
+        return secrets
+
+    def set_secret(self, key, secret):
+        '''
+        Save a key and secret pair into the database.
+        '''
+        self.set_secrets([(key, secret)])
+
+    def set_secrets(self, secrets):
+        '''
+        Save an iterable of key and secret pairs into the database in a single
+        transaction.
+        '''
+        secrets = list(secrets)
+        try:
+            with self._connection() as conn:
+                with conn:
+                    conn.executemany(self._insert_secret, secrets)
+        except sqlite3.Error as e:
+            raise OAuthStoreSaveError(str(e))
+        for key, secret in secrets:
+            self.cache.pop(key)
+            self.secret_changed(key)
+
+    def rotate_secret(self, key, secret):
+        '''
+        Replace the secret for key, but keep accepting the old secret until
+        retire_old_secrets is called.
+        '''
+        try:
+            with self._connection() as conn:
+                with conn:
+                    conn.execute(self._keep_old_secret, (key,))
+                    conn.execute(self._insert_secret, (key, secret))
+        except sqlite3.Error as e:
+            raise OAuthStoreSaveError(str(e))
+        self.cache.pop(key)
+        self.secret_changed(key)
+
+    def retire_old_secrets(self, key):
+        '''
+        Stop accepting the secrets for key that were replaced by rotate_secret.
+        '''
+        try:
+            with self._connection() as conn:
+                with conn:
+                    conn.execute(self._delete_old_secrets, (key,))
+        except sqlite3.Error as e:
+            raise OAuthStoreSaveError(str(e))
+        self.cache.pop(key)
+        self.secret_changed(key)
+
+    def get_secret(self, key):
+        '''
+        Given a key, return the associated secret. If the key is unfamiliar,
+        then just return an empty string.
+        '''
+        secrets = self._lookup(key)
+        if secrets is _UNKNOWN:
+            return ""
+        return secrets[0]
+
+    def get_secrets(self, key):
+        '''
+        Given a key, return a list of the secrets a request signed with the key
+        may use, see OAuthStore.get_secrets.
+        '''
+        secrets = self._lookup(key)
+        if secrets is _UNKNOWN:
+            return [""]
+        return list(secrets)
+
+    def has_key(self, key):
+        '''
+        Returns true if we know key exists, false otherwise.
+        '''
+        return self._lookup(key) is not _UNKNOWN
+
+    def close(self):
+        '''
+        Close all the pooled connections.
+        '''
+        while not self._pool.empty():
+            self._pool.get().close()
@@ -0,0 +1,87 @@
+import threading
+import unittest
+
+from unittest.mock import patch
+
+import lti_launch_data
+
+from admission import TokenBucketLimiter
+from instrumentation import Outcome
+from oauth_store import OAuthStore
+from parser import Parser
+
+class TestTokenBucketLimiter(unittest.TestCase):
+    def test_refill(self):
+        limiter = TokenBucketLimiter(rate=2, burst=3)
+        with patch('admission.time') as mock_time:
+            mock_time.monotonic.return_value = 100
+            for i in range(3):
+                self.assertTrue(limiter.admit('key'))
+            self.assertFalse(limiter.admit('key'))
+            # each key has its own bucket
+            self.assertTrue(limiter.admit('other key'))
+            mock_time.monotonic.return_value = 100.5
+            self.assertTrue(limiter.admit('key'))
+            self.assertFalse(limiter.admit('key'))
+            # never more than burst tokens
+            mock_time.monotonic.return_value = 200
+            for i in range(3):
+                self.assertTrue(limiter.admit('key'))
+            self.assertFalse(limiter.admit('key'))
+        self.assertEqual({'key': 3}, limiter.get_throttled_counts())
+        self.assertEqual(3, limiter.get_throttled_total())
+
+    def test_set_limit(self):
+        limiter = TokenBucketLimiter(rate=0, burst=1)
+        limiter.set_limit('big key', 0, 5)
+        self.assertEqual(5, sum(limiter.admit('big key') for i in range(10)))
+        self.assertEqual(1, sum(limiter.admit('key') for i in range(10)))
+
+    def test_bounded(self):
+        limiter = TokenBucketLimiter(rate=0, burst=1, capacity=2, stripes=1)
+        for key in ['a', 'b']:
+            limiter.admit(key)
+            limiter.admit(key)
+        # tracking c drops a, the least recently used
+        limiter.admit('c')
+        self.assertEqual({'b': 1}, limiter.get_throttled_counts())
+        self.assertEqual(2, limiter.get_throttled_total())
+        self.assertTrue(limiter.admit('a'))
+
+    def test_concurrent(self):
+        limiter = TokenBucketLimiter(rate=0, burst=1000, stripes=4)
+        admitted = []
+        def run():
+            admitted.append(sum(limiter.admit('key') for i in range(500)))
+        threads = [threading.Thread(target=run) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(1000, sum(admitted))
+        self.assertEqual(3000, limiter.get_throttled_total())
+
+class TestParserAdmission(unittest.TestCase):
+    def test_throttled_before_signature_check(self):
+        data = lti_launch_data.webwork_blti_launch
+        oauth_store = OAuthStore()
+        oauth_store.set_secret('lti_secret', 'secret')
+        limiter = TokenBucketLimiter(rate=0, burst=1)
+        parser = Parser(data['method'], data['url'], data['http_headers'],
+            data['get_params'], data['post_params'], oauth_store,
+            limiter=limiter)
+        self.assertTrue(parser.verify_signature())
+        with patch('parser._match_signature') as mock_match:
+            self.assertFalse(parser.verify_signature())
+            self.assertEqual(Outcome.THROTTLED, parser.rejection_reason)
+            self.assertFalse(mock_match.called)
+        # made up keys are rejected without taking up a bucket
+        parser.post_params = dict(data['post_params'],
+            oauth_consumer_key='made up key')
+        self.assertFalse(parser.verify_signature())
+        self.assertEqual(Outcome.UNKNOWN_CONSUMER_KEY,
+            parser.rejection_reason)
+        self.assertEqual({'lti_secret': 1}, limiter.get_throttled_counts())
+
+if __name__ == '__main__':
+    unittest.main()
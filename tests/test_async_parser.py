@@ -0,0 +1,114 @@
+# coding=utf-8
+
+import asyncio
+import unittest
+
+import lti_launch_data
+import oauth_data
+
+from admission import TokenBucketLimiter
+from async_parser import AsyncOAuthStore
+from instrumentation import HistogramCollector, Outcome, Stage
+from parser import Parser, SignatureVerificationError
+from replay import ReplayGuard
+from signer import Signer
+
+def _get_parser(data):
+    oauth_store = AsyncOAuthStore()
+    for key, secret in data['secrets'].items():
+        oauth_store.set_secret(key, secret)
+    parser = Parser(data['method'], data["url"], data["http_headers"],
+        data["get_params"], data["post_params"], oauth_store)
+    return parser
+
+class TestAsyncSignatureVerification(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_signature_verification_using_examples(self):
+        for data in [oauth_data.basic_example, oauth_data.rfc_example,
+                oauth_data.non_ascii_example,
+                lti_launch_data.webwork_blti_launch]:
+            parser = _get_parser(data)
+            self.assertTrue(self.loop.run_until_complete(
+                parser.verify_signature_async()),
+                "OAuth signature verification should've been successful but "
+                "failed.")
+
+    def test_hmac_in_executor(self):
+        parser = _get_parser(lti_launch_data.webwork_blti_launch)
+        self.assertTrue(self.loop.run_until_complete(
+            parser.verify_signature_async(hmac_threshold=0)))
+        parser.oauth_store.set_secret('lti_secret', 'wrong secret')
+        self.assertFalse(self.loop.run_until_complete(
+            parser.verify_signature_async(hmac_threshold=0)))
+
+    def test_rejection_reason(self):
+        parser = _get_parser(lti_launch_data.webwork_blti_launch)
+        self.assertTrue(self.loop.run_until_complete(
+            parser.verify_signature_async()))
+        self.assertEqual(None, parser.rejection_reason)
+        self.assertEqual(0, parser.matched_secret_index)
+        parser.oauth_store.set_secret('lti_secret', 'wrong secret')
+        self.assertFalse(self.loop.run_until_complete(
+            parser.verify_signature_async()))
+        self.assertEqual(Outcome.SIGNATURE_MISMATCH, parser.rejection_reason)
+        self.assertEqual(None, parser.matched_secret_index)
+        parser.oauth_store = AsyncOAuthStore()
+        self.assertFalse(self.loop.run_until_complete(
+            parser.verify_signature_async()))
+        self.assertEqual(Outcome.UNKNOWN_CONSUMER_KEY,
+            parser.rejection_reason)
+        # the launch's timestamp is long past
+        parser = _get_parser(lti_launch_data.webwork_blti_launch)
+        parser.replay_guard = ReplayGuard()
+        self.assertFalse(self.loop.run_until_complete(
+            parser.verify_signature_async()))
+        self.assertEqual(Outcome.STALE_TIMESTAMP, parser.rejection_reason)
+        parser.post_params = dict(parser.post_params,
+            oauth_signature_method='PLAINTEXT')
+        with self.assertRaises(SignatureVerificationError):
+            self.loop.run_until_complete(parser.verify_signature_async())
+        self.assertEqual(Outcome.UNSUPPORTED_METHOD, parser.rejection_reason)
+
+    def test_limiter(self):
+        parser = _get_parser(lti_launch_data.webwork_blti_launch)
+        parser.limiter = TokenBucketLimiter(rate=0, burst=1)
+        for hmac_threshold in [None, 0]:
+            self.assertEqual(hmac_threshold is None,
+                self.loop.run_until_complete(parser.verify_signature_async(
+                    hmac_threshold=hmac_threshold)))
+        self.assertEqual(Outcome.THROTTLED, parser.rejection_reason)
+        self.assertEqual(1, parser.limiter.get_throttled_total())
+
+    def test_listeners(self):
+        collector = HistogramCollector()
+        Parser.add_listener(collector)
+        try:
+            for hmac_threshold in [None, 0]:
+                parser = _get_parser(lti_launch_data.webwork_blti_launch)
+                self.assertTrue(self.loop.run_until_complete(
+                    parser.verify_signature_async(
+                        hmac_threshold=hmac_threshold)))
+        finally:
+            Parser.remove_listener(collector)
+        self.assertEqual({Outcome.VALID: 2}, collector.get_outcomes())
+        for stage in [Stage.LOCATE_OAUTH_PARAMS, Stage.SECRET_LOOKUP,
+                Stage.BASE_STRING, Stage.HMAC]:
+            self.assertEqual(2, collector.get_count(stage))
+
+    def test_non_str_values(self):
+        url = 'http://tool.example.com/launch'
+        oauth_store = AsyncOAuthStore()
+        oauth_store.set_secret('key', 'secret')
+        post_params = {'custom_n': 5}
+        post_params.update(Signer('key', 'secret').sign('POST', url,
+            post_params))
+        parser = Parser('POST', url, {}, {}, post_params, oauth_store)
+        # same as verify_signature
+        for hmac_threshold in [None, 0]:
+            self.assertTrue(self.loop.run_until_complete(
+                parser.verify_signature_async(hmac_threshold=hmac_threshold)))
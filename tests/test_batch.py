@@ -0,0 +1,100 @@
+# coding=utf-8
+
+import copy
+import unittest
+
+from unittest.mock import patch
+
+import lti_launch_data
+import oauth_data
+
+import batch
+from batch import _prepared_keys, verify_many
+from instrumentation import Outcome
+from oauth_store import OAuthStore
+from parser import SignatureVerificationError, _signature_methods
+
+class TestVerifyMany(unittest.TestCase):
+    def setUp(self):
+        self.oauth_store = OAuthStore()
+        examples = [oauth_data.basic_example, oauth_data.rfc_example,
+                oauth_data.non_ascii_example,
+                lti_launch_data.webwork_blti_launch]
+        for data in examples:
+            for key, secret in data['secrets'].items():
+                self.oauth_store.set_secret(key, secret)
+        wrong_signature = copy.deepcopy(lti_launch_data.webwork_blti_launch)
+        wrong_signature['post_params']['oauth_signature'] = \
+            'cbxlc8O7Gzqo2rYBu+LvUyPp19d='
+        bad_signature = copy.deepcopy(lti_launch_data.webwork_blti_launch)
+        bad_signature['post_params']['oauth_signature'] = 'bad'
+        unknown_key = copy.deepcopy(lti_launch_data.webwork_blti_launch)
+        unknown_key['post_params']['oauth_consumer_key'] = 'unknown'
+        missing_oauth = copy.deepcopy(lti_launch_data.webwork_blti_launch)
+        del missing_oauth['post_params']['oauth_nonce']
+        self.rejected = [
+            (wrong_signature, Outcome.SIGNATURE_MISMATCH),
+            (bad_signature, Outcome.MALFORMED_SIGNATURE),
+            (unknown_key, Outcome.UNKNOWN_CONSUMER_KEY),
+            (missing_oauth, Outcome.MISSING_OAUTH_FIELDS)]
+        # repeat the examples so that signing keys are shared
+        self.requests = list(enumerate(examples * 3 +
+            [request for request, outcome in self.rejected]))
+
+    def _check_results(self, results):
+        results = dict((request_id, (ok, error, rejection_reason))
+            for request_id, ok, error, rejection_reason in results)
+        self.assertEqual(len(self.requests), len(results))
+        num_valid = len(self.requests) - len(self.rejected)
+        for request_id in range(num_valid):
+            self.assertEqual((True, None, None), results[request_id])
+        for request_id, (request, outcome) in enumerate(self.rejected,
+                num_valid):
+            ok, error, rejection_reason = results[request_id]
+            self.assertFalse(ok)
+            self.assertEqual(outcome, rejection_reason)
+            if outcome == Outcome.MISSING_OAUTH_FIELDS:
+                self.assertTrue(isinstance(error, SignatureVerificationError))
+            else:
+                self.assertEqual(None, error)
+
+    def test_thread_executor(self):
+        results = list(verify_many(self.requests, self.oauth_store, workers=2))
+        # results should be in input order
+        self.assertEqual([request_id for request_id, _ in self.requests],
+            [request_id for request_id, _, _, _ in results])
+        self._check_results(results)
+
+    def test_process_executor(self):
+        self._check_results(verify_many(self.requests, self.oauth_store,
+            workers=2, executor='process', ordered=False))
+
+    def test_secrets_looked_up_once_per_batch(self):
+        with patch.object(self.oauth_store, 'get_secret',
+                wraps=self.oauth_store.get_secret) as mock_get_secret:
+            list(verify_many(self.requests, self.oauth_store, workers=2))
+            # 4 consumer and token key pairs, 2 lookups each
+            self.assertEqual(8, mock_get_secret.call_count)
+
+    def test_rejected_before_base_string(self):
+        with patch('batch._build_base_string',
+                wraps=batch._build_base_string) as mock_build:
+            self._check_results(verify_many(self.requests, self.oauth_store,
+                workers=2))
+            # the valid requests and the one with the wrong signature
+            self.assertEqual(len(self.requests) - 3, mock_build.call_count)
+
+    def test_unknown_executor(self):
+        with self.assertRaises(ValueError):
+            list(verify_many(self.requests, self.oauth_store,
+                executor='unknown'))
+
+    def test_keys_prepared_once(self):
+        method = _signature_methods['HMAC-SHA1']
+        _prepared_keys.clear()
+        with patch.object(method, 'prepare', wraps=method.prepare) as \
+                mock_prepare:
+            self._check_results(verify_many(self.requests, self.oauth_store,
+                workers=1))
+            # one signing key for each of the 4 key pairs
+            self.assertEqual(4, mock_prepare.call_count)
@@ -0,0 +1,65 @@
+import unittest
+
+from unittest.mock import patch
+
+from cache import LRUCache, VerifiedResultCache
+
+class TestLRUCache(unittest.TestCase):
+    def test_get_set(self):
+        cache = LRUCache(2)
+        self.assertEqual(None, cache.get('a'))
+        self.assertEqual('default', cache.get('a', 'default'))
+        cache.set('a', 1)
+        self.assertEqual(1, cache.get('a'))
+        self.assertTrue('a' in cache)
+        self.assertEqual(1, cache.pop('a'))
+        self.assertFalse('a' in cache)
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        # using 'a' should make 'b' the least recently used entry
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(2, len(cache))
+        self.assertTrue('a' in cache)
+        self.assertFalse('b' in cache)
+        self.assertTrue('c' in cache)
+
+    def test_ttl_expiry(self):
+        cache = LRUCache(2, ttl=10)
+        with patch('cache.time') as mock_time:
+            mock_time.time.return_value = 100
+            cache.set('a', 1)
+            mock_time.time.return_value = 109
+            self.assertEqual(1, cache.get('a'))
+            self.assertTrue('a' in cache)
+            mock_time.time.return_value = 110
+            self.assertFalse('a' in cache)
+            self.assertEqual(None, cache.get('a'))
+            self.assertEqual(0, len(cache))
+
+class TestVerifiedResultCache(unittest.TestCase):
+    def test_only_equal_requests(self):
+        cache = VerifiedResultCache()
+        key = ('key', 'nonce', 'signature')
+        cache.set(key, ('POST', {'a': '1'}), 'result')
+        self.assertEqual('result', cache.get(key, ('POST', {'a': '1'})))
+        self.assertEqual(None, cache.get(key, ('POST', {'a': '2'})))
+        self.assertEqual(None, cache.get(('key', 'nonce', 'other'),
+            ('POST', {'a': '1'})))
+        cache.clear()
+        self.assertEqual(0, len(cache))
+
+    def test_bounded(self):
+        cache = VerifiedResultCache(maxsize=2, ttl=10)
+        with patch('cache.time') as mock_time:
+            mock_time.time.return_value = 100
+            for i in range(3):
+                cache.set(i, 'request', i)
+            self.assertEqual(2, len(cache))
+            self.assertEqual(None, cache.get(0, 'request'))
+            mock_time.time.return_value = 110
+            self.assertEqual(None, cache.get(2, 'request'))
+
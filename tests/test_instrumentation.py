@@ -0,0 +1,110 @@
+# coding=utf-8
+
+import copy
+import unittest
+
+from unittest.mock import patch
+
+import lti_launch_data
+
+from instrumentation import HistogramCollector, Listener, Outcome, Stage
+from oauth_store import OAuthStore
+from parser import Parser, SignatureVerificationError
+
+class TestHistogramCollector(unittest.TestCase):
+    def test_histogram(self):
+        collector = HistogramCollector()
+        self.assertEqual(None, collector.get_mean(Stage.HMAC))
+        self.assertEqual(None, collector.get_percentile(Stage.HMAC, 50))
+        for duration in [0.0000005, 0.000003, 0.000003, 0.000003, 5]:
+            collector.stage_finished(Stage.HMAC, duration)
+        self.assertEqual(5, collector.get_count(Stage.HMAC))
+        self.assertAlmostEqual(1.0000019, collector.get_mean(Stage.HMAC))
+        self.assertEqual(0.000001, collector.get_percentile(Stage.HMAC, 0))
+        self.assertEqual(0.000004, collector.get_percentile(Stage.HMAC, 50))
+        self.assertEqual(None, collector.get_percentile(Stage.HMAC, 100))
+        collector.outcome(Outcome.VALID)
+        collector.outcome(Outcome.VALID)
+        self.assertEqual({Outcome.VALID: 2}, collector.get_outcomes())
+        collector.reset()
+        self.assertEqual(0, collector.get_count(Stage.HMAC))
+        self.assertEqual({}, collector.get_outcomes())
+
+class TestParserListeners(unittest.TestCase):
+    def setUp(self):
+        self.collector = HistogramCollector()
+        Parser.add_listener(self.collector)
+
+    def tearDown(self):
+        Parser.remove_listener(self.collector)
+
+    def _verify(self, post_params, secrets=None):
+        data = lti_launch_data.webwork_blti_launch
+        oauth_store = OAuthStore()
+        if secrets is None:
+            secrets = data['secrets']
+        for key, secret in secrets.items():
+            oauth_store.set_secret(key, secret)
+        parser = Parser(data['method'], data['url'], data['http_headers'],
+            data['get_params'], post_params, oauth_store)
+        return parser.verify_signature()
+
+    def test_outcomes(self):
+        post_params = lti_launch_data.webwork_blti_launch['post_params']
+        self.assertTrue(self._verify(post_params))
+        for stage in [Stage.LOCATE_OAUTH_PARAMS, Stage.BASE_STRING,
+                Stage.SECRET_LOOKUP, Stage.HMAC]:
+            self.assertEqual(1, self.collector.get_count(stage))
+        bad_signature = dict(post_params,
+            oauth_signature='cbxlc8O7Gzqo2rYBu+LvUyPp19d=')
+        self.assertFalse(self._verify(bad_signature))
+        malformed_signature = dict(post_params, oauth_signature='bad')
+        self.assertFalse(self._verify(malformed_signature))
+        self.assertFalse(self._verify(post_params, {}))
+        unsupported = dict(post_params, oauth_signature_method='PLAINTEXT')
+        with self.assertRaises(SignatureVerificationError):
+            self._verify(unsupported)
+        missing = copy.copy(post_params)
+        del missing['oauth_nonce']
+        with self.assertRaises(SignatureVerificationError):
+            self._verify(missing)
+        self.assertEqual({
+            Outcome.VALID: 1,
+            Outcome.SIGNATURE_MISMATCH: 1,
+            Outcome.MALFORMED_SIGNATURE: 1,
+            Outcome.UNKNOWN_CONSUMER_KEY: 1,
+            Outcome.UNSUPPORTED_METHOD: 1,
+            Outcome.MISSING_OAUTH_FIELDS: 1
+        }, self.collector.get_outcomes())
+
+    def test_secret_matched(self):
+        data = lti_launch_data.webwork_blti_launch
+        oauth_store = OAuthStore()
+        oauth_store.set_secret('lti_secret', 'secret')
+        oauth_store.rotate_secret('lti_secret', 'new secret')
+        parser = Parser(data['method'], data['url'], data['http_headers'],
+            data['get_params'], data['post_params'], oauth_store)
+        self.assertTrue(parser.verify_signature())
+        self.assertEqual({('lti_secret', 1): 1},
+            self.collector.get_secret_matches())
+
+    def test_removed_listener(self):
+        Parser.remove_listener(self.collector)
+        post_params = lti_launch_data.webwork_blti_launch['post_params']
+        self.assertTrue(self._verify(post_params))
+        self.assertEqual({}, self.collector.get_outcomes())
+
+    def test_failing_listener(self):
+        listener = Listener()
+        Parser.add_listener(listener)
+        try:
+            with patch.object(listener, 'outcome', side_effect=ValueError):
+                with patch('parser.logger') as mock_logger:
+                    post_params = \
+                        lti_launch_data.webwork_blti_launch['post_params']
+                    self.assertTrue(self._verify(post_params))
+                    mock_logger.exception.assert_called_with(
+                        "Verification listener failed.")
+        finally:
+            Parser.remove_listener(listener)
+        self.assertEqual({Outcome.VALID: 1}, self.collector.get_outcomes())
@@ -0,0 +1,85 @@
+import copy
+import pickle
+import unittest
+
+import lti_launch_data
+
+from launch import InvalidLaunchError, LaunchRequest, parse_launch
+from oauth_store import OAuthStore
+from parser import Parser
+
+class TestLaunch(unittest.TestCase):
+    def setUp(self):
+        self.params = copy.deepcopy(
+            lti_launch_data.webwork_blti_launch['post_params'])
+
+    def test_parse_launch(self):
+        expected_params = copy.deepcopy(self.params)
+        launch = parse_launch(self.params)
+        self.assertEqual('basic-lti-launch-request', launch.lti_message_type)
+        self.assertEqual('CL.UBC.MATH.101.201.2012W2.13204',
+            launch.context_id)
+        self.assertEqual(None, launch.user_image)
+        self.assertEqual('learn-9.1.130093', launch.ext['lms'])
+        self.assertFalse('oauth_signature' in launch.extra)
+        # the caller's params should be left untouched
+        self.assertEqual(expected_params, self.params)
+
+    def test_missing_required_field(self):
+        del self.params['resource_link_id']
+        self.assertRaises(InvalidLaunchError, parse_launch, self.params)
+
+    def test_invalid_message_type(self):
+        self.params['lti_message_type'] = 'ContentItemSelectionRequest'
+        self.assertRaises(InvalidLaunchError, parse_launch, self.params)
+
+    def test_roles(self):
+        self.params['roles'] = 'Instructor, urn:lti:role:ims/lis/TeachingAssistant,'
+        launch = LaunchRequest(self.params)
+        self.assertEqual(('Instructor',
+            'urn:lti:role:ims/lis/TeachingAssistant'), launch.roles)
+        self.assertEqual((), LaunchRequest({}).roles)
+
+    def test_custom_and_ext_params(self):
+        params = {'custom_foo': 'a', 'ext_bar': 'b', 'baz': 'c',
+            'oauth_nonce': 'd'}
+        launch = LaunchRequest(params)
+        self.assertEqual({'foo': 'a'}, launch.custom)
+        self.assertEqual({'bar': 'b'}, launch.ext)
+        self.assertEqual({'baz': 'c'}, launch.extra)
+        del params['oauth_nonce']
+        self.assertEqual(params, launch.to_dict())
+
+    def test_no_instance_dict(self):
+        launch = LaunchRequest(self.params)
+        self.assertFalse(hasattr(launch, '__dict__'))
+
+    def test_interned_values(self):
+        a = LaunchRequest({'lti_version': ''.join(['LTI-', '1p0'])})
+        b = LaunchRequest({'lti_version': ''.join(['LTI', '-1p0'])})
+        self.assertTrue(a.lti_version is b.lti_version)
+
+    def test_pickle(self):
+        launch = LaunchRequest(self.params)
+        launch.roles # decoded roles shouldn't get in the way
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            copied = pickle.loads(pickle.dumps(launch, protocol))
+            self.assertEqual(launch, copied)
+            self.assertEqual(launch.roles, copied.roles)
+
+    def test_parser_get_launch_request(self):
+        data = lti_launch_data.webwork_blti_launch
+        parser = Parser(data['method'], data['url'], data['http_headers'],
+            data['get_params'], data['post_params'], OAuthStore())
+        launch = parser.get_launch_request()
+        self.assertEqual(data['post_params']['resource_link_id'],
+            launch.resource_link_id)
+        # a launch sent as a GET
+        parser = Parser('GET', data['url'], data['http_headers'],
+            data['post_params'], {}, OAuthStore())
+        launch = parser.get_launch_request()
+        self.assertEqual(data['post_params']['resource_link_id'],
+            launch.resource_link_id)
+
+if __name__ == '__main__':
+    unittest.main()
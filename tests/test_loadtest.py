@@ -0,0 +1,150 @@
+from io import BytesIO, StringIO
+import os
+import shutil
+import tempfile
+import unittest
+from urllib.parse import urlencode
+from wsgiref.util import setup_testing_defaults
+
+import lti_launch_data
+import oauth_data
+
+from instrumentation import Outcome
+from loadtest import LaunchRecorder, RecordingMiddleware, Redactor, \
+    ReplayResult, main, open_launch_file, read_launches, replay
+from oauth_store import OAuthStore
+from parser import Parser
+
+def _verify(launch):
+    oauth_store = OAuthStore()
+    for key, secret in launch['secrets'].items():
+        oauth_store.set_secret(key, secret)
+    return Parser(launch['method'], launch['url'], launch['http_headers'],
+        launch['get_params'], launch['post_params'],
+        oauth_store).verify_signature()
+
+class TestLoadTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _write(self, name, launches, redactor=None):
+        path = os.path.join(self.dir, name)
+        with open_launch_file(path, 'w') as f:
+            recorder = LaunchRecorder(f, redactor)
+            for launch in launches:
+                recorder.record(launch)
+        return path
+
+    def test_record_and_read(self):
+        launches = [lti_launch_data.webwork_blti_launch,
+            oauth_data.rfc_example, oauth_data.non_ascii_example]
+        for name in ['launches.ndjson', 'launches.ndjson.gz']:
+            path = self._write(name, launches)
+            self.assertEqual(launches, list(read_launches(path)))
+
+    def test_redact(self):
+        redactor = Redactor()
+        data = lti_launch_data.webwork_blti_launch
+        for original in [data, oauth_data.rfc_example,
+                oauth_data.non_ascii_example]:
+            launch = redactor.redact(original)
+            self.assertTrue(_verify(launch))
+            self.assertFalse(set(original['secrets'].values()) &
+                set(launch['secrets'].values()))
+        launch = redactor.redact(data)
+        post_params = launch['post_params']
+        self.assertEqual('xxxx xxx,é', post_params['lis_person_name_full'])
+        self.assertEqual(data['post_params']['lti_message_type'],
+            post_params['lti_message_type'])
+        # a key keeps the same replacement
+        self.assertEqual('key0', post_params['oauth_consumer_key'])
+        self.assertEqual({}, launch['http_headers'])
+
+    def test_replay(self):
+        bad = dict(lti_launch_data.webwork_blti_launch)
+        bad['post_params'] = dict(bad['post_params'],
+            oauth_signature='cbxlc8O7Gzqo2rYBu+LvUyPp19d=')
+        path = self._write('launches.ndjson',
+            [lti_launch_data.webwork_blti_launch, bad] * 3)
+        for processes in [1, 2]:
+            result = replay(path, processes=processes, repeat=2)
+            self.assertEqual(12, result.get_count())
+            self.assertEqual({Outcome.VALID: 6,
+                Outcome.SIGNATURE_MISMATCH: 6}, result.outcomes)
+            self.assertTrue(result.get_percentile(50) <=
+                result.get_percentile(99))
+        result = replay(path, rate=1000)
+        self.assertTrue(result.elapsed >= 0.005)
+
+    def test_percentile(self):
+        result = ReplayResult([0.001 * i for i in range(1, 101)], {}, 1.0)
+        self.assertEqual(100, result.get_throughput())
+        self.assertAlmostEqual(0.05, result.get_percentile(50))
+        self.assertAlmostEqual(0.099, result.get_percentile(99))
+        self.assertAlmostEqual(0.001, result.get_percentile(0))
+        self.assertEqual(None, ReplayResult([], {}, 0).get_percentile(50))
+
+    def test_recording_middleware(self):
+        data = lti_launch_data.webwork_blti_launch
+        oauth_store = OAuthStore()
+        oauth_store.set_secret('lti_secret', 'secret')
+        out = StringIO()
+        def app(environ, start_response):
+            start_response('200 OK', [])
+            return [environ['wsgi.input'].read()]
+        middleware = RecordingMiddleware(app, LaunchRecorder(out),
+            oauth_store, ['/webwork2/'])
+        body = urlencode(data['post_params']).encode('utf-8')
+        environ = {
+            'REQUEST_METHOD': 'POST',
+            'wsgi.url_scheme': 'http',
+            'HTTP_HOST': 'webworkdev1.elearning.ubc.ca:8080',
+            'PATH_INFO': '/webwork2/',
+            'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.input': BytesIO(body)
+        }
+        setup_testing_defaults(environ)
+        # the app still gets the body
+        self.assertEqual([body], middleware(environ, lambda *args: None))
+        path = os.path.join(self.dir, 'launches.ndjson')
+        with open(path, 'w') as f:
+            f.write(out.getvalue())
+        launch, = read_launches(path)
+        self.assertEqual(data['secrets'], launch['secrets'])
+        self.assertEqual(data['url'], launch['url'])
+        self.assertTrue(_verify(launch))
+
+    def test_recording_middleware_other_body(self):
+        out = StringIO()
+        def app(environ, start_response):
+            start_response('200 OK', [])
+            return [environ['wsgi.input'].read()]
+        middleware = RecordingMiddleware(app, LaunchRecorder(out),
+            OAuthStore(), ['/webwork2/'])
+        body = b'{"score": 1}'
+        environ = {
+            'REQUEST_METHOD': 'POST',
+            'PATH_INFO': '/webwork2/',
+            'CONTENT_TYPE': 'application/json',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.input': BytesIO(body)
+        }
+        setup_testing_defaults(environ)
+        self.assertEqual([body], middleware(environ, lambda *args: None))
+
+    def test_command_line(self):
+        path = os.path.join(self.dir, 'launches.ndjson.gz')
+        main(['record', path, 'tests.oauth_data', '--redact', '--copies',
+            '2'])
+        self.assertEqual(6, len(list(read_launches(path))))
+        out = StringIO()
+        main(['replay', path], out)
+        self.assertTrue('valid                               6' in
+            out.getvalue())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+# coding=utf-8
+
+import copy
+import unittest
+
+import oauth_data
+
+from parser import OAuthParams, SignatureVerificationError, \
+    _parse_auth_header
+
+class TestOAuthParams(unittest.TestCase):
+    def test_locate_in_http_header(self):
+        data = oauth_data.rfc_example
+        params = OAuthParams(data['http_headers'], data['get_params'],
+                data['post_params'])
+        self.assertTrue(params.isInHttpHeader())
+        self.assertEqual('9djdj82h48djs9d2', params.get_client_key())
+        self.assertEqual('kkk9d7dh3k39sjv7', params.get_token_key())
+        self.assertEqual('OB33pYjWAnf+xtOHN4Gmbdil168=',
+                params.get_signature())
+        self.assertEqual(137131201, params.get()['oauth_timestamp'])
+        self.assertFalse('oauth_callback' in params.get())
+
+    def test_locate_in_post_params(self):
+        post_params = {
+            'oauth_consumer_key': 'key',
+            'oauth_signature_method': 'HMAC-SHA1',
+            'oauth_timestamp': '1423873410',
+            'oauth_nonce': 'nonce',
+            'oauth_signature': 'sig',
+            'custom_field': 'abc'
+        }
+        expected_post_params = copy.deepcopy(post_params)
+        params = OAuthParams({}, {}, post_params)
+        self.assertFalse(params.isInHttpHeader())
+        self.assertEqual('', params.get_token_key())
+        self.assertFalse('custom_field' in params.get())
+        # the caller's params should be left untouched
+        self.assertEqual(expected_post_params, post_params)
+
+    def test_invalid_post_params_fall_through_to_get_params(self):
+        get_params = {
+            'oauth_consumer_key': 'key',
+            'oauth_signature_method': 'HMAC-SHA1',
+            'oauth_timestamp': '1423873410',
+            'oauth_nonce': 'nonce',
+            'oauth_signature': 'sig'
+        }
+        post_params = dict(get_params, oauth_signature_method='PLAINTEXT')
+        params = OAuthParams({}, get_params, post_params)
+        self.assertEqual('HMAC-SHA1', params.get()['oauth_signature_method'])
+
+    def test_missing_oauth_fields(self):
+        with self.assertRaises(SignatureVerificationError):
+            OAuthParams({}, {'a': 'b'}, {'oauth_consumer_key': 'key'})
+
+    def test_immutable(self):
+        data = oauth_data.basic_example
+        params = OAuthParams(data['http_headers'], data['get_params'],
+                data['post_params'])
+        with self.assertRaises(AttributeError):
+            params.oauth_signature = 'abc'
+        with self.assertRaises(AttributeError):
+            params.extra = 'abc'
+
+class TestParseAuthHeader(unittest.TestCase):
+    def test_parse_non_ascii_example(self):
+        auth_params = _parse_auth_header(
+            oauth_data.non_ascii_example['http_headers'])
+        self.assertEqual({
+            'oauth_consumer_key': 'dpf43f3++p+#2l4k3l03',
+            'oauth_token': 'nnch734d(0)0sl2jdk',
+            'oauth_nonce': 'kllo~9940~pd9333jh',
+            'oauth_timestamp': '1191242096',
+            'oauth_signature_method': 'HMAC-SHA1',
+            'oauth_version': '1.0',
+            'oauth_signature': 'MH9NDodF4I/V6GjYYVChGaKCtnk='
+        }, auth_params)
+
+    def test_parse_unquoted_values(self):
+        auth_params = _parse_auth_header({'Authorization':
+            'OAuth realm=Example,oauth_nonce=abc ,  oauth_token = "a%2Cb",'
+            'oauth_callback=""'})
+        self.assertEqual({'oauth_nonce': 'abc', 'oauth_token': 'a,b',
+            'oauth_callback': ''}, auth_params)
+
+    def test_no_header(self):
+        self.assertEqual({}, _parse_auth_header({'Host': 'example.com'}))
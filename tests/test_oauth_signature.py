@@ -1,12 +1,24 @@
 # coding=utf-8
 
+from hashlib import sha1
 import unittest
+from urllib.parse import quote, urlencode
+
+from unittest.mock import patch
 
 import lti_launch_data
 import oauth_data
 
-from parser import Parser
+from cache import VerifiedResultCache
+from parser import HMACSignatureMethod, Parser, PreparedVerifier, \
+    SignatureMethod, SignatureVerificationError, _match_signature, \
+    _percent_encode, _percent_encode_key, _signature_methods, \
+    get_signature_method, oauth_validator, register_signature_method, \
+    signature_methods
+from instrumentation import Outcome
 from oauth_store import OAuthStore
+from replay import ReplayGuard
+from signer import Signer
 
 def _get_parser(data):
     oauth_store = OAuthStore()
@@ -41,3 +53,293 @@ class TestOAuthSignature(unittest.TestCase):
         self.assertTrue(parser.verify_signature(), 
             "OAuth signature verification should've been successful but failed.")
 
+
+    def test_signature_verification_after_secret_change(self):
+        data = lti_launch_data.webwork_blti_launch
+        parser = _get_parser(data)
+        self.assertTrue(parser.verify_signature())
+        # the cached HMAC state for the old secret must not be reused
+        parser.oauth_store.set_secret('lti_secret', 'changed')
+        self.assertFalse(parser.verify_signature())
+        parser.oauth_store.set_secret('lti_secret', 'secret')
+        self.assertTrue(parser.verify_signature())
+
+    def test_signature_verification_during_secret_rotation(self):
+        data = lti_launch_data.webwork_blti_launch
+        parser = _get_parser(data)
+        parser.oauth_store.rotate_secret('lti_secret', 'new secret')
+        # the launch was signed with the old secret, which is the 2nd candidate
+        self.assertTrue(parser.verify_signature())
+        self.assertEqual(1, parser.matched_secret_index)
+        parser.oauth_store.retire_old_secrets('lti_secret')
+        self.assertFalse(parser.verify_signature())
+        self.assertEqual(None, parser.matched_secret_index)
+        parser.oauth_store.rotate_secret('lti_secret', 'secret')
+        self.assertTrue(parser.verify_signature())
+        self.assertEqual(0, parser.matched_secret_index)
+
+    def test_rejection_reasons(self):
+        data = lti_launch_data.webwork_blti_launch
+        parser = _get_parser(data)
+        self.assertTrue(parser.verify_signature())
+        self.assertEqual(None, parser.rejection_reason)
+        # signature is well formed but wrong
+        parser.post_params = dict(data['post_params'],
+            oauth_signature='cbxlc8O7Gzqo2rYBu+LvUyPp19d=')
+        self.assertFalse(parser.verify_signature())
+        self.assertEqual(Outcome.SIGNATURE_MISMATCH, parser.rejection_reason)
+        # cheap checks should reject before the HMAC is calculated
+        with patch('parser._match_signature') as mock_match:
+            parser.post_params = dict(data['post_params'],
+                oauth_signature='not base64')
+            self.assertFalse(parser.verify_signature())
+            self.assertEqual(Outcome.MALFORMED_SIGNATURE,
+                parser.rejection_reason)
+            parser.post_params = dict(data['post_params'],
+                oauth_consumer_key='unknown')
+            self.assertFalse(parser.verify_signature())
+            self.assertEqual(Outcome.UNKNOWN_CONSUMER_KEY,
+                parser.rejection_reason)
+            self.assertFalse(mock_match.called)
+
+    def test_rejection_reasons_when_raising(self):
+        data = lti_launch_data.webwork_blti_launch
+        missing_nonce = dict(data['post_params'])
+        del missing_nonce['oauth_nonce']
+        plaintext = dict(data['post_params'],
+            oauth_signature_method='PLAINTEXT')
+        parser = _get_parser(data)
+        for post_params, outcome in [
+                (missing_nonce, Outcome.MISSING_OAUTH_FIELDS),
+                (plaintext, Outcome.UNSUPPORTED_METHOD)]:
+            parser.post_params = data['post_params']
+            self.assertTrue(parser.verify_signature())
+            self.assertEqual(0, parser.matched_secret_index)
+            # the last call's result mustn't be left behind
+            parser.post_params = post_params
+            self.assertRaises(SignatureVerificationError,
+                parser.verify_signature)
+            self.assertEqual(outcome, parser.rejection_reason)
+            self.assertEqual(None, parser.matched_secret_index)
+            raw_parser = Parser.from_raw(data['method'], data['url'],
+                data['http_headers'], '', urlencode(post_params),
+                parser.oauth_store)
+            self.assertRaises(SignatureVerificationError,
+                raw_parser.verify_signature)
+            self.assertEqual(outcome, raw_parser.rejection_reason)
+
+    def test_unknown_consumer_keys_cached(self):
+        data = dict(lti_launch_data.webwork_blti_launch, secrets={})
+        parser = _get_parser(data)
+        with patch.object(parser.oauth_store, 'has_key',
+                wraps=parser.oauth_store.has_key) as mock_has_key:
+            self.assertFalse(parser.verify_signature())
+            self.assertFalse(parser.verify_signature())
+            self.assertEqual(1, mock_has_key.call_count)
+            # adding the key must not be hidden by the cache
+            parser.oauth_store.set_secret('lti_secret', 'secret')
+            self.assertTrue(parser.verify_signature())
+
+class CountingMethod(HMACSignatureMethod):
+    def __init__(self, name, digestmod):
+        HMACSignatureMethod.__init__(self, name, digestmod)
+        self.prepared = 0
+
+    def prepare(self, signing_key):
+        self.prepared += 1
+        return HMACSignatureMethod.prepare(self, signing_key)
+
+class PlaintextMethod(SignatureMethod):
+    name = 'PLAINTEXT'
+
+    def prepare(self, signing_key):
+        return signing_key
+
+    def sign(self, prepared_key, basestr):
+        return prepared_key
+
+def _unregister_plaintext():
+    del _signature_methods['PLAINTEXT']
+    signature_methods.remove('PLAINTEXT')
+    oauth_validator.schema_changed()
+
+class TestSignatureMethods(unittest.TestCase):
+    def _sign(self, signature_method):
+        url = 'http://tool.example.com/launch'
+        post_params = {'resource_link_id': '1'}
+        post_params.update(Signer('key', 'secret',
+            signature_method=signature_method).sign('POST', url, post_params))
+        return Parser('POST', url, {}, {}, post_params, self.oauth_store)
+
+    def setUp(self):
+        self.oauth_store = OAuthStore()
+        self.oauth_store.set_secret('key', 'secret')
+
+    def test_hmac_sha256(self):
+        parser = self._sign('HMAC-SHA256')
+        self.assertEqual(44, len(parser.post_params['oauth_signature']))
+        self.assertTrue(parser.verify_signature())
+        # a SHA1 sized signature can't be a SHA256 one
+        parser.post_params['oauth_signature'] = 'cbxlc8O7Gzqo2rYBu+LvUyPp19d='
+        self.assertFalse(parser.verify_signature())
+        self.assertEqual(Outcome.MALFORMED_SIGNATURE, parser.rejection_reason)
+        # a signature made with one method doesn't verify with another
+        parser.post_params = dict(self._sign('HMAC-SHA256').post_params,
+            oauth_signature_method='HMAC-SHA1')
+        self.assertFalse(parser.verify_signature())
+
+    def test_prepared_keys_cached(self):
+        original = get_signature_method('HMAC-SHA1')
+        method = CountingMethod('HMAC-SHA1', sha1)
+        register_signature_method(method)
+        self.addCleanup(register_signature_method, original)
+        parsers = [self._sign('HMAC-SHA1') for i in range(3)]
+        sha256_parser = self._sign('HMAC-SHA256')
+        method.prepared = 0 # the signer prepares its own key
+        for parser in parsers:
+            self.assertTrue(parser.verify_signature())
+        self.assertEqual(1, method.prepared)
+        # other methods have their own prepared keys
+        self.assertTrue(sha256_parser.verify_signature())
+        self.assertEqual(1, method.prepared)
+
+    def test_register_signature_method(self):
+        parser = self._sign('HMAC-SHA1')
+        parser.post_params.update(oauth_signature_method='PLAINTEXT',
+            oauth_signature='secret&')
+        # unregistered methods aren't accepted
+        self.assertRaises(SignatureVerificationError, parser.verify_signature)
+        register_signature_method(PlaintextMethod())
+        self.addCleanup(_unregister_plaintext)
+        self.assertTrue(parser.verify_signature())
+        parser.post_params['oauth_signature'] = 'wrong&'
+        self.assertFalse(parser.verify_signature())
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.data = lti_launch_data.webwork_blti_launch
+        self.oauth_store = OAuthStore()
+        self.oauth_store.set_secret('lti_secret', 'secret')
+        self.result_cache = VerifiedResultCache()
+
+    def _get_parser(self, post_params=None, replay_guard=None):
+        data = self.data
+        return Parser(data['method'], data['url'], data['http_headers'],
+            data['get_params'], dict(post_params or data['post_params']),
+            self.oauth_store, replay_guard, self.result_cache)
+
+    def _count_checks(self):
+        patcher = patch('parser._match_signature', wraps=_match_signature)
+        self.addCleanup(patcher.stop)
+        return patcher.start()
+
+    def test_resubmission(self):
+        mock_match = self._count_checks()
+        for i in range(3):
+            self.assertTrue(self._get_parser().verify_signature())
+        self.assertEqual(1, mock_match.call_count)
+        # same key, nonce and signature but a changed param must be checked
+        parser = self._get_parser(dict(self.data['post_params'],
+            roles='Administrator'))
+        self.assertFalse(parser.verify_signature())
+        self.assertEqual(Outcome.SIGNATURE_MISMATCH, parser.rejection_reason)
+        self.assertEqual(2, mock_match.call_count)
+        # a cached mismatch stays one
+        parser = self._get_parser(dict(self.data['post_params'],
+            roles='Administrator'))
+        self.assertFalse(parser.verify_signature())
+        self.assertEqual(2, mock_match.call_count)
+
+    def test_changed_params_after_caching(self):
+        parser = self._get_parser()
+        self.assertTrue(parser.verify_signature())
+        # the cached request must not change along with the parser's params
+        parser.post_params['roles'] = 'Administrator'
+        self.assertFalse(parser.verify_signature())
+
+    def test_secret_change(self):
+        self.assertTrue(self._get_parser().verify_signature())
+        self.oauth_store.set_secret('lti_secret', 'changed')
+        self.assertFalse(self._get_parser().verify_signature())
+        self.oauth_store.set_secret('lti_secret', 'secret')
+        self.assertTrue(self._get_parser().verify_signature())
+
+    def test_replay_protection(self):
+        mock_match = self._count_checks()
+        replay_guard = ReplayGuard()
+        timestamp = int(self.data['post_params']['oauth_timestamp'])
+        with patch('replay.time') as mock_time:
+            mock_time.time.return_value = timestamp + 10
+            self.assertTrue(self._get_parser(
+                replay_guard=replay_guard).verify_signature())
+            parser = self._get_parser(replay_guard=replay_guard)
+            self.assertFalse(parser.verify_signature())
+            self.assertEqual(Outcome.REPLAYED, parser.rejection_reason)
+            # a cached check is still only reused within the time window
+            mock_time.time.return_value = timestamp + 1000
+            self.assertFalse(parser.verify_signature())
+            self.assertEqual(Outcome.STALE_TIMESTAMP, parser.rejection_reason)
+        self.assertEqual(1, mock_match.call_count)
+
+    def test_raw_parser(self):
+        mock_match = self._count_checks()
+        data = self.data
+        body = urlencode(data['post_params']).encode('utf-8')
+        for raw_body in [body, body, body.replace(b'Instructor', b'Learner')]:
+            parser = Parser.from_raw(data['method'], data['url'],
+                data['http_headers'], b'', raw_body, self.oauth_store,
+                result_cache=self.result_cache)
+            self.assertEqual(raw_body == body, parser.verify_signature())
+        self.assertEqual(2, mock_match.call_count)
+
+class TestPreparedVerifier(unittest.TestCase):
+    def test_signature_verification_using_examples(self):
+        for data in [oauth_data.basic_example, oauth_data.rfc_example,
+                oauth_data.non_ascii_example,
+                lti_launch_data.webwork_blti_launch]:
+            oauth_store = OAuthStore()
+            for key, secret in data['secrets'].items():
+                oauth_store.set_secret(key, secret)
+            verifier = PreparedVerifier(data['method'], data['url'],
+                oauth_store)
+            # should be reusable for multiple requests
+            for i in range(2):
+                self.assertTrue(verifier.verify_signature(
+                    data['http_headers'], data['get_params'],
+                    data['post_params']),
+                    "OAuth signature verification should've been successful "
+                    "but failed.")
+
+    def test_check_signature(self):
+        data = lti_launch_data.webwork_blti_launch
+        oauth_store = OAuthStore()
+        oauth_store.rotate_secret('lti_secret', 'secret')
+        oauth_store.rotate_secret('lti_secret', 'new secret')
+        verifier = PreparedVerifier(data['method'], data['url'], oauth_store)
+        self.assertEqual((Outcome.VALID, 1), verifier.check_signature(
+            data['http_headers'], data['get_params'], data['post_params']))
+        post_params = dict(data['post_params'], oauth_consumer_key='unknown')
+        self.assertEqual((Outcome.UNKNOWN_CONSUMER_KEY, None),
+            verifier.check_signature(data['http_headers'],
+                data['get_params'], post_params))
+
+class TestPercentEncode(unittest.TestCase):
+    def test_same_as_quote(self):
+        # should give the same results as the urllib.parse.quote based
+        # encoding
+        values = [chr(i) for i in range(256)]
+        values.append(''.join(chr(i) for i in range(256)))
+        values.append(bytes(range(256)))
+        for data in [oauth_data.basic_example, oauth_data.rfc_example,
+                oauth_data.non_ascii_example,
+                lti_launch_data.webwork_blti_launch]:
+            for params in [data['get_params'], data['post_params'],
+                    data['secrets']]:
+                for key, val in params.items():
+                    values += [key, val]
+            values.append(data['url'])
+        for val in values:
+            expected = quote(val, '~').encode('ascii')
+            self.assertEqual(expected, _percent_encode(val))
+            self.assertEqual(expected, _percent_encode_key(val))
+        self.assertEqual(b'1191242096', _percent_encode(1191242096))
@@ -1,6 +1,39 @@
 import unittest
 
 from oauth_store import OAuthStore
+from parser import Parser
+from signer import Signer
+
+class ListStore(OAuthStore):
+    '''
+    A store that doesn't keep its secrets in the secrets dict.
+    '''
+    def __init__(self):
+        self.pairs = []
+
+    def set_secret(self, key, secret):
+        self.pairs.insert(0, (key, secret))
+        self.secret_changed(key)
+
+    def get_secret(self, key):
+        return dict(reversed(self.pairs)).get(key, "")
+
+    def has_key(self, key):
+        return any(k == key for k, secret in self.pairs)
+
+class DictStore(OAuthStore):
+    '''
+    A store backed by a dict it doesn't own, that doesn't know about the
+    derived cache.
+    '''
+    def __init__(self, secrets):
+        self.backing = secrets
+
+    def get_secret(self, key):
+        return self.backing.get(key, "")
+
+    def has_key(self, key):
+        return key in self.backing
 
 class TestOAuthStore(unittest.TestCase):
     '''
@@ -19,3 +52,68 @@ class TestOAuthStore(unittest.TestCase):
         self.assertEqual(expected_secret, store.get_secret(expected_key))
         # unrecognized keys should return empty string for secret
         self.assertEqual("", store.get_secret("INVALID KEY"))
+
+    def test_set_secret_clears_derived_cache(self):
+        '''
+        Changing a secret should drop values derived from the old secrets
+        '''
+        store = OAuthStore()
+        store.set_secret("key", "old secret")
+        cache = store.get_derived_cache()
+        cache.set(("derived", "key"), "old value")
+        self.assertTrue(store.get_derived_cache() is cache)
+        store.set_secret("key", "new secret")
+        self.assertFalse(("derived", "key") in cache)
+
+    def test_rotate_secret(self):
+        '''
+        Old secrets should be candidates until they're retired
+        '''
+        store = OAuthStore()
+        self.assertEqual([""], store.get_secrets("key"))
+        store.set_secret("key", "secret1")
+        self.assertEqual(["secret1"], store.get_secrets("key"))
+        store.rotate_secret("key", "secret2")
+        store.rotate_secret("key", "secret3")
+        self.assertEqual("secret3", store.get_secret("key"))
+        self.assertEqual(["secret3", "secret2", "secret1"],
+            store.get_secrets("key"))
+        store.retire_old_secrets("key")
+        self.assertEqual(["secret3"], store.get_secrets("key"))
+
+    def test_rotate_secret_other_store(self):
+        store = ListStore()
+        store.rotate_secret("key", "secret1")
+        self.assertEqual(["secret1"], store.get_secrets("key"))
+        store.rotate_secret("key", "secret2")
+        self.assertEqual(["secret2", "secret1"], store.get_secrets("key"))
+        store.retire_old_secrets("key")
+        self.assertEqual(["secret2"], store.get_secrets("key"))
+
+    def test_no_derived_cache_by_default(self):
+        '''
+        Stores that don't call secret_changed mustn't keep accepting a removed
+        secret
+        '''
+        url = 'http://tool.example.com/launch'
+        post_params = Signer("key", "secret").sign('POST', url, {})
+        store = DictStore({"key": "secret"})
+        self.assertEqual(None, store.get_derived_cache())
+        parser = Parser('POST', url, {}, {}, post_params, store)
+        self.assertTrue(parser.verify_signature())
+        del store.backing["key"]
+        self.assertFalse(parser.verify_signature())
+
+    def test_no_unknown_key_cache_by_default(self):
+        '''
+        Stores that don't call secret_changed mustn't keep rejecting a key
+        that's added after it was tried
+        '''
+        url = 'http://tool.example.com/launch'
+        post_params = Signer("key", "secret").sign('POST', url, {})
+        store = DictStore({})
+        self.assertEqual(None, store.get_unknown_key_cache())
+        parser = Parser('POST', url, {}, {}, post_params, store)
+        self.assertFalse(parser.verify_signature())
+        store.backing["key"] = "secret"
+        self.assertTrue(parser.verify_signature())
@@ -0,0 +1,64 @@
+# coding=utf-8
+
+import copy
+import unittest
+from urllib.parse import unquote_to_bytes, urlencode
+
+import lti_launch_data
+import oauth_data
+
+from oauth_store import OAuthStore
+from parser import Parser, _normalize_encoded, _percent_encode
+
+def _get_store(data):
+    oauth_store = OAuthStore()
+    for key, secret in data['secrets'].items():
+        oauth_store.set_secret(key, secret)
+    return oauth_store
+
+class TestRawParser(unittest.TestCase):
+    def test_signature_verification_using_rfc5849_example(self):
+        data = oauth_data.rfc_example
+        parser = Parser.from_raw(data['method'], 'http://example.com/request',
+            data['http_headers'], 'b5=%3D%253D&a3=a&c%40=&a2=r%20b',
+            'c2&a3=2+q', _get_store(data))
+        self.assertTrue(parser.verify_signature(),
+           "OAuth signature verification should've been successful but failed.")
+        self.assertEqual(data['get_params'], parser.get_params)
+        self.assertEqual({'c2': '', 'a3': '2 q'}, parser.post_params)
+
+    def test_signature_verification_using_non_ascii_example(self):
+        data = oauth_data.non_ascii_example
+        parser = Parser.from_raw(data['method'], data['url'],
+            data['http_headers'], urlencode(data['get_params']), '',
+            _get_store(data))
+        self.assertTrue(parser.verify_signature(),
+           "OAuth signature verification should've been successful but failed.")
+
+    def test_signature_verification_using_webwork_launch_data(self):
+        data = lti_launch_data.webwork_blti_launch
+        body = urlencode(data['post_params'])
+        # lower case escapes should still give the right base string
+        body = body.replace('%3A', '%3a')
+        parser = Parser.from_raw(data['method'], data['url'],
+            data['http_headers'], '', body, _get_store(data))
+        self.assertTrue(parser.verify_signature(),
+           "OAuth signature verification should've been successful but failed.")
+        self.assertEqual(data['post_params'], parser.post_params)
+        # wrong signature
+        post_params = copy.copy(data['post_params'])
+        post_params['oauth_signature'] = 'bad'
+        parser = Parser.from_raw(data['method'], data['url'],
+            data['http_headers'], '', urlencode(post_params),
+            _get_store(data))
+        self.assertFalse(parser.verify_signature())
+
+    def test_normalize_encoded(self):
+        # should be the same as decoding and then encoding again
+        values = [b'', b'abc', b'a+b', b'%7e%7E~', b'%2f%2F/', b'100%', b'%zz',
+            b'\xd7\x90', b"!*'()", b'%C3%B8+%c3%b8']
+        values.append(bytes(range(256)))
+        for val in values:
+            self.assertEqual(
+                _percent_encode(unquote_to_bytes(val.replace(b'+', b' '))),
+                _normalize_encoded(val))
@@ -0,0 +1,80 @@
+# coding=utf-8
+
+import unittest
+
+from unittest.mock import patch
+
+import lti_launch_data
+
+from oauth_store import OAuthStore
+from parser import Parser
+from replay import MemoryNonceStore, ReplayGuard
+
+class TestMemoryNonceStore(unittest.TestCase):
+    def test_add_seen(self):
+        store = MemoryNonceStore()
+        with patch('replay.time') as mock_time:
+            mock_time.time.return_value = 1000
+            self.assertFalse(store.seen('key', 1000, 'nonce'))
+            self.assertTrue(store.add('key', 1000, 'nonce'))
+            self.assertTrue(store.seen('key', 1000, 'nonce'))
+            self.assertFalse(store.add('key', 1000, 'nonce'))
+            # nonces are only unique per consumer key and timestamp
+            self.assertTrue(store.add('other key', 1000, 'nonce'))
+            self.assertTrue(store.add('key', 1001, 'nonce'))
+
+    def test_expired_buckets_dropped(self):
+        store = MemoryNonceStore(window=300, bucket_size=10)
+        with patch('replay.time') as mock_time:
+            mock_time.time.return_value = 1000
+            store.add('key', 1000, 'nonce1')
+            store.add('key', 1015, 'nonce2')
+            self.assertEqual(2, len(store))
+            mock_time.time.return_value = 1310
+            store.add('key', 1310, 'nonce3')
+            self.assertEqual(2, len(store))
+            self.assertFalse(store.seen('key', 1000, 'nonce1'))
+            self.assertTrue(store.seen('key', 1015, 'nonce2'))
+
+    def test_max_size(self):
+        store = MemoryNonceStore(max_size=2, bucket_size=10)
+        with patch('replay.time') as mock_time:
+            mock_time.time.return_value = 1000
+            store.add('key', 1000, 'nonce1')
+            store.add('key', 1010, 'nonce2')
+            store.add('key', 1020, 'nonce3')
+            self.assertEqual(2, len(store))
+            # the dropped bucket's timestamps can't be accepted anymore
+            self.assertTrue(store.seen('key', 1005, 'unused nonce'))
+            self.assertFalse(store.seen('key', 1015, 'unused nonce'))
+
+class TestReplayGuard(unittest.TestCase):
+    def setUp(self):
+        self.data = lti_launch_data.webwork_blti_launch
+        self.timestamp = int(self.data['post_params']['oauth_timestamp'])
+        self.oauth_store = OAuthStore()
+        for key, secret in self.data['secrets'].items():
+            self.oauth_store.set_secret(key, secret)
+
+    def _get_parser(self, replay_guard):
+        data = self.data
+        return Parser(data['method'], data["url"], data["http_headers"],
+            data["get_params"], data["post_params"], self.oauth_store,
+            replay_guard)
+
+    def test_replayed_launch_rejected(self):
+        parser = self._get_parser(ReplayGuard())
+        with patch('replay.time') as mock_time:
+            mock_time.time.return_value = self.timestamp + 10
+            self.assertTrue(parser.verify_signature())
+            self.assertFalse(parser.verify_signature())
+
+    def test_stale_launch_rejected_before_hmac(self):
+        parser = self._get_parser(ReplayGuard(window=300))
+        with patch('replay.time') as mock_time:
+            with patch('parser._match_signature') as mock_check:
+                mock_time.time.return_value = self.timestamp + 301
+                self.assertFalse(parser.verify_signature())
+                mock_time.time.return_value = self.timestamp - 301
+                self.assertFalse(parser.verify_signature())
+                self.assertFalse(mock_check.called)
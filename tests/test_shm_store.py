@@ -0,0 +1,150 @@
+import multiprocessing
+import unittest
+
+from unittest.mock import patch
+
+from oauth_store import OAuthStore
+from shm_store import SharedMemoryNonceStore, SharedMemoryOAuthStore
+
+# the stores have to be inherited by forked processes, so the functions run
+# in them find the store here
+_store = None
+
+def _get_secret(key):
+    return _store.get_secret(key)
+
+def _add_nonce(nonce):
+    return _store.add('key', 1000, nonce)
+
+def _run(func, args, processes=4):
+    pool = multiprocessing.get_context('fork').Pool(processes)
+    try:
+        return pool.map(func, args)
+    finally:
+        pool.close()
+        pool.join()
+
+class CountingStore(OAuthStore):
+    def __init__(self):
+        OAuthStore.__init__(self)
+        self.lookups = 0
+
+    def has_key(self, key):
+        self.lookups += 1
+        return OAuthStore.has_key(self, key)
+
+class TestSharedMemoryOAuthStore(unittest.TestCase):
+    def setUp(self):
+        self.backing = CountingStore()
+        self.backing.set_secret('key', 'secret')
+        self.store = SharedMemoryOAuthStore(self.backing)
+
+    def test_get_secret(self):
+        store = self.store
+        self.assertTrue(store.has_key('key'))
+        self.assertEqual('secret', store.get_secret('key'))
+        self.assertFalse(store.has_key('INVALID KEY'))
+        self.assertEqual('', store.get_secret('INVALID KEY'))
+        # known and unknown keys should only have been looked up once
+        self.assertTrue(store.has_key('key'))
+        self.assertFalse(store.has_key('INVALID KEY'))
+        self.assertEqual(2, self.backing.lookups)
+
+    def test_set_and_rotate_secret(self):
+        store = self.store
+        store.get_secret('key')
+        store.set_secret('key', 'new secret')
+        self.assertEqual('new secret', self.backing.get_secret('key'))
+        self.assertEqual('new secret', store.get_secret('key'))
+        store.rotate_secret('key', 'newer secret')
+        self.assertEqual(['newer secret', 'new secret'],
+            store.get_secrets('key'))
+        store.retire_old_secrets('key')
+        self.assertEqual(['newer secret'], store.get_secrets('key'))
+
+    def test_shared_between_processes(self):
+        global _store
+        _store = self.store
+        self.assertEqual(['secret'] * 4, _run(_get_secret, ['key'] * 4))
+        # the workers cached the secret, so a change made straight to the
+        # backing store isn't seen until the cache entry expires
+        self.backing.secrets['key'] = 'changed'
+        self.assertEqual('secret', self.store.get_secret('key'))
+        self.assertEqual(0, self.backing.lookups)
+
+    def test_cache_ttl(self):
+        store = SharedMemoryOAuthStore(self.backing, cache_ttl=60)
+        with patch('shm_store.time') as mock_time:
+            mock_time.time.return_value = 1000
+            store.get_secret('key')
+            self.backing.secrets['key'] = 'changed'
+            mock_time.time.return_value = 1059
+            self.assertEqual('secret', store.get_secret('key'))
+            mock_time.time.return_value = 1061
+            self.assertEqual('changed', store.get_secret('key'))
+
+    def test_clock_eviction(self):
+        # a single bucket of 2 slots
+        store = SharedMemoryOAuthStore(self.backing, capacity=2, ways=2)
+        for key in ['a', 'b', 'c']:
+            self.backing.set_secret(key, key + ' secret')
+        store.get_secret('a')
+        store.get_secret('b')
+        # a was used again, so it gets a second chance and b is evicted
+        store.get_secret('a')
+        self.backing.lookups = 0
+        store.get_secret('c')
+        store.get_secret('a')
+        self.assertEqual(1, self.backing.lookups)
+        store.get_secret('b')
+        self.assertEqual(2, self.backing.lookups)
+
+    def test_large_secrets_not_cached(self):
+        self.backing.set_secret('key', 'x' * 300)
+        store = SharedMemoryOAuthStore(self.backing, max_secrets_size=256)
+        self.assertEqual('x' * 300, store.get_secret('key'))
+        self.assertEqual('x' * 300, store.get_secret('key'))
+        self.assertEqual(2, self.backing.lookups)
+
+class TestSharedMemoryNonceStore(unittest.TestCase):
+    def test_add_seen(self):
+        store = SharedMemoryNonceStore()
+        with patch('shm_store.time') as mock_time:
+            mock_time.time.return_value = 1000
+            self.assertFalse(store.seen('key', 1000, 'nonce'))
+            self.assertTrue(store.add('key', 1000, 'nonce'))
+            self.assertTrue(store.seen('key', 1000, 'nonce'))
+            self.assertFalse(store.add('key', 1000, 'nonce'))
+            # nonces are only unique per consumer key and timestamp
+            self.assertTrue(store.add('other key', 1000, 'nonce'))
+            self.assertTrue(store.add('key', 1001, 'nonce'))
+
+    def test_shared_between_processes(self):
+        global _store
+        _store = SharedMemoryNonceStore()
+        with patch('shm_store.time') as mock_time:
+            mock_time.time.return_value = 1000
+            # only one process gets to use each nonce
+            results = _run(_add_nonce, ['nonce1'] * 8 + ['nonce2'] * 8)
+            self.assertEqual(2, sum(results))
+            self.assertTrue(_store.seen('key', 1000, 'nonce1'))
+
+    def test_full_bucket(self):
+        store = SharedMemoryNonceStore(window=300, capacity=2, ways=2)
+        with patch('shm_store.time') as mock_time:
+            mock_time.time.return_value = 1000
+            self.assertTrue(store.add('key', 990, 'nonce1'))
+            self.assertTrue(store.add('key', 995, 'nonce2'))
+            # the oldest nonce is evicted, but its timestamp is then treated
+            # as already seen
+            self.assertTrue(store.add('key', 1000, 'nonce3'))
+            self.assertTrue(store.seen('key', 990, 'nonce1'))
+            self.assertTrue(store.seen('key', 990, 'other nonce'))
+            self.assertFalse(store.seen('key', 1000, 'other nonce'))
+            # expired nonces make room without raising the floor
+            mock_time.time.return_value = 1296
+            self.assertTrue(store.add('key', 1296, 'nonce4'))
+            self.assertFalse(store.seen('key', 996, 'other nonce'))
+
+if __name__ == '__main__':
+    unittest.main()
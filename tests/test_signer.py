@@ -0,0 +1,77 @@
+from hashlib import sha256
+from io import BytesIO
+import unittest
+
+import oauth_data
+
+from oauth_store import OAuthStore
+from parser import Parser, UnsupportedError
+from signer import Signer, make_body_hash, verify_body_hash
+
+class TestSigner(unittest.TestCase):
+    def test_rfc5849_example(self):
+        data = oauth_data.rfc_example
+        signer = Signer('9djdj82h48djs9d2', 'j49sk3j29djd', 'kkk9d7dh3k39sjv7',
+            'dh893hdasih9')
+        oauth_params = signer.sign(data['method'], data['url'],
+            data['post_params'], nonce='7d8f3e4a', timestamp=137131201)
+        self.assertEqual('OB33pYjWAnf+xtOHN4Gmbdil168=',
+            oauth_params['oauth_signature'])
+
+    def test_verified_by_parser(self):
+        oauth_store = OAuthStore()
+        oauth_store.set_secret('key', 'secret')
+        signer = Signer('key', 'secret')
+        url = 'http://lms.example.com/outcomes?a=1&a=2'
+        post_params = {'b': 'ø', 'c': 'x y'}
+        http_headers = {'Authorization': signer.get_authorization_header(
+            'POST', url, post_params, realm='Example')}
+        # a repeated query param can only be given to Parser once
+        parser = Parser('POST', url, http_headers, {'a': '1'}, post_params,
+            oauth_store)
+        self.assertFalse(parser.verify_signature())
+        url = 'http://lms.example.com/outcomes?a=1'
+        http_headers = {'Authorization': signer.get_authorization_header(
+            'POST', url, post_params, realm='Example')}
+        parser = Parser('POST', url, http_headers, {'a': '1'}, post_params,
+            oauth_store)
+        self.assertTrue(parser.verify_signature())
+
+    def test_body_hash(self):
+        oauth_store = OAuthStore()
+        oauth_store.set_secret('key', 'secret')
+        body = b'<?xml version="1.0"?><imsx_POXEnvelopeRequest/>' * 1000
+        body_hash = make_body_hash(body)
+        self.assertEqual(body_hash, make_body_hash(BytesIO(body), 7))
+        self.assertEqual(body_hash,
+            make_body_hash(iter([body[:10], body[10:]])))
+        url = 'http://lms.example.com/outcomes'
+        http_headers = {'Authorization': Signer('key', 'secret')
+            .get_authorization_header('POST', url, body_hash=body_hash)}
+        parser = Parser('POST', url, http_headers, {}, {}, oauth_store)
+        self.assertTrue(parser.verify_signature())
+        self.assertTrue(parser.verify_body_hash(BytesIO(body)))
+        self.assertFalse(parser.verify_body_hash(body + b' '))
+        self.assertFalse(verify_body_hash(None, body))
+
+    def test_hmac_sha256_body_hash(self):
+        oauth_store = OAuthStore()
+        oauth_store.set_secret('key', 'secret')
+        body = b'<?xml version="1.0"?><imsx_POXEnvelopeRequest/>'
+        body_hash = make_body_hash(body, digestmod=sha256)
+        url = 'http://lms.example.com/outcomes'
+        http_headers = {'Authorization': Signer('key', 'secret',
+            signature_method='HMAC-SHA256').get_authorization_header('POST',
+            url, body_hash=body_hash)}
+        parser = Parser('POST', url, http_headers, {}, {}, oauth_store)
+        self.assertTrue(parser.verify_signature())
+        # the body hash has to use the signature method's hash
+        self.assertTrue(parser.verify_body_hash(body))
+        self.assertNotEqual(body_hash, make_body_hash(body))
+
+    def test_unknown_signature_method(self):
+        self.assertRaises(UnsupportedError, Signer, 'key', 'secret',
+            signature_method='RSA-SHA1')
+
+if __name__ == '__main__':
+    unittest.main()
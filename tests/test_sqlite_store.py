@@ -0,0 +1,113 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+from parser import Parser
+from shm_store import SharedMemoryOAuthStore
+from signer import Signer
+from sqlite_store import SQLiteOAuthStore
+
+class TestSQLiteOAuthStore(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'secrets.db')
+        self.store = SQLiteOAuthStore(self.path)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_get_set_secret(self):
+        store = self.store
+        store.set_secret("expected key", "expected secret")
+        self.assertTrue(store.has_key("expected key"))
+        self.assertEqual("expected secret", store.get_secret("expected key"))
+        # unrecognized keys should return empty string for secret
+        self.assertFalse(store.has_key("INVALID KEY"))
+        self.assertEqual("", store.get_secret("INVALID KEY"))
+
+    def test_persistent(self):
+        self.store.set_secret("key", "secret")
+        store = SQLiteOAuthStore(self.path)
+        self.assertEqual("secret", store.get_secret("key"))
+        store.close()
+
+    def test_set_secrets(self):
+        self.store.set_secrets(("key%d" % i, "secret%d" % i)
+            for i in range(100))
+        for i in range(100):
+            self.assertEqual("secret%d" % i,
+                self.store.get_secret("key%d" % i))
+
+    def test_cached_unknown_key_replaced_by_set(self):
+        # the negative cache entry must not hide a newly added key
+        self.assertEqual("", self.store.get_secret("key"))
+        self.store.set_secret("key", "secret")
+        self.assertEqual("secret", self.store.get_secret("key"))
+        self.store.set_secret("key", "new secret")
+        self.assertEqual("new secret", self.store.get_secret("key"))
+
+    def test_changed_by_other_process(self):
+        url = 'http://tool.example.com/launch'
+        def verify(secret):
+            post_params = Signer('key', secret).sign('POST', url, {})
+            return Parser('POST', url, {}, {}, post_params,
+                store).verify_signature()
+        self.store.set_secret('key', 'secret')
+        with patch('cache.time') as mock_time:
+            mock_time.time.return_value = 100
+            store = SQLiteOAuthStore(self.path, cache_ttl=10)
+            self.assertTrue(verify('secret'))
+            other = SQLiteOAuthStore(self.path)
+            other.set_secret('key', 'new secret')
+            other.close()
+            mock_time.time.return_value = 111
+            # neither the lookup nor the prepared secret is still cached
+            self.assertFalse(verify('secret'))
+            self.assertTrue(verify('new secret'))
+            store.close()
+
+    def test_rotate_secret(self):
+        url = 'http://tool.example.com/launch'
+        def verify(store, secret):
+            post_params = Signer('key', secret).sign('POST', url, {})
+            return Parser('POST', url, {}, {}, post_params,
+                store).verify_signature()
+        store = self.store
+        self.assertEqual([""], store.get_secrets("key"))
+        store.set_secret("key", "secret1")
+        store.rotate_secret("key", "secret2")
+        store.rotate_secret("key", "secret3")
+        self.assertEqual("secret3", store.get_secret("key"))
+        self.assertEqual(["secret3", "secret2", "secret1"],
+            store.get_secrets("key"))
+        self.assertTrue(verify(store, "secret2"))
+        # the old secrets are seen by other processes using the database
+        other = SQLiteOAuthStore(self.path)
+        self.assertEqual(["secret3", "secret2", "secret1"],
+            other.get_secrets("key"))
+        shared = SharedMemoryOAuthStore(other)
+        shared.rotate_secret("key", "secret4")
+        self.assertTrue(verify(shared, "secret1"))
+        shared.retire_old_secrets("key")
+        self.assertEqual(["secret4"], shared.get_secrets("key"))
+        self.assertFalse(verify(shared, "secret3"))
+        other.close()
+
+    def test_threads(self):
+        self.store.set_secrets(("key%d" % i, "secret%d" % i)
+            for i in range(20))
+        errors = []
+        def lookup():
+            for i in range(20):
+                if self.store.get_secret("key%d" % i) != "secret%d" % i:
+                    errors.append(i)
+        threads = [threading.Thread(target=lookup) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([], errors)
@@ -1,9 +1,10 @@
 # coding=utf-8
 
-from mock import patch
+from unittest.mock import patch
 import unittest
 
-from validator import Validator, UnsupportedDataTypeError
+from validator import INVALID_TYPE, INVALID_VALUE, MISSING_FIELD, \
+    UnsupportedDataTypeError, Validator
 
 class TestValidator(unittest.TestCase):
     def test_get_fields(self):
@@ -64,7 +65,7 @@ class TestValidtorValidate(unittest.TestCase):
         validator = Validator(schema)
         with patch('validator.logging') as mock_logging:
             validator.validate(data)
-            mock_logging.warn.assert_called_with(
+            mock_logging.warning.assert_called_with(
                 "Recommended LTI field 'recommended_field' is missing.")
 
     def test_validate_type_conversion(self):
@@ -177,3 +178,71 @@ class TestValidtorValidate(unittest.TestCase):
         self.assertFalse(validator.validate(data_wrong_value))
 
 
+
+    def test_validate_compiles_schema_once(self):
+        # the schema should only be compiled on the first validate call and
+        # the compiled form reused afterwards
+        schema = {'field': {'required': True, 'values': ['abc', 'def']}}
+        validator = Validator(schema)
+        with patch.object(validator, '_compile',
+                wraps=validator._compile) as mock_compile:
+            self.assertTrue(validator.validate({'field': 'abc'}))
+            self.assertFalse(validator.validate({'field': 'hij'}))
+            self.assertTrue(validator.validate({'field': 'def'}))
+            self.assertEqual(1, mock_compile.call_count)
+
+class TestValidatorBatch(unittest.TestCase):
+    schema = {
+        'field1': {'required': True},
+        'field2': {'type': int, 'values': [1, 2]},
+        'field3': {'recommended': True}
+    }
+    records = [
+        {'field1': 'a', 'field2': '1', 'field3': 'c'},
+        {'field2': 'x'},
+        {'field1': 'a', 'field2': '3'},
+        {'field1': 'a', 'field2': 2, 'field3': 'c'}
+    ]
+
+    def _check_results(self, results):
+        self.assertEqual([True, False, False, True],
+            [result.valid for result in results])
+        self.assertEqual([], results[0].errors)
+        self.assertEqual([('field1', MISSING_FIELD), ('field2', INVALID_TYPE)],
+            sorted(results[1].errors))
+        self.assertEqual([('field2', INVALID_VALUE)], results[2].errors)
+        self.assertEqual(['field3'], results[2].missing_recommended)
+
+    def test_validate_batch(self):
+        validator = Validator(self.schema)
+        results = validator.validate_batch(self.records)
+        self._check_results(results)
+        # records aren't modified and no copies are made unless asked for
+        self.assertEqual('1', self.records[0]['field2'])
+        self.assertEqual(None, results[0].data)
+
+    def test_validate_batch_coerce(self):
+        validator = Validator(self.schema)
+        results = validator.validate_batch(self.records, coerce=True)
+        self.assertEqual({'field1': 'a', 'field2': 1, 'field3': 'c'},
+            results[0].data)
+        self.assertEqual('1', self.records[0]['field2'])
+
+    def test_validate_batch_all_valid(self):
+        # the fast path where a whole column is already valid
+        validator = Validator(self.schema)
+        records = [{'field1': 'a', 'field2': 1}, {'field1': 'b', 'field2': 2}]
+        results = validator.validate_batch(records)
+        self.assertTrue(all(results))
+
+    def test_validate_iter(self):
+        validator = Validator(self.schema)
+        results = list(validator.validate_iter(iter(self.records),
+            chunk_size=3))
+        self._check_results(results)
+
+    def test_matches_validate(self):
+        validator = Validator(self.schema)
+        for record, result in zip(self.records,
+                validator.validate_iter(self.records)):
+            self.assertEqual(validator.validate(dict(record)), result.valid)
@@ -0,0 +1,139 @@
+import copy
+from io import BytesIO
+import unittest
+from urllib.parse import urlencode, urlparse
+from wsgiref.util import setup_testing_defaults
+
+import lti_launch_data
+
+from admission import TokenBucketLimiter
+from oauth_store import OAuthStore
+from signer import Signer
+from wsgi import LTIMiddleware, _get_url
+
+def _get_environ(data, body=None):
+    url = urlparse(data['url'])
+    if body is None:
+        body = urlencode(data['post_params']).encode('ascii')
+    environ = {
+        'REQUEST_METHOD': data['method'],
+        'wsgi.url_scheme': url.scheme,
+        'HTTP_HOST': url.netloc,
+        'PATH_INFO': url.path,
+        'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': BytesIO(body)
+    }
+    setup_testing_defaults(environ)
+    return environ
+
+class TestLTIMiddleware(unittest.TestCase):
+    def setUp(self):
+        self.data = lti_launch_data.webwork_blti_launch
+        oauth_store = OAuthStore()
+        for key, secret in self.data['secrets'].items():
+            oauth_store.set_secret(key, secret)
+        self.environs = []
+        self.middleware = LTIMiddleware(self._app, oauth_store,
+            ['/webwork2/'], max_body_size=4096)
+
+    def _app(self, environ, start_response):
+        self.environs.append(environ)
+        start_response('200 OK', [])
+        return [environ['wsgi.input'].read()]
+
+    def _call(self, environ):
+        self.status = None
+        def start_response(status, headers):
+            self.status = status
+        return b''.join(self.middleware(environ, start_response))
+
+    def test_valid_launch(self):
+        environ = _get_environ(self.data)
+        body = environ['wsgi.input'].getvalue()
+        self.assertEqual(body, self._call(environ))
+        self.assertEqual('200 OK', self.status)
+        launch = self.environs[0]['lti.launch']
+        self.assertEqual(self.data['post_params']['resource_link_id'],
+            launch.resource_link_id)
+
+    def test_bad_signature(self):
+        post_params = copy.copy(self.data['post_params'])
+        post_params['oauth_signature'] = 'cbxlc8O7Gzqo2rYBu+LvUyPp19d='
+        data = dict(self.data, post_params=post_params)
+        self._call(_get_environ(data))
+        self.assertEqual('401 Unauthorized', self.status)
+        self.assertEqual([], self.environs)
+
+    def test_missing_oauth_params(self):
+        self._call(_get_environ(self.data, b'a=b'))
+        self.assertEqual('401 Unauthorized', self.status)
+        self.assertEqual([], self.environs)
+
+    def test_throttled(self):
+        self.middleware.limiter = TokenBucketLimiter(rate=0, burst=1)
+        self._call(_get_environ(self.data))
+        self.assertEqual('200 OK', self.status)
+        self._call(_get_environ(self.data))
+        self.assertEqual('429 Too Many Requests', self.status)
+        self.assertEqual(1, len(self.environs))
+
+    def test_body_too_large(self):
+        environ = _get_environ(self.data, b'a' * 4097)
+        self._call(environ)
+        self.assertEqual('413 Request Entity Too Large', self.status)
+        # the body shouldn't have been read at all
+        self.assertEqual(0, environ['wsgi.input'].tell())
+
+    def test_other_paths_untouched(self):
+        environ = _get_environ(self.data, b'a=b')
+        environ['PATH_INFO'] = '/other'
+        self.assertEqual(b'a=b', self._call(environ))
+        self.assertFalse('lti.launch' in self.environs[0])
+
+    def test_path_with_colon(self):
+        url = 'http://tool.example.com/launch/math:101'
+        params = dict((name, value) for name, value in
+            self.data['post_params'].items() if not name.startswith('oauth_'))
+        post_params = dict(params)
+        post_params.update(Signer('lti_secret', 'secret').sign('POST', url,
+            params))
+        self.middleware.paths = frozenset(['/launch/math:101'])
+        self._call(_get_environ(dict(self.data, url=url,
+            post_params=post_params)))
+        self.assertEqual('200 OK', self.status)
+        self.assertTrue('lti.launch' in self.environs[0])
+
+    def test_body_not_form_encoded(self):
+        url = 'http://tool.example.com/launch'
+        params = dict((name, value) for name, value in
+            self.data['post_params'].items() if not name.startswith('oauth_'))
+        query = dict(params)
+        query.update(Signer('lti_secret', 'secret').sign('POST',
+            url + '?' + urlencode(params)))
+        body = b'{"score": 1}'
+        environ = _get_environ(dict(self.data, url=url), body)
+        environ['QUERY_STRING'] = urlencode(query)
+        environ['CONTENT_TYPE'] = 'application/json'
+        self.middleware.paths = frozenset(['/launch'])
+        # the application still gets the body
+        self.assertEqual(body, self._call(environ))
+        self.assertEqual('200 OK', self.status)
+        self.assertTrue('lti.launch' in self.environs[0])
+
+    def test_get_url(self):
+        environ = {'wsgi.url_scheme': 'https', 'HTTP_HOST': 'Example.com:443',
+            'SCRIPT_NAME': '/app', 'PATH_INFO': '/lti launch'}
+        self.assertEqual('https://Example.com/app/lti%20launch',
+            _get_url(environ))
+        environ['HTTP_HOST'] = 'example.com:8443'
+        self.assertEqual('https://example.com:8443/app/lti%20launch',
+            _get_url(environ))
+        self.assertEqual('https://proxy.example.com/app/lti%20launch',
+            _get_url(environ, 'https://proxy.example.com/'))
+        environ['PATH_INFO'] = "/launch/math:101/@me,~x;a=b+c!$&'()*"
+        self.assertEqual("https://example.com:8443/app/launch/math:101/@me,~x;"
+            "a=b+c!$&'()*", _get_url(environ))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,6 +3,7 @@ Generalized module for data validation. Provide a schema and it'll check if data
 matches the schema.
 """
 
+from itertools import islice
 import logging
 
 logger = logging.getLogger(__name__)
@@ -12,6 +13,50 @@ class ValidatorError(Exception):
 class UnsupportedDataTypeError(ValidatorError):
     pass
 
+# reasons a field fails validation, see ValidationResult
+MISSING_FIELD = 'missing_field'
+INVALID_TYPE = 'invalid_type'
+INVALID_VALUE = 'invalid_value'
+
+# placeholder for fields absent from a record
+_MISSING = object()
+
+class ValidationResult(object):
+    '''
+    The result of validating one record with validate_iter or validate_batch.
+
+    errors - list of (field, reason) for every field that failed, reason is
+        MISSING_FIELD, INVALID_TYPE or INVALID_VALUE
+    missing_recommended - list of the recommended fields that are missing
+    data - copy of the record with the field values converted to their types,
+        only if coerce was asked for, None otherwise
+    '''
+    __slots__ = ('errors', 'missing_recommended', 'data')
+
+    def __init__(self, data=None):
+        self.errors = []
+        self.missing_recommended = []
+        self.data = data
+
+    @property
+    def valid(self):
+        return not self.errors
+
+    def __bool__(self):
+        return not self.errors
+
+def _get_converter(field, field_type):
+    '''
+    Returns the function used to convert a field's value to field_type.
+    '''
+    if field_type in (str, int, float, bool):
+        return field_type
+    def unsupported(value):
+        msg = "Unknown data type for field '"+field+"'"
+        logging.error(msg)
+        raise UnsupportedDataTypeError(msg)
+    return unsupported
+
 class Validator:
     '''
     Given a schema and some data. Will check that the data agrees with the schema
@@ -35,52 +80,168 @@ class Validator:
         Sets the schema for this validator.
         '''
         self.schema = schema
+        # compiled form of the schema, built on the first call to validate
+        self._compiled = None
 
-    def validate(self, data):
+    def _compile(self):
         '''
-        Returns true if data matches against schema. False otherwise.
+        Turn the schema's rule dicts into a list of ready-made field checks so
+        that validate doesn't have to re-interpret the rules on every call.
         '''
+        compiled = []
         for field, rules in self.schema.items():
-            # ensure fields that are required exists
-            required = rules.get('required', False)
-            if required:
-                if not field in data:
-                    logging.debug("Missing required field: " + field)
-                    return False
-            # try to convert field to type desired, fail validation if we can't
             field_type = rules.get('type', str)
-            if field in data and not isinstance(data[field], field_type):
-                value = data[field]
-                try:
-                    if field_type == str:
-                        value = str(value)
-                    elif field_type == int:
-                        value = int(value)
-                    elif field_type == float:
-                        value = float(value)
-                    elif field_type == bool:
-                        value = bool(value)
-                    else:
-                        msg = "Unknown data type for field '"+field+"'"
-                        logging.error(msg)
-                        raise UnsupportedDataTypeError(msg)
-                except ValueError:
-                    logging.debug("Can't convert data type in field: " + field)
-                    return False
-                data[field] = value
-            # log warnings if a recommended field is missing
-            recommended = rules.get('recommended', False)
-            if recommended:
-                if not field in data:
-                    logging.warn("Recommended LTI field '"+field+"' is missing.")
-            # ensure fields are restricted to specified values, if specified
             values = rules.get('values', [])
             if values:
-                if field in data and not data.get(field) in values:
+                try:
+                    values = frozenset(values)
+                except TypeError: # unhashable values, fall back to a scan
+                    values = tuple(values)
+            compiled.append((
+                field,
+                rules.get('required', False),
+                field_type,
+                _get_converter(field, field_type),
+                rules.get('recommended', False),
+                values
+            ))
+        self._compiled = compiled
+        return compiled
+
+    def schema_changed(self):
+        '''
+        Must be called after the schema is changed in place, so that the
+        compiled form is rebuilt.
+        '''
+        self._compiled = None
+
+    def validate(self, data):
+        '''
+        Returns true if data matches against schema. False otherwise.
+        '''
+        compiled = self._compiled
+        if compiled is None:
+            compiled = self._compile()
+        for field, required, field_type, convert, recommended, values in \
+                compiled:
+            if field in data:
+                # try to convert field to type desired, fail validation if we
+                # can't
+                value = data[field]
+                if not isinstance(value, field_type):
+                    try:
+                        value = convert(value)
+                    except ValueError:
+                        logging.debug("Can't convert data type in field: " +
+                            field)
+                        return False
+                    data[field] = value
+                # ensure fields are restricted to specified values
+                if values and not value in values:
                     logging.debug("Invalid value in field: "+field)
                     return False
+            elif required:
+                # ensure fields that are required exists
+                logging.debug("Missing required field: " + field)
+                return False
+            elif recommended:
+                # log warnings if a recommended field is missing
+                logging.warning("Recommended LTI field '"+field+"' is missing.")
         return True
 
+    def validate_iter(self, records, coerce=False, chunk_size=1000):
+        '''
+        Validate every record from the iterable records, yields a
+        ValidationResult for each, in order. Unlike validate, all of a record's
+        errors are collected and the records are never modified. With coerce,
+        each result's data is a copy of the record with converted values.
+
+        Records are read and checked chunk_size at a time with
+        validate_batch, so records can come from a generator over data that
+        doesn't fit in memory. Nothing is logged.
+        '''
+        records = iter(records)
+        while True:
+            chunk = list(islice(records, chunk_size))
+            if not chunk:
+                return
+            for result in self.validate_batch(chunk, coerce):
+                yield result
+
+    def validate_batch(self, records, coerce=False):
+        '''
+        Validate a list of records, returns a list of ValidationResult in the
+        same order, see validate_iter.
+
+        The records are checked a field at a time instead of a record at a
+        time, so that a field whose values across the whole batch all have the
+        right type and are all accepted values is passed with a couple of set
+        operations instead of checking each record.
+        '''
+        compiled = self._compiled
+        if compiled is None:
+            compiled = self._compile()
+        if coerce:
+            results = [ValidationResult(dict(record)) for record in records]
+        else:
+            results = [ValidationResult() for record in records]
+        for field, required, field_type, convert, recommended, values in \
+                compiled:
+            column = [record.get(field, _MISSING) for record in records]
+            types = set(map(type, column))
+            has_missing = type(_MISSING) in types
+            if has_missing:
+                types.discard(type(_MISSING))
+                if required or recommended:
+                    for i, value in enumerate(column):
+                        if value is not _MISSING:
+                            continue
+                        if required:
+                            results[i].errors.append((field, MISSING_FIELD))
+                        else:
+                            results[i].missing_recommended.append(field)
+            # type conversion, skipped if every value already has the type
+            if types and types != set([field_type]):
+                converted = None
+                if not has_missing:
+                    # convert the whole column at once, only falling back
+                    # to one value at a time if a value can't be converted
+                    try:
+                        converted = list(map(convert, column))
+                    except (ValueError, TypeError):
+                        pass
+                if converted is not None:
+                    column = converted
+                    if coerce:
+                        for result, value in zip(results, column):
+                            result.data[field] = value
+                else:
+                    for i, value in enumerate(column):
+                        if value is _MISSING or isinstance(value, field_type):
+                            continue
+                        try:
+                            value = convert(value)
+                        except (ValueError, TypeError):
+                            results[i].errors.append((field, INVALID_TYPE))
+                            column[i] = _MISSING
+                            continue
+                        column[i] = value
+                        if coerce:
+                            results[i].data[field] = value
+            # accepted values, skipped if every value is accepted
+            if values:
+                try:
+                    distinct = set(column)
+                    distinct.discard(_MISSING)
+                    all_accepted = distinct.issubset(values)
+                except TypeError: # unhashable, check each value
+                    all_accepted = False
+                if not all_accepted:
+                    for i, value in enumerate(column):
+                        if value is not _MISSING and not value in values:
+                            results[i].errors.append((field, INVALID_VALUE))
+        return results
+
     def get_fields(self):
         '''
         Return a list of the fields that the schema is configured for.
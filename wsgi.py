@@ -0,0 +1,159 @@
+"""
+WSGI middleware that verifies LTI launches before they reach the application.
+
+    app = LTIMiddleware(app, oauth_store, ['/lti/launch'])
+
+Requests to the launch paths have their OAuth signature verified. Failures
+get a 401 response and never reach the application, verified launches are
+passed on with the launch in environ['lti.launch'].
+"""
+from io import BytesIO
+import logging
+from urllib.parse import quote
+
+from instrumentation import Outcome
+from launch import InvalidLaunchError
+from parser import LTIParserError, Parser
+
+logger = logging.getLogger(__name__)
+
+# default limit on the size of a launch's body, launches are usually a few KB
+MAX_BODY_SIZE = 1024 * 1024
+
+_DEFAULT_PORTS = {'http': '80', 'https': '443'}
+
+def _get_url(environ, base_url=None):
+    '''
+    Returns the url of the request as used in the signature base string,
+    without the query string and with the port only if it isn't the default.
+    base_url replaces the scheme and host of the request, for servers
+    behind a proxy.
+    '''
+    # WSGI gives the path as bytes decoded as latin-1. Characters that are
+    # allowed in a path are left as they are, as the consumer would have
+    # signed them.
+    path = environ.get('SCRIPT_NAME', '') + environ.get('PATH_INFO', '')
+    path = quote(path.encode('latin-1'), safe="/:@!$&'()*+,;=~")
+    if base_url is not None:
+        return base_url.rstrip('/') + path
+    scheme = environ['wsgi.url_scheme']
+    host = environ.get('HTTP_HOST')
+    if host is None:
+        host = environ['SERVER_NAME'] + ':' + environ['SERVER_PORT']
+    name, sep, port = host.rpartition(':')
+    if sep and ']' not in port and port == _DEFAULT_PORTS.get(scheme):
+        host = name
+    return scheme + '://' + host + path
+
+def _is_form_encoded(environ):
+    '''
+    Returns True if the request body is form encoded, the only kind of body
+    that's read.
+    '''
+    return environ.get('CONTENT_TYPE', '').startswith(
+        'application/x-www-form-urlencoded')
+
+def _read_body(environ, max_body_size):
+    '''
+    Returns the request body, or None if it's larger than max_body_size.
+    Only form encoded bodies are read, others are left unread and returned
+    as b'', see _is_form_encoded.
+    '''
+    if not _is_form_encoded(environ):
+        return b''
+    try:
+        length = int(environ.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        length = 0
+    if length > max_body_size:
+        return None
+    stream = environ['wsgi.input']
+    chunks = []
+    while length > 0:
+        chunk = stream.read(length)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        length -= len(chunk)
+    return b''.join(chunks)
+
+def _respond(start_response, status, body, headers=()):
+    start_response(status, [('Content-Type', 'text/plain'),
+        ('Content-Length', str(len(body)))] + list(headers))
+    return [body]
+
+class LTIMiddleware:
+    '''
+    Verifies the LTI launches sent to any of paths before passing them on to
+    app. Requests to other paths are passed on untouched.
+
+    Launches that are verified but don't match launch.lti_launch_schema get a
+    400 response. One middleware handles every request, so the oauth_store, its caches of
+    derived keys and the replay_guard are shared by all of them.
+
+    oauth_store - the OAuthStore to verify signatures with
+    paths - the PATH_INFO of each launch endpoint
+    replay_guard - optional replay.ReplayGuard
+    max_body_size - launches with a larger body get a 413 response without
+        the body being read
+    base_url - scheme and host that launches are sent to, e.g.
+        https://tool.example.com, if it differs from what the server sees
+    result_cache - optional cache.VerifiedResultCache, so that launches
+        resubmitted by a browser refresh aren't checked all over again
+    limiter - optional admission.TokenBucketLimiter, launches over their
+        consumer key's limit get a 429 response
+    '''
+    def __init__(self, app, oauth_store, paths, replay_guard=None,
+            max_body_size=MAX_BODY_SIZE, base_url=None, result_cache=None,
+            limiter=None):
+        self.app = app
+        self.oauth_store = oauth_store
+        self.paths = frozenset(paths)
+        self.replay_guard = replay_guard
+        self.max_body_size = max_body_size
+        self.base_url = base_url
+        self.result_cache = result_cache
+        self.limiter = limiter
+
+    def __call__(self, environ, start_response):
+        if environ.get('PATH_INFO', '') not in self.paths:
+            return self.app(environ, start_response)
+        body = _read_body(environ, self.max_body_size)
+        if body is None:
+            return _respond(start_response, '413 Request Entity Too Large',
+                b"LTI launch is too large.")
+        http_headers = {}
+        if 'HTTP_AUTHORIZATION' in environ:
+            http_headers['Authorization'] = environ['HTTP_AUTHORIZATION']
+        parser = Parser.from_raw(environ['REQUEST_METHOD'],
+            _get_url(environ, self.base_url), http_headers,
+            environ.get('QUERY_STRING', ''), body, self.oauth_store,
+            self.replay_guard, self.result_cache, self.limiter)
+        try:
+            valid = parser.verify_signature()
+        except LTIParserError as e:
+            logger.debug("LTI launch rejected: %s", e)
+            valid = False
+        if not valid:
+            if parser.rejection_reason is not None:
+                logger.debug("LTI launch rejected: %s",
+                    parser.rejection_reason)
+            if parser.rejection_reason == Outcome.THROTTLED:
+                return _respond(start_response, '429 Too Many Requests',
+                    b"Too many LTI launches, try again later.")
+            return _respond(start_response, '401 Unauthorized',
+                b"LTI launch verification failed.",
+                [('WWW-Authenticate', 'OAuth')])
+        try:
+            launch = parser.get_launch_request()
+        except InvalidLaunchError as e:
+            logger.debug("LTI launch rejected: %s", e)
+            return _respond(start_response, '400 Bad Request',
+                b"Invalid LTI launch.")
+        if _is_form_encoded(environ):
+            # the body was used up, so the application gets a copy
+            environ['wsgi.input'] = BytesIO(body)
+            environ['CONTENT_LENGTH'] = str(len(body))
+        environ['lti.launch'] = launch
+        environ['lti.parser'] = parser
+        return self.app(environ, start_response)